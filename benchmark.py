@@ -0,0 +1,338 @@
+"""
+性能基准测试工具
+在临时目录中构造测试数据，对比优化前后的耗时
+"""
+import os
+import re
+import csv
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import uuid
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.upload_logger import UploadLogger
+import utils.metadata_manager as metadata_manager_module
+from utils.metadata_manager import MetadataManager
+from utils.metadata_store import FIELDNAMES
+from utils.monitor_snapshot import MonitorSnapshot
+from utils.title_index import TitleIndex, _normalize, normalize_title, canonicalize_title, title_keys
+from utils.logger import log_info, print_header
+
+
+def _time_calls(func, args_list):
+    """依次调用 func，返回平均耗时（微秒）"""
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / max(1, len(args_list)) * 1e6
+
+
+def bench_ledger(count=500):
+    """对比 UploadLogger 每次新建连接（旧版）与线程长连接 + WAL 的单次调用延迟"""
+    print_header(f"UploadLogger 单次调用延迟（{count} 个文件）")
+    work_dir = tempfile.mkdtemp(prefix="bench_ledger_")
+    try:
+        files = []
+        for i in range(count):
+            path = os.path.join(work_dir, f"doc_{i:05d}.md")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"# 文档 {i}\n" + "内容" * 200)
+            files.append(path)
+
+        results = {}
+        for label, pooled in (("每次新建连接", False), ("长连接 + WAL", True)):
+            db_path = os.path.join(work_dir, f"ledger_{int(pooled)}.db")
+            logger = UploadLogger(db_path, pooled=pooled)
+            log_us = _time_calls(logger.log_upload, [(p, f"doc-{i}") for i, p in enumerate(files)])
+            hit_us = _time_calls(logger.is_uploaded, [(p,) for p in files])
+            logger.close()
+            results[label] = (log_us, hit_us)
+            log_info(f"{label}: log_upload {log_us:.0f} µs/次，is_uploaded {hit_us:.0f} µs/次")
+
+        (old_log, old_hit), (new_log, new_hit) = results.values()
+        log_info(f"加速比: log_upload {old_log / new_log:.1f}x，is_uploaded {old_hit / new_hit:.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _legacy_canonicalize(title):
+    """优化前的后缀清理：每次调用编译正则并循环替换"""
+    if not title:
+        return ''
+    pattern = re.compile(r'(?:_ocr(?:_chunk\d+)?|_chunk\d+|_pdfchunk\d+|_sub\d+|_part\d+|_split\d+)+$', re.IGNORECASE)
+    canonical = title
+    while True:
+        new_value = pattern.sub('', canonical)
+        if new_value == canonical:
+            break
+        canonical = new_value
+    return canonical.strip('_- ')
+
+
+def _legacy_keys(titles):
+    """优化前加载时逐条计算：规范化、标准化，登记查找键时再规范化一次"""
+    keys = []
+    for title in titles:
+        canonical = _legacy_canonicalize(title)
+        normalized = _normalize(canonical) if canonical else ''
+        keys.append((_legacy_canonicalize(canonical), normalized))
+    return keys
+
+
+@contextmanager
+def _legacy_title_keys():
+    """加载元数据时换回逐条计算的规范化/标准化（其余加载流程不变），用于对比加载耗时"""
+    saved = metadata_manager_module.canonicalize_titles, metadata_manager_module.title_keys
+    metadata_manager_module.canonicalize_titles = lambda titles: [_legacy_canonicalize(t) for t in titles]
+    metadata_manager_module.title_keys = _legacy_keys
+    try:
+        yield
+    finally:
+        metadata_manager_module.canonicalize_titles, metadata_manager_module.title_keys = saved
+
+
+def bench_titles(count=100000):
+    """对比标题标准化逐条计算与批量计算、LRU 缓存冷热命中，以及大表加载耗时"""
+    print_header(f"标题标准化（{count} 个标题）")
+    suffixes = ('', '_ocr', '_ocr_chunk1', '_chunk002', '_pdfchunk3', '')
+    titles = [
+        f"《国土空间生态修复规划（{i % 97}）》第{i}号文件{suffixes[i % len(suffixes)]}"
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    _legacy_keys(titles)
+    legacy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    title_keys(titles)
+    bulk_s = time.perf_counter() - start
+    log_info(f"逐条计算（旧版）: {legacy_s * 1000:.0f} ms，批量预编译: {bulk_s * 1000:.0f} ms，"
+             f"加速比 {legacy_s / bulk_s:.1f}x")
+
+    # 监控/入库反复查询同一批热点标题
+    hot = titles[:min(count, 5000)]
+    normalize_title.cache_clear()
+    canonicalize_title.cache_clear()
+    cold_us = _time_calls(lambda t: (canonicalize_title(t), normalize_title(t)), [(t,) for t in hot])
+    warm_us = _time_calls(lambda t: (canonicalize_title(t), normalize_title(t)), [(t,) for t in hot])
+    log_info(f"单次标准化: 未命中缓存 {cold_us:.2f} µs/次，命中缓存 {warm_us:.2f} µs/次")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_titles_")
+    try:
+        csv_path = os.path.join(work_dir, 'source_table.csv')
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            for i, title in enumerate(titles):
+                writer.writerow({'id': f"{i:06d}", 'title': title, 'source': '自然资源部'})
+
+        # 加载时会把带后缀的标题改写回 CSV，每次都从原始文件的副本加载
+        load_times = {}
+        for label, legacy in (("逐条计算（旧版）", True), ("批量计算", False)):
+            load_path = os.path.join(work_dir, f"load_{int(legacy)}.csv")
+            shutil.copyfile(csv_path, load_path)
+            start = time.perf_counter()
+            if legacy:
+                with _legacy_title_keys():
+                    loaded = MetadataManager(load_path, auto_create=False)
+            else:
+                loaded = MetadataManager(load_path, auto_create=False)
+            load_times[label] = time.perf_counter() - start
+            log_info(f"MetadataManager 加载（{label}）: {load_times[label]:.2f} s（{loaded.count()} 条记录）")
+            loaded.close()
+        old_s, new_s = load_times.values()
+        log_info(f"加载加速比 {old_s / new_s:.2f}x（差值即标准化的节省，其余为建索引与读写 CSV）")
+
+        mgr = MetadataManager(csv_path, auto_create=False)
+
+        queries = [(f"/data/{t}.md",) for t in hot]
+        normalize_title.cache_clear()
+        canonicalize_title.cache_clear()
+        cold_us = _time_calls(mgr.get_metadata, queries)
+        warm_us = _time_calls(mgr.get_metadata, queries)
+        log_info(f"get_metadata: 首次 {cold_us:.1f} µs/次，重复 {warm_us:.1f} µs/次")
+        mgr.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _rss_mb():
+    """当前进程常驻内存（MB）；无 /proc 时退化为峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _load_legacy_maps(csv_path):
+    """优化前的内存结构：DictReader 行字典，每个查找键（含标题本身）对应一个标题元组"""
+    metadata_map, lookup, ids = {}, {}, set()
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            metadata_map[row['title'].strip()] = row
+            ids.add(row['id'])
+    titles = list(metadata_map)
+    index = TitleIndex(titles)
+    for title, (canonical, normalized) in zip(titles, title_keys(titles)):
+        for key in dict.fromkeys((title, canonical, normalized)):
+            if key:
+                lookup[key] = lookup.get(key, ()) + (title,)
+    return metadata_map, lookup, ids, index
+
+
+def _write_catalogue(csv_path, count):
+    """生成模拟的全国目录：标题各不相同，来源/地区/类型等字段取值集中"""
+    sources = [f"{name}自然资源厅" for name in ('河北', '山西', '江苏', '浙江', '广东', '四川', '云南')] + ['自然资源部']
+    regions = ['全国', '华北', '华东', '华南', '西南', '西北', '东北']
+    types = ['政策文件', '技术指南', '行业标准', '规划成果', '评估报告']
+    categories = ['生态修复', '矿山修复', '土地整治', '国土规划', '其他']
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for i in range(count):
+            writer.writerow({
+                'id': f"DOC-{i:07d}",
+                'title': f"{regions[i % 7]}国土空间生态修复规划实施评估（{i // 7}）第{i}号",
+                'source': sources[i % len(sources)],
+                'keywords': f"国土空间,{categories[i % 5]}",
+                'year': str(2000 + i % 26),
+                'region': regions[i % 7],
+                'type': types[i % 5],
+                'category': categories[i % 5],
+                'created_at': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00",
+            })
+
+
+def _memory_worker(csv_path, variant):
+    """子进程中加载元数据，输出常驻内存增量（MB）"""
+    before = _rss_mb()
+    if variant == 'legacy':
+        loaded = _load_legacy_maps(csv_path)
+    else:
+        loaded = MetadataManager(csv_path, auto_create=False)
+    print(f"{_rss_mb() - before:.1f}")
+    del loaded
+
+
+def bench_memory(count=500000):
+    """对比逐行字典（旧版）与紧凑记录加载大元数据表后的常驻内存"""
+    print_header(f"元数据内存占用（{count} 条记录）")
+    work_dir = tempfile.mkdtemp(prefix="bench_memory_")
+    try:
+        csv_path = os.path.join(work_dir, 'source_table.csv')
+        _write_catalogue(csv_path, count)
+        log_info(f"CSV 大小: {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB")
+
+        results = {}
+        # 每种结构在独立子进程中加载，避免前一次释放的内存未归还系统干扰结果
+        for label, variant in (("逐行字典", 'legacy'), ("紧凑记录", 'compact')):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'memory', '--worker', variant, '--csv', csv_path],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results[label] = float(output.strip().splitlines()[-1])
+            log_info(f"{label}: 常驻内存增加 {results[label]:.1f} MB")
+
+        old_mb, new_mb = results.values()
+        log_info(f"节省 {old_mb - new_mb:.1f} MB（{(1 - new_mb / old_mb) * 100:.0f}%）")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_snapshot(count=100000, changes=200):
+    """监控快照：流式暂存、与快照比较、替换快照的耗时与 Python 内存峰值"""
+    print_header(f"监控快照（{count} 个文档，{changes} 处变化）")
+    work_dir = tempfile.mkdtemp(prefix="bench_snapshot_")
+    try:
+        db_path = os.path.join(work_dir, 'upload_log.db')
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+
+        def pages(removed=0):
+            # 模拟逐页获取：删除前 removed 个，末尾新增 removed 个
+            for i, doc_id in enumerate(ids[removed:], removed):
+                yield doc_id, f"国土空间生态修复规划文件{i}", 1700000000 + i
+            for i in range(removed):
+                yield f"new-{i}", f"新增文件{i}", 1800000000
+
+        snapshot = MonitorSnapshot(db_path)
+        snapshot.stage(pages())
+        snapshot.commit()
+        snapshot.close()
+        log_info(f"数据库大小: {os.path.getsize(db_path) / 1024 / 1024:.1f} MB")
+
+        # 模拟重启后的一轮检查
+        snapshot = MonitorSnapshot(db_path)
+        start = time.perf_counter()
+        snapshot.stage(pages(changes // 2))
+        staged = time.perf_counter()
+        events = sum(1 for _ in snapshot.diff())
+        compared = time.perf_counter()
+        snapshot.commit()
+        done = time.perf_counter()
+        log_info(f"流式暂存: {staged - start:.3f} 秒")
+        log_info(f"比较: {compared - staged:.3f} 秒（{events} 处变化）")
+        log_info(f"替换快照: {(done - compared) * 1000:.1f} 毫秒")
+
+        # 再检查一轮，统计 Python 内存峰值（tracemalloc 会拖慢执行，不与上面的计时混在一起）
+        tracemalloc.start()
+        snapshot.stage(pages(changes))
+        sum(1 for _ in snapshot.diff())
+        snapshot.commit()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        log_info(f"Python 内存峰值: {peak / 1024 / 1024:.2f} MB")
+
+        start = time.perf_counter()
+        loaded = snapshot.load()
+        log_info(f"整体加载（对比）: {time.perf_counter() - start:.3f} 秒（{len(loaded)} 条）")
+        snapshot.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ledger = subparsers.add_parser('ledger', help='上传日志数据库读写延迟')
+    ledger.add_argument('--count', type=int, default=500, help='测试文件数')
+
+    titles = subparsers.add_parser('titles', help='标题标准化与元数据加载')
+    titles.add_argument('--count', type=int, default=100000, help='测试标题数')
+
+    memory = subparsers.add_parser('memory', help='大元数据表的内存占用')
+    memory.add_argument('--count', type=int, default=500000, help='测试记录数')
+    memory.add_argument('--worker', choices=('legacy', 'compact'), help=argparse.SUPPRESS)
+    memory.add_argument('--csv', help=argparse.SUPPRESS)
+
+    snapshot = subparsers.add_parser('snapshot', help='监控快照的保存与加载')
+    snapshot.add_argument('--count', type=int, default=100000, help='测试文档数')
+
+    args = parser.parse_args()
+    if args.command == 'ledger':
+        bench_ledger(args.count)
+    elif args.command == 'titles':
+        bench_titles(args.count)
+    elif args.command == 'memory':
+        if args.worker:
+            _memory_worker(args.csv, args.worker)
+        else:
+            bench_memory(args.count)
+    elif args.command == 'snapshot':
+        bench_snapshot(args.count)
+
+
+if __name__ == "__main__":
+    main()
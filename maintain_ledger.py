@@ -0,0 +1,103 @@
+"""
+上传日志库维护工具
+归档过期的上传尝试历史与失败记录，为旧记录补算快速指纹，回收空闲页并更新查询统计，
+保持 upload_log.db 主表精简
+"""
+import sys
+import os
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+try:
+    from utils.config_loader import load_config
+    from utils.upload_logger import UploadLogger
+    from utils.logger import log_info, log_success, log_warning, log_error, print_header
+except ImportError:
+    print("❌ 请先安装依赖: pip install pyyaml")
+    sys.exit(1)
+
+
+def maintain_ledger(config_path="config.yaml", retention_days=None, archive_path=None, full_vacuum=False):
+    """
+    执行日志库维护
+    
+    Args:
+        config_path: 配置文件路径
+        retention_days: 保留天数（默认读取 database.retention_days）
+        archive_path: 归档库路径（默认读取 database.archive_path）
+        full_vacuum: 是否执行完整 VACUUM
+    """
+    print_header("上传日志库维护")
+    
+    # 加载配置
+    try:
+        config = load_config(config_path)
+        log_success("配置文件加载成功")
+    except Exception as e:
+        log_error(f"加载配置失败: {e}")
+        return False
+    
+    db_config = config.get('database', {})
+    db_path = db_config.get('sqlite_path', './upload_log.db')
+    if not os.path.exists(db_path):
+        log_warning(f"数据库不存在: {db_path}")
+        return False
+    
+    if retention_days is None:
+        retention_days = db_config.get('retention_days', 180)
+    archive_path = archive_path or db_config.get('archive_path') or None
+    
+    upload_logger = UploadLogger(db_path, hash_algorithm=db_config.get('hash_algorithm', 'md5'))
+    try:
+        log_info(f"保留最近 {retention_days} 天的尝试历史与失败记录")
+        result = upload_logger.run_maintenance(
+            retention_days=retention_days,
+            archive_path=archive_path,
+            full_vacuum=full_vacuum,
+        )
+        
+        log_success(f"归档尝试历史 {result['attempts']} 条，失败记录 {result['failed']} 条")
+        log_info(f"  归档库: {result['archive_path']}")
+        log_info(f"  清理失效哈希缓存: {result['hash_cache']} 条")
+        log_info(f"  补算旧记录的快速指纹: {result['quick_fp']} 条")
+        log_info(f"  空间回收（{'完整' if result['vacuum'] == 'full' else '增量'}）: "
+                 f"{result['size_before_mb']} MB -> {result['size_after_mb']} MB")
+        
+        stats = upload_logger.get_statistics()
+        print("\n维护后统计：")
+        log_info(f"  成功上传: {stats['total_success']} 个文件")
+        log_info(f"  失败记录: {stats['total_failed']} 个")
+    finally:
+        upload_logger.close()
+    
+    return True
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='上传日志库维护工具')
+    parser.add_argument('--config', default='config.yaml', help='配置文件路径')
+    parser.add_argument('--days', type=int, default=None, help='保留天数（默认读取配置）')
+    parser.add_argument('--archive', default=None, help='归档库路径（默认读取配置）')
+    parser.add_argument('--full-vacuum', action='store_true', help='执行完整 VACUUM（重建表和索引）')
+    
+    args = parser.parse_args()
+    
+    try:
+        success = maintain_ledger(args.config, args.days, args.archive, args.full_vacuum)
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        log_warning("\n操作已取消")
+        sys.exit(1)
+    except Exception as e:
+        log_error(f"维护过程出错: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+测试自适应上传并发（AIMD）
+成功时加性增、429/503 时乘性减，并遵守 Retry-After
+"""
+import os
+import sys
+import time
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from utils.adaptive_limiter import AdaptiveConcurrencyLimiter, parse_retry_after
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_aimd_adjusts_limit():
+    """名额用满时成功才增加，过载减半，超时只降不重试"""
+    limiter = AdaptiveConcurrencyLimiter(8, initial_limit=2, retry_delay=0)
+    # 单线程调用用不满 2 个名额，上限不增加
+    for _ in range(6):
+        assert limiter.call(lambda: FakeResponse(201)).status_code == 201
+    assert limiter.stats()['limit'] == 2
+
+    # 429 后减到 1，重试成功时名额用满，加回 2
+    responses = iter([FakeResponse(429), FakeResponse(201)])
+    assert limiter.call(lambda: next(responses)).status_code == 201
+    stats = limiter.stats()
+    assert stats['overloads'] == 1 and stats['decreases'] == 1
+    assert stats['limit'] == 2
+
+    def timeout():
+        raise requests.ReadTimeout()
+    try:
+        limiter.call(timeout)
+        assert False, "超时应抛出"
+    except requests.ReadTimeout:
+        pass
+    stats = limiter.stats()
+    assert stats['requests'] == 9 and stats['limit'] == 1
+    assert stats['success_rate'] == round(7 / 9 * 100, 1)
+
+
+def test_retry_after_pauses_all_uploads():
+    """Retry-After 期间其他上传也等待，并发上限不超过设定值"""
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert parse_retry_after('soon') is None
+
+    limiter = AdaptiveConcurrencyLimiter(4, initial_limit=2, retry_delay=0)
+    lock = threading.Lock()
+    active = [0, 0]   # 当前在途、峰值
+    first = []
+
+    def upload():
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+            throttled = not first
+            first.append(time.monotonic())
+        try:
+            time.sleep(0.01)
+            return FakeResponse(429, {'Retry-After': '0.2'}) if throttled else FakeResponse(201)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(upload,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert active[1] <= 2
+    assert limiter.stats()['retry_after_pauses'] == 1
+    # 限流之后发出的请求都在暂停结束后
+    assert max(first) - min(first) >= 0.2
+
+
+if __name__ == '__main__':
+    for test in (test_aimd_adjusts_limit, test_retry_after_pauses_all_uploads):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
@@ -0,0 +1,132 @@
+"""
+测试超大 PDF 分段上传的断点续传
+中间分段失败后重新处理：已完成的分段不重新 OCR/上传，源文件只记录一次
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upload_enhanced import EnhancedFileHandler
+from utils.upload_logger import UploadLogger
+
+PAGE_RANGES = [(0, 10), (10, 20), (20, 30)]
+
+
+class FakeHandler(EnhancedFileHandler):
+    """不依赖 PDF 库、OCR 模型与 Dify：分段、识别、上传只记录调用"""
+
+    def __init__(self, config, upload_logger):
+        super().__init__(config, None, upload_logger, dify_client=object())
+        self.paddle_enabled = True
+        self.ocr_calls = []
+        self.upload_calls = []
+        self.failing = set()
+
+    def _plan_pdf_split(self, file_path, target_mb):
+        return None, PAGE_RANGES
+
+    def _write_pdf_chunk(self, reader, base, idx, start, end):
+        out = f"{base}_pdfchunk{idx:03d}.pdf"
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(f"pages {start}-{end}")
+        return out
+
+    def process_via_paddleocr(self, file_path):
+        self.ocr_calls.append(os.path.basename(file_path))
+        out = os.path.join(self.ocr_output_dir, os.path.splitext(os.path.basename(file_path))[0] + '_ocr.md')
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(f"# {os.path.basename(file_path)}")
+        return out
+
+    def upload_to_dify(self, file_path, meta, display_name):
+        index = meta['chunk_index']
+        self.upload_calls.append(index)
+        if index in self.failing:
+            return None, 'http_500'
+        return f"doc-{index}", None
+
+
+def _config(tmp):
+    return {
+        'document': {'watch_folder': tmp, 'output_dir': os.path.join(tmp, 'ocr_output'),
+                     'ocr_extensions': ['.pdf']},
+        'dify': {'dataset_id': 'dataset'},
+        'indexing': {'track_status': False},
+        'performance': {'adaptive_upload': False},
+    }
+
+
+def test_resume_after_failed_chunk():
+    """第 2 段失败后重跑只补传第 2 段，源文件只记录一次"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'))
+        handler = FakeHandler(_config(tmp), logger)
+        source = os.path.join(tmp, '超大文件.pdf')
+        with open(source, 'wb') as f:
+            f.write(b'%PDF-1.4 large')
+
+        handler.failing = {2}
+        handler.process_file(source)
+        assert handler.upload_calls == [1, 2, 3]
+        assert not logger.is_uploaded(source)
+
+        handler.failing = set()
+        handler.ocr_calls, handler.upload_calls = [], []
+        handler.process_file(source)
+        # 第 2 段的 OCR 结果仍有效，直接复用
+        assert handler.ocr_calls == []
+        assert handler.upload_calls == [2]
+        assert logger.is_uploaded(source)
+
+        handler.process_file(source)
+        assert handler.upload_calls == [2]
+
+        parent_hash = logger.get_file_hash(source)
+        with sqlite3.connect(logger.db_path) as conn:
+            rows = conn.execute("SELECT dify_doc_id FROM upload_log WHERE file_hash=?", (parent_hash,)).fetchall()
+            attempts = conn.execute("SELECT COUNT(*) FROM upload_attempts WHERE file_hash=?",
+                                    (parent_hash,)).fetchone()[0]
+        assert rows == [('doc-3',)]
+        assert attempts == 1
+        logger.close()
+
+
+def test_concurrent_last_chunks():
+    """多个线程同时完成最后几个分段，只有一个线程得到完成结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'))
+        ranges = [(i, i + 1) for i in range(8)]
+        for _ in range(20):
+            logger.reset_chunk_plan('parent', '/data/a.pdf', ranges)
+            results = []
+            barrier = threading.Barrier(len(ranges))
+
+            def upload(index):
+                barrier.wait()
+                results.append(logger.mark_chunk_uploaded('parent', index, f"doc-{index}"))
+
+            threads = [threading.Thread(target=upload, args=(i,)) for i in range(1, len(ranges) + 1)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert [r for r in results if r] == ['doc-8'], results
+            # 重复标记不会再次完成
+            assert logger.mark_chunk_uploaded('parent', 8, 'doc-8') is None
+        logger.close()
+
+
+if __name__ == '__main__':
+    for test in (test_resume_after_failed_chunk, test_concurrent_last_chunks):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
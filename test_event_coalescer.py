@@ -0,0 +1,98 @@
+"""
+测试文件事件合并
+同一路径的连续事件在写入稳定后只派发一次，未变化的文件不重复派发，待定路径过多时提前派发
+"""
+import os
+import sys
+import time
+import tempfile
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.event_coalescer import EventCoalescer
+
+QUIET = 5.0
+
+
+def _write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def _settle(coalescer, start):
+    """两轮检查：第一轮记录文件签名，静默期后第二轮派发"""
+    coalescer.poll(now=start)
+    return coalescer.poll(now=start + QUIET)
+
+
+def test_quiet_period_coalescing():
+    """连续事件合并为一次，静默期内不派发"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dispatched = []
+        coalescer = EventCoalescer(dispatched.append, quiet_period=QUIET)
+        path = os.path.join(tmp, 'a.md')
+        _write(path, '写入中')
+        for _ in range(3):
+            coalescer.notify(path)
+        start = time.monotonic()
+        assert coalescer.poll(now=start) == 0
+        assert coalescer.poll(now=start + QUIET / 2) == 0
+        # 静默期内文件又变化，重新计时
+        _write(path, '写入中，继续追加')
+        assert coalescer.poll(now=start + QUIET) == 0
+        assert coalescer.poll(now=start + QUIET * 2) == 1
+        assert dispatched == [path]
+        stats = coalescer.stats()
+        assert stats['received'] == 3 and stats['coalesced'] == 2 and stats['pending'] == 0
+
+
+def test_duplicate_suppression():
+    """文件未变化的重复事件不再派发，内容变化后再次派发"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dispatched = []
+        coalescer = EventCoalescer(dispatched.append, quiet_period=QUIET)
+        path = os.path.join(tmp, 'a.md')
+        _write(path, '内容')
+        coalescer.notify(path)
+        start = time.monotonic()
+        assert _settle(coalescer, start) == 1
+
+        coalescer.notify(path)
+        assert _settle(coalescer, start + QUIET * 2) == 0
+        assert coalescer.stats()['duplicates'] == 1
+
+        _write(path, '修改后的内容')
+        coalescer.notify(path)
+        assert _settle(coalescer, start + QUIET * 4) == 1
+        assert dispatched == [path, path]
+
+
+def test_overflow_dispatches_oldest():
+    """待定路径超过上限时最早的路径立即派发，不会丢失"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dispatched = []
+        coalescer = EventCoalescer(dispatched.append, quiet_period=QUIET, max_pending=2)
+        paths = [os.path.join(tmp, f"{name}.md") for name in 'abc']
+        for path in paths:
+            _write(path, path)
+            coalescer.notify(path)
+        assert dispatched == [paths[0]]
+        assert coalescer.stats()['evicted'] == 1
+
+        assert _settle(coalescer, time.monotonic()) == 2
+        assert sorted(dispatched) == sorted(paths)
+        # 提前派发的文件之后的重复事件按未变化处理
+        coalescer.notify(paths[0])
+        assert _settle(coalescer, time.monotonic() + QUIET * 2) == 0
+
+
+if __name__ == '__main__':
+    for test in (test_quiet_period_coalescing, test_duplicate_suppression, test_overflow_dispatches_oldest):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
@@ -0,0 +1,109 @@
+"""
+测试索引进度跟踪
+批量查询未完成的上传批次，结果写入上传日志；积压过多时上传等待
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.upload_logger import UploadLogger
+from utils.indexing_tracker import IndexingTracker
+from utils.dify_client import DifyAPIError
+
+
+class FakeDify:
+    """模拟 indexing-status 接口：finished 中的批次已完成，'bad' 批次索引失败，'gone' 批次不存在"""
+
+    def __init__(self):
+        self.finished = set()
+        self.requests = 0
+
+    def get_indexing_status(self, batch):
+        self.requests += 1
+        if batch == 'gone':
+            raise DifyAPIError(404, 'not found')
+        now = int(time.time())
+        status = 'error' if batch == 'bad' else ('completed' if batch in self.finished else 'indexing')
+        return [{'id': f"{batch}-{i}", 'indexing_status': status, 'processing_started_at': now - 3,
+                 'completed_at': now + 2, 'error': 'embedding failed' if batch == 'bad' else None}
+                for i in range(2)]
+
+
+def test_poll_records_results():
+    """一轮查询全部批次，结束的文档写入上传日志，重启后继续跟踪未完成的文档"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'))
+        dify = FakeDify()
+        tracker = IndexingTracker(dify, logger)
+        for batch in ('b1', 'b2', 'bad'):
+            for i in range(2):
+                tracker.track(f"{batch}-{i}", batch, f"/data/{batch}_{i}.md")
+        tracker.track('gone-0', 'gone')
+        assert tracker.backlog == 7
+
+        dify.finished.add('b1')
+        assert tracker.poll_once() == 5
+        assert dify.requests == 4
+        assert tracker.backlog == 2
+        stats = logger.get_indexing_statistics()
+        assert stats['by_status'] == {'completed': 2, 'error': 2, 'missing': 1, 'waiting': 2}
+        assert stats['avg_processing'] == 5.0
+        assert stats['avg_latency'] >= 1
+
+        # 重启后从上传日志恢复未完成的文档
+        resumed = IndexingTracker(dify, logger)
+        resumed._resume()
+        assert resumed.backlog == 2
+        dify.finished.add('b2')
+        assert resumed.poll_once() == 2
+        assert logger.get_pending_indexing() == []
+        logger.close()
+
+
+def test_sync_removes_indexing_status():
+    """与 Dify 同步时，已删除文档的索引进度记录一并删除"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'))
+        for doc_id in ('kept', 'deleted'):
+            logger.track_indexing(doc_id, 'b1', f"/data/{doc_id}.md")
+        logger.sync_with_dify(['kept'])
+        assert [row[0] for row in logger.get_pending_indexing()] == ['kept']
+        logger.close()
+
+
+def test_backlog_throttles_uploads():
+    """积压达到上限时等待，降到 80% 以下后继续"""
+    dify = FakeDify()
+    tracker = IndexingTracker(dify, poll_interval=0.05, max_backlog=4)
+    assert tracker.wait_for_capacity() == 0.0
+    tracker.start()
+    try:
+        for batch in ('b1', 'b2'):
+            for i in range(2):
+                tracker.track(f"{batch}-{i}", batch)
+        threading.Timer(0.3, dify.finished.add, args=('b1',)).start()
+        waited = tracker.wait_for_capacity()
+        assert waited >= 0.2
+        assert tracker.backlog == 2
+        assert tracker.stats()['throttle_waits'] == 1
+    finally:
+        tracker.stop()
+        tracker.join(5)
+    assert not tracker.is_alive()
+
+
+if __name__ == '__main__':
+    for test in (test_poll_records_results, test_sync_removes_indexing_status,
+                 test_backlog_throttles_uploads):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
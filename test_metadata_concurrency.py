@@ -0,0 +1,186 @@
+"""
+测试元数据管理器的并发安全性
+多个读线程持续查询，同时多个写线程新增、更新、删除记录
+"""
+import os
+import sys
+import csv
+import random
+import tempfile
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.metadata_manager import MetadataManager
+from utils.metadata_store import FIELDNAMES
+from utils.title_index import TitleIndex
+
+READERS = 4
+WRITERS = 4
+WRITES_PER_THREAD = 80
+
+
+def _stress(mgr):
+    """并发读写，返回各线程抛出的异常"""
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        rng = random.Random()
+        try:
+            while not stop.is_set():
+                titles = mgr.get_all_titles()
+                if titles:
+                    title = rng.choice(titles)
+                    meta = mgr.get_by_title(title)
+                    # 快照中的记录必须完整
+                    if meta is not None:
+                        assert meta['title'] and meta['id'], meta
+                    mgr.get_metadata(f"/data/{title}_ocr.md")
+                    # 标题索引读取不加锁，写者不能原地修改已发布的索引
+                    assert title in mgr.match_titles(title) or mgr.get_by_title(title) is None
+                assert mgr.count() >= 0
+        except Exception as e:
+            errors.append(e)
+
+    def writer(n):
+        rng = random.Random(n)
+        try:
+            for i in range(WRITES_PER_THREAD):
+                title = f"并发文档-{n}-{i}"
+                mgr.add_metadata({'title': title, 'source': f"writer{n}"})
+                if i % 3 == 0:
+                    mgr.update_metadata(title, keywords=f"k{i}")
+                if i % 5 == 0:
+                    victim = f"并发文档-{n}-{rng.randrange(i + 1)}"
+                    mgr.delete_by_titles([victim])
+                # 自动创建：多个线程争抢同一标题时只应创建一条
+                mgr.get_metadata(f"/data/共享文档{i % 10}.pdf")
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    mgr.flush()
+    return errors
+
+
+def _check_csv(mgr, csv_path):
+    """CSV 中不应有残行，内容与内存一致"""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == FIELDNAMES
+    for row in rows[1:]:
+        assert len(row) == len(FIELDNAMES), f"残行: {row}"
+    titles = [row[1] for row in rows[1:]]
+    assert len(titles) == len(set(titles)), "CSV 中存在重复标题"
+    assert set(titles) == set(mgr.get_all_titles())
+    shared = [t for t in titles if t.startswith('共享文档')]
+    assert len(shared) == 10, shared
+
+
+def test_concurrent_csv_manager():
+    """仅 CSV（每次修改重写文件）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        mgr = MetadataManager(csv_path, auto_create=True)
+        errors = _stress(mgr)
+        assert not errors, errors
+        _check_csv(mgr, csv_path)
+        mgr.close()
+
+
+def test_concurrent_store_manager():
+    """SQLite 存储 + 定期导出 CSV"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        store_path = os.path.join(tmp, 'source_table.db')
+        mgr = MetadataManager(csv_path, auto_create=True, store_path=store_path, export_interval=0.05)
+        errors = _stress(mgr)
+        assert not errors, errors
+        _check_csv(mgr, csv_path)
+        expected = set(mgr.get_all_titles())
+        mgr.close()
+
+        # 重新加载后与关闭前一致
+        reloaded = MetadataManager(csv_path, auto_create=True, store_path=store_path)
+        assert set(reloaded.get_all_titles()) == expected
+        reloaded.close()
+
+
+def test_layered_snapshot():
+    """覆盖层多次合并后，查询结果与重新加载一致，批量写入结束前读者看不到新记录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        store_path = os.path.join(tmp, 'source_table.db')
+        mgr = MetadataManager(csv_path, auto_create=True, store_path=store_path, export_interval=60)
+        for i in range(1000):
+            mgr.add_metadata({'title': f"政策文件{i}", 'source': 's'})
+            if i % 4 == 0:
+                mgr.update_metadata(f"政策文件{i}", keywords='k')
+            if i % 7 == 0:
+                mgr.delete_by_title(f"政策文件{i // 2}")
+        with mgr.batch():
+            mgr.add_metadata({'title': '批量文件', 'source': 's'})
+            assert mgr.get_by_title('批量文件') is None
+        assert mgr.get_by_title('批量文件')['source'] == 's'
+
+        titles = mgr.get_all_titles()
+        expected = TitleIndex(titles)
+        for query in ('政策文件1', '政策文件12', '文件99', '批量文件'):
+            assert mgr.match_titles(query) == expected.match(query), query
+        assert mgr.get_by_title('政策文件8')['keywords'] == 'k'
+        mgr.close()
+
+        reloaded = MetadataManager(csv_path, auto_create=True, store_path=store_path)
+        assert reloaded.get_all_titles() == titles
+        assert reloaded.get_metadata('/data/政策文件8_ocr.md')['keywords'] == 'k'
+        reloaded.close()
+
+
+def test_create_in_empty_dir():
+    """CSV 与存储所在目录都不存在时自动创建"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'metadata', 'source_table.csv')
+        store_path = os.path.join(tmp, 'store', 'source_table.db')
+        mgr = MetadataManager(csv_path, auto_create=True, store_path=store_path, export_interval=0)
+        mgr.add_metadata({'title': '新文档', 'source': 's'})
+        mgr.close()
+        assert os.path.exists(store_path)
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            assert [row[1] for row in csv.reader(f)] == ['title', '新文档']
+
+
+def test_append_without_trailing_newline():
+    """CSV 末尾没有换行时追加的记录单独成行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(','.join(FIELDNAMES) + '\r\n' + 'ID-1,已有文档,s,,2024,全国,政策文件,其他,2024-01-01 00:00:00')
+        mgr = MetadataManager(csv_path, auto_create=True)
+        mgr.add_metadata({'title': '新文档', 'source': 's'})
+        mgr.close()
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        assert [row[1] for row in rows[1:]] == ['已有文档', '新文档']
+        assert all(len(row) == len(FIELDNAMES) for row in rows)
+
+
+if __name__ == '__main__':
+    for test in (test_concurrent_csv_manager, test_concurrent_store_manager, test_layered_snapshot,
+                 test_create_in_empty_dir, test_append_without_trailing_newline):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
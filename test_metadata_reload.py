@@ -0,0 +1,136 @@
+"""
+测试元数据 CSV 的热加载
+运行中人工编辑 CSV 后，按 ID 只应用变化的行，本地未写入 CSV 的修改不被覆盖
+"""
+import os
+import sys
+import csv
+import time
+import tempfile
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.metadata_manager import MetadataManager
+from utils.metadata_store import FIELDNAMES
+
+
+def _write_rows(csv_path, rows):
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _read_rows(csv_path):
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def _edit_csv(csv_path, edit):
+    """模拟人工编辑：读出全部行，修改后整体保存"""
+    rows = _read_rows(csv_path)
+    rows = edit(rows)
+    # 保证修改时间变化
+    time.sleep(0.01)
+    _write_rows(csv_path, rows)
+
+
+def _initial_rows():
+    return [
+        {'id': f"M-{i}", 'title': f"国土空间规划文件{i}", 'source': '自然资源部', 'year': '2024'}
+        for i in range(5)
+    ]
+
+
+def test_reload_csv_manager():
+    """仅 CSV：新增、修改、删除、改名"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        _write_rows(csv_path, _initial_rows())
+        mgr = MetadataManager(csv_path, auto_create=False)
+
+        assert mgr.reload_if_changed() is None
+
+        def edit(rows):
+            rows[0]['source'] = '省自然资源厅'
+            rows[1]['title'] = '生态修复指南'
+            del rows[2]
+            rows.append({'id': '', 'title': '新增的文件', 'source': '人工录入'})
+            return rows
+
+        _edit_csv(csv_path, edit)
+        assert mgr.reload_if_changed() == (1, 2, 1)
+        assert mgr.get_by_title('国土空间规划文件0')['source'] == '省自然资源厅'
+        assert mgr.get_by_title('国土空间规划文件1') is None
+        assert mgr.get_by_title('生态修复指南')['id'] == 'M-1'
+        assert mgr.get_by_title('国土空间规划文件2') is None
+        assert mgr.get_metadata('/data/生态修复指南_ocr.md')['id'] == 'M-1'
+        added = mgr.get_by_title('新增的文件')
+        assert added['id']
+
+        # 新增行补齐的 ID 已写回 CSV，再次检查不会重复新增
+        assert {row['title']: row['id'] for row in _read_rows(csv_path)}['新增的文件'] == added['id']
+        assert mgr.reload_if_changed() is None
+        assert mgr.count() == 5
+
+        # 只更新修改时间、内容不变
+        time.sleep(0.01)
+        os.utime(csv_path)
+        assert mgr.reload_if_changed() is None
+        mgr.close()
+
+
+def test_reload_keeps_local_changes():
+    """SQLite 存储：人工编辑期间本进程的修改保留，并写回 CSV"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        store_path = os.path.join(tmp, 'source_table.db')
+        _write_rows(csv_path, _initial_rows())
+        mgr = MetadataManager(csv_path, auto_create=False, store_path=store_path, export_interval=3600)
+
+        # 尚未导出到 CSV 的本地修改
+        mgr.update_metadata('国土空间规划文件3', keywords='本地修改')
+        # 人工编辑基于旧的 CSV，同时修改了另一行
+        _edit_csv(csv_path, lambda rows: [dict(row, region='华东') if row['id'] == 'M-4' else row for row in rows])
+
+        # 下一次写操作前先合并人工修改
+        mgr.add_metadata({'title': '运行中新增的文件'})
+        assert mgr.get_by_title('国土空间规划文件4')['region'] == '华东'
+        assert mgr.get_by_title('国土空间规划文件3')['keywords'] == '本地修改'
+        mgr.close()
+
+        rows = {row['title']: row for row in _read_rows(csv_path)}
+        assert rows['国土空间规划文件3']['keywords'] == '本地修改'
+        assert rows['国土空间规划文件4']['region'] == '华东'
+        assert '运行中新增的文件' in rows
+
+        reloaded = MetadataManager(csv_path, auto_create=False, store_path=store_path)
+        assert reloaded.get_by_title('国土空间规划文件4')['region'] == '华东'
+        assert reloaded.count() == 6
+        reloaded.close()
+
+
+def test_background_reload():
+    """后台线程自动应用人工修改"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'source_table.csv')
+        _write_rows(csv_path, _initial_rows())
+        mgr = MetadataManager(csv_path, auto_create=False, reload_interval=0.05)
+        _edit_csv(csv_path, lambda rows: rows[:-1])
+        deadline = time.monotonic() + 5
+        while mgr.count() != 4 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert mgr.count() == 4
+        mgr.close()
+
+
+if __name__ == '__main__':
+    for test in (test_reload_csv_manager, test_reload_keeps_local_changes, test_background_reload):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
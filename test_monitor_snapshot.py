@@ -0,0 +1,95 @@
+"""
+测试 Dify 监控快照
+文档流式写入暂存表后与上次快照比较，得到新增、删除、改名、更新
+"""
+import os
+import sys
+import tempfile
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.dify_monitor import DifyMonitor
+from utils.monitor_snapshot import MonitorSnapshot, encode_doc_id, decode_doc_id, ADDED, REMOVED, RENAMED, UPDATED
+
+UUID_A = '0f8fad5b-d9cb-469f-a165-70867728950e'
+UUID_B = '7c9e6679-7425-40de-944b-e07fc1f90ae7'
+
+
+def test_doc_id_encoding():
+    """文档 ID 编码可原样还原"""
+    for doc_id in (UUID_A, UUID_A.upper(), 'doc-1', '文档'):
+        assert decode_doc_id(encode_doc_id(doc_id)) == doc_id
+    assert len(encode_doc_id(UUID_A)) == 16
+
+
+def test_streaming_diff():
+    """与快照比较得到各类变化，重启后仍以上次快照为基准"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'upload_log.db')
+        snapshot = MonitorSnapshot(db_path)
+        assert snapshot.saved_at() is None
+
+        assert snapshot.stage(iter([(UUID_A, '文件A', 1), (UUID_B, '文件B', 1), ('doc-c', '文件C', 1)])) == 3
+        snapshot.commit()
+        assert snapshot.load() == {UUID_A: ('文件A', 1), UUID_B: ('文件B', 1), 'doc-c': ('文件C', 1)}
+        snapshot.close()
+
+        # 模拟重启
+        snapshot = MonitorSnapshot(db_path)
+        docs = [(UUID_B, '文件B改', 1), ('doc-c', '文件C', 2), ('doc-d', '文件D', 1), ('doc-d', '文件D', 1)]
+        assert snapshot.stage(docs, batch_size=2) == 3
+        events = {(e.kind, e.doc_id): e for e in snapshot.diff()}
+        assert set(events) == {(REMOVED, UUID_A), (RENAMED, UUID_B), (UPDATED, 'doc-c'), (ADDED, 'doc-d')}
+        assert events[(REMOVED, UUID_A)].old_name == '文件A'
+        assert events[(RENAMED, UUID_B)].old_name == '文件B'
+        assert snapshot.staged_names(['文件A', '文件C']) == {'文件C'}
+
+        # 同步出错时丢弃暂存，快照保持不变
+        snapshot.discard()
+        assert snapshot.load()[UUID_B] == ('文件B', 1)
+
+        snapshot.stage(docs)
+        snapshot.commit()
+        assert snapshot.load() == {UUID_B: ('文件B改', 1), 'doc-c': ('文件C', 2), 'doc-d': ('文件D', 1)}
+        snapshot.stage(docs)
+        assert list(snapshot.diff()) == []
+        snapshot.close()
+
+
+class FakeDify:
+    """只提供文档列表的 Dify 客户端"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def iter_documents(self, on_page=None, dedupe=True):
+        return iter(self.documents)
+
+
+def test_monitor_without_metadata():
+    """未启用元数据时，改名、新增、删除仍推进快照，不会每轮重复触发"""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'database': {'sqlite_path': os.path.join(tmp, 'upload_log.db')}}
+        dify = FakeDify([{'id': UUID_A, 'name': '文件A.pdf', 'updated_at': 1},
+                         {'id': UUID_B, 'name': '文件B.pdf', 'updated_at': 1}])
+        monitor = DifyMonitor(config, None, None, dify_client=dify)
+        assert not monitor.check_for_changes()
+
+        dify.documents = [{'id': UUID_A, 'name': '文件A改.pdf', 'updated_at': 1},
+                          {'id': 'doc-c', 'name': '文件C.md', 'updated_at': 1}]
+        assert monitor.check_for_changes()
+        assert monitor.snapshot.load() == {UUID_A: ('文件A改', 1), 'doc-c': ('文件C', 1)}
+        assert not monitor.check_for_changes()
+        monitor.snapshot.close()
+
+
+if __name__ == '__main__':
+    for test in (test_doc_id_encoding, test_streaming_diff, test_monitor_without_metadata):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
@@ -0,0 +1,128 @@
+"""
+测试上传流水线
+扫描与文件事件同时提交同一文件时只处理一次，处理完后可再次提交
+"""
+import os
+import sys
+import tempfile
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upload_enhanced import EnhancedFileHandler
+from utils.pipeline import Pipeline, PipelineStage
+
+
+class BlockingHandler(EnhancedFileHandler):
+    """哈希阶段等待放行，上传阶段只记录调用"""
+
+    def __init__(self, config):
+        super().__init__(config, None, None, dify_client=object())
+        self.release = threading.Event()
+        self.uploads = []
+
+    def _stage_hash(self, job):
+        self.release.wait(5)
+        return [{'stage': 'upload', 'path': job['path']}]
+
+    def _stage_upload(self, job):
+        self.uploads.append(job['path'])
+        return []
+
+
+def _config(tmp):
+    return {
+        'document': {'watch_folder': tmp, 'output_dir': os.path.join(tmp, 'ocr_output'),
+                     'ocr_extensions': ['.pdf']},
+        'dify': {'dataset_id': 'dataset'},
+        'indexing': {'track_status': False},
+        'performance': {'adaptive_upload': False, 'max_workers': 2},
+    }
+
+
+def test_pipeline_routes_and_counts():
+    """任务可跳过中间阶段，各阶段分别统计成功与失败"""
+    seen = []
+
+    def first(job):
+        if job['n'] == 0:
+            raise ValueError('bad job')
+        return [dict(job, stage='last')]
+
+    pipeline = Pipeline([
+        PipelineStage('first', first, workers=2),
+        PipelineStage('middle', lambda job: seen.append(('middle', job['n']))),
+        PipelineStage('last', lambda job: seen.append(('last', job['n'])), workers=2),
+    ])
+    pipeline.start()
+    for n in range(6):
+        pipeline.submit({'n': n})
+    pipeline.join()
+    pipeline.stop(5)
+    assert sorted(seen) == [('last', n) for n in range(1, 6)]
+    stats = pipeline.stats()
+    assert stats['first']['processed'] == 5 and stats['first']['failed'] == 1
+    assert stats['middle']['processed'] == 0
+
+
+def test_bounded_queue_backpressure():
+    """下游阻塞时上游队列满后 submit 等待，放行后全部处理完"""
+    release = threading.Event()
+    done = []
+    pipeline = Pipeline([
+        PipelineStage('slow', lambda job: (release.wait(5), done.append(job['n'])) and None, queue_size=1),
+    ])
+    pipeline.start()
+    submitted = []
+
+    def producer():
+        for n in range(4):
+            pipeline.submit({'n': n})
+            submitted.append(n)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    thread.join(0.3)
+    # 1 个在处理，1 个在队列中，其余等待
+    assert len(submitted) == 2
+    release.set()
+    thread.join(5)
+    pipeline.join()
+    pipeline.stop(5)
+    assert sorted(done) == [0, 1, 2, 3]
+
+
+def test_in_flight_file_submitted_once():
+    """处理中的文件再次提交被跳过，处理完后可再次提交"""
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = BlockingHandler(_config(tmp))
+        path = os.path.join(tmp, '文件.md')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('# 文件')
+        handler.start_pipeline()
+        try:
+            handler.submit_file(path)
+            handler.submit_file(path)
+            handler.release.set()
+            handler.wait_idle()
+            assert handler.uploads == [path]
+            assert handler._in_flight == {}
+
+            handler.submit_file(path)
+            handler.wait_idle()
+            assert handler.uploads == [path, path]
+        finally:
+            handler.stop_pipeline(5)
+
+
+if __name__ == '__main__':
+    for test in (test_pipeline_routes_and_counts, test_bounded_queue_backpressure,
+                 test_in_flight_file_submitted_once):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
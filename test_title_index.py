@@ -0,0 +1,38 @@
+"""
+测试标题标准化与标题索引
+只去掉末尾的分段/OCR 标记，标题中间的 part、sub 等编号属于标题本身
+"""
+import os
+import sys
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.title_index import TitleIndex, normalize_title
+
+
+def test_only_trailing_suffixes_removed():
+    """末尾的分段后缀被去掉，中间的 part/sub 编号保留"""
+    assert normalize_title('《生态修复方案》_chunk002_part1') == normalize_title('生态修复方案')
+    assert normalize_title('生态修复方案_pdfchunk3') == '生态修复方案'
+    assert normalize_title('规划part2020实施方案') == '规划part2020实施方案'
+    assert normalize_title('附件sub3说明') == '附件sub3说明'
+
+
+def test_mid_title_part_is_different_document():
+    """标题中间带 part 编号的文档不与去掉编号后的标题匹配"""
+    index = TitleIndex(['规划part2020实施方案', '附件sub3说明'])
+    assert index.match('规划实施方案') == []
+    assert index.match('附件说明') == []
+    assert index.match('规划part2020实施方案_chunk001') == ['规划part2020实施方案']
+
+
+if __name__ == '__main__':
+    for test in (test_only_trailing_suffixes_removed, test_mid_title_part_is_different_document):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
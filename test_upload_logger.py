@@ -0,0 +1,74 @@
+"""
+测试上传日志的延迟写入
+记录入队时即计算哈希，落库前文件被删除或替换也按上传时的内容记录
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.upload_logger import UploadLogger
+
+
+def _write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def test_write_behind_hashes_at_enqueue():
+    """入队后文件被删除或替换，落库的仍是上传时的哈希"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # 间隔足够长，保证记录在 flush() 之前不会被后台线程写入
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'), write_behind=True,
+                              flush_interval_ms=60000, flush_batch_size=1000)
+        deleted = os.path.join(tmp, 'deleted.md')
+        replaced = os.path.join(tmp, 'replaced.md')
+        _write(deleted, '已删除的文件')
+        _write(replaced, '上传时的内容')
+        original_hash = logger.get_file_hash(replaced)
+
+        assert logger.log_upload(deleted, 'doc-1')
+        assert logger.log_upload(replaced, 'doc-2')
+        assert not logger.log_upload(os.path.join(tmp, 'missing.md'), 'doc-3')
+        os.remove(deleted)
+        _write(replaced, '之后被替换的内容')
+
+        assert logger.flush() == 2
+        with sqlite3.connect(logger.db_path) as conn:
+            rows = dict(conn.execute("SELECT file_path, file_hash FROM upload_log"))
+        assert set(rows) == {deleted, replaced}
+        assert rows[replaced] == original_hash
+        # 替换后的内容未上传过
+        assert not logger.is_uploaded(replaced)
+        logger.close()
+
+
+def test_maintenance_backfills_quick_fingerprints():
+    """维护时为迁移前缺少快速指纹的记录补算"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = UploadLogger(os.path.join(tmp, 'upload_log.db'))
+        path = os.path.join(tmp, 'old.md')
+        _write(path, '迁移前上传的文件')
+        assert logger.log_upload(path, 'doc-1')
+        with sqlite3.connect(logger.db_path) as conn:
+            conn.execute("UPDATE upload_log SET quick_fp=NULL")
+
+        result = logger.run_maintenance(retention_days=30)
+        assert result['quick_fp'] == 1
+        with sqlite3.connect(logger.db_path) as conn:
+            assert conn.execute("SELECT quick_fp FROM upload_log").fetchone()[0] == logger.get_quick_fingerprint(path)
+        logger.close()
+
+
+if __name__ == '__main__':
+    for test in (test_write_behind_hashes_at_enqueue, test_maintenance_backfills_quick_fingerprints):
+        try:
+            test()
+            print(f"✅ {test.__doc__} 通过")
+        except Exception as e:
+            print(f"❌ {test.__doc__} 失败: {e}")
+            import traceback
+            traceback.print_exc()
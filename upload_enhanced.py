@@ -48,10 +48,9 @@ logging.getLogger().addFilter(IgnorePadTokenLog())
 import warnings
 warnings.filterwarnings("ignore")
 
-import requests
-import json
 import time
 import re
+import threading
 import math
 import copy
 import tempfile
@@ -76,6 +75,11 @@ try:
     from utils.upload_logger import UploadLogger
     from utils.logger import log_info, log_success, log_error, log_warning, print_header
     from utils.dify_monitor import DifyMonitor
+    from utils.dify_client import DifyClient
+    from utils.indexing_tracker import IndexingTracker
+    from utils.adaptive_limiter import AdaptiveConcurrencyLimiter
+    from utils.pipeline import Pipeline, PipelineStage
+    from utils.event_coalescer import EventCoalescer
     
     PdfReader = None
     PdfWriter = None
@@ -91,23 +95,19 @@ except ImportError as e:
     sys.exit(1)
 
 
+# 退出时等待流水线各阶段线程结束的时间（秒）
+PIPELINE_STOP_TIMEOUT = 30
+
+
 def ensure_pdf_split_available():
     global PDF_SPLIT_AVAILABLE
     return PDF_SPLIT_AVAILABLE
 
 
-def normalize_title_for_compare(title):
-    if not title: return ''
-    normalized = re.sub(r'[\《\》\（\）\(\)\[\]\ ]', '', title)
-    normalized = re.sub(r'PDF分段\s*\d+/\d+', '', normalized)
-    normalized = re.sub(r'[_-]+chunk\d+', '', normalized, flags=re.IGNORECASE)
-    return normalized.strip().lower()
-
-
 class EnhancedFileHandler(FileSystemEventHandler):
     DEFAULT_SUPPORTED_EXTENSIONS = ('.txt', '.md', '.markdown', '.pdf', '.doc', '.docx', '.png', '.jpg', '.jpeg')
     
-    def __init__(self, config, metadata_mgr, upload_logger):
+    def __init__(self, config, metadata_mgr, upload_logger, dify_client=None):
         super().__init__()
         self.paddle_config = config.get('paddleocr', {})
         self.paddle_enabled = self.paddle_config.get('enabled', False) and PADDLE_AVAILABLE
@@ -146,14 +146,61 @@ class EnhancedFileHandler(FileSystemEventHandler):
         self.keep_extension_in_doc_name = bool(doc_config.get('keep_extension_in_doc_name', True))
         self.append_chunk_suffix_to_name = bool(doc_config.get('append_chunk_suffix_to_name', True))
 
-        self.dify_base_url = config['dify']['base_url'].rstrip('/')
         self.dataset_id = config['dify']['dataset_id']
-        self.api_key = config['dify']['api_key']
-        self.document_create_url = f"{self.dify_base_url}/v1/datasets/{self.dataset_id}/document/create-by-file"
         self.indexing_config = config['indexing']
 
+        # 并发配置：哈希 → 切分 → OCR → 上传 四个阶段各自独立并发，阶段之间用有界队列衔接
+        perf_config = config.get('performance') or {}
+        self.max_workers = max(1, int(perf_config.get('max_workers', 4)))
+        self.cpu_workers = max(1, int(perf_config.get('cpu_workers', min(self.max_workers, os.cpu_count() or 1))))
+        self.ocr_workers = max(1, int(perf_config.get('ocr_workers', 1)))
+        self.upload_workers = max(1, int(perf_config.get('upload_workers', self.max_workers)))
+        self.queue_size = max(1, int(perf_config.get('queue_size', self.max_workers * 2)))
+        # 上传与监控共用一个连接池，连接数不少于上传并发数 + 文档列表并发页数
+        list_workers = int(config['dify'].get('list_workers', 4))
+        self.dify = dify_client or DifyClient.from_config(
+            config, pool_size=max(self.upload_workers + list_workers, int(config['dify'].get('pool_size', 10)))
+        )
+        self.on_upload = None  # 上传成功回调（通知 Dify 监控尽快检查）
+        # 自适应上传并发：上传线程数为上限，实际在途请求数按 Dify 的响应增减
+        self.upload_limiter = None
+        if perf_config.get('adaptive_upload', True):
+            self.upload_limiter = AdaptiveConcurrencyLimiter(
+                self.upload_workers,
+                min_limit=perf_config.get('upload_min_workers', 1),
+                initial_limit=perf_config.get('upload_initial_workers'),
+                latency_target=perf_config.get('upload_latency_target', 0),
+                max_retries=perf_config.get('upload_retries', 3),
+            )
+        # 索引进度跟踪：记录上传返回的批次，查询索引结果；Dify 索引积压时暂停上传
+        self.indexing_tracker = None
+        if self.indexing_config.get('track_status', True):
+            self.indexing_tracker = IndexingTracker(
+                self.dify, upload_logger,
+                poll_interval=self.indexing_config.get('status_poll_interval', 5),
+                max_backlog=self.indexing_config.get('max_backlog', 50),
+                timeout=self.indexing_config.get('status_timeout', 3600),
+                workers=list_workers,
+            )
+        # 处理中的源文件：路径 -> 尚未完成的任务数（扫描与文件事件可能同时提交同一文件）
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self.pipeline = Pipeline([
+            PipelineStage('hash', self._tracked(self._stage_hash), self.cpu_workers, self.queue_size),
+            PipelineStage('split', self._tracked(self._stage_split), self.cpu_workers, self.queue_size),
+            PipelineStage('ocr', self._tracked(self._stage_ocr), self.ocr_workers, self.queue_size),
+            PipelineStage('upload', self._tracked(self._stage_upload), self.upload_workers, self.queue_size),
+        ])
+
+        # 文件事件合并：大小与 mtime 在静默期内不变才派发，每个路径只处理一次
+        self.coalescer = EventCoalescer(
+            self.submit_file,
+            quiet_period=doc_config.get('settle_seconds', 5),
+            max_pending=doc_config.get('event_cache_size', 10000),
+            max_history=doc_config.get('event_cache_size', 10000),
+        )
+
         os.makedirs(self.ocr_output_dir, exist_ok=True)
-        self._recent_events = {}
 
     def process_via_paddleocr(self, file_path):
         """核心处理：带进度条的 VL 解析"""
@@ -242,18 +289,13 @@ class EnhancedFileHandler(FileSystemEventHandler):
 
     def _format_size(self, size): return f"{size:.2f} MB"
 
-    def _is_recently_processed(self, path, window=5):
-        now = time.time()
-        if now - self._recent_events.get(path, 0) < window: return True
-        self._recent_events[path] = now
-        return False
-
     def _get_metadata(self, path):
         if not self.metadata_mgr: return None
         return self.metadata_mgr.get_metadata(path)
 
     def _record_upload_success(self, path, doc_id, meta):
         if self.upload_logger: self.upload_logger.log_upload(path, doc_id, 'success', meta)
+        if self.on_upload: self.on_upload()
 
     def _record_upload_failure(self, path, err, meta):
         if self.upload_logger: 
@@ -265,64 +307,219 @@ class EnhancedFileHandler(FileSystemEventHandler):
         return bool(re.search(r'(_pdfchunk|_ocr_chunk|_chunk)\d{3}', name.lower()))
 
     def on_created(self, event):
-        if not event.is_directory: self.process_file(event.src_path)
+        if not event.is_directory: self._notify_event(event.src_path)
 
     def on_modified(self, event):
-        if not event.is_directory: self.process_file(event.src_path)
-
-    def process_file(self, file_path, force=False):
-        try:
-            if not os.path.exists(file_path) or os.path.isdir(file_path): return
-            if not force and self._is_recently_processed(file_path): return
-            if self._is_internal_chunk(os.path.basename(file_path)): return
-
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext not in self.supported_extensions: return
-            if self.skip_uploaded and self.upload_logger and self.upload_logger.is_uploaded(file_path):
-                log_info(f"跳过已上传: {os.path.basename(file_path)}")
+        if not event.is_directory: self._notify_event(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory: self._notify_event(event.dest_path)
+
+    def _notify_event(self, file_path):
+        name = os.path.basename(file_path)
+        if self._is_internal_chunk(name): return
+        if os.path.splitext(name)[1].lower() not in self.supported_extensions: return
+        self.coalescer.notify(file_path)
+
+    # --- 流水线 ---
+    def start_pipeline(self):
+        if self.indexing_tracker: self.indexing_tracker.start()
+        self.pipeline.start()
+        self.coalescer.start()
+
+    def stop_pipeline(self, timeout=None):
+        self.coalescer.stop(timeout)
+        self.pipeline.stop(timeout)
+        if self.indexing_tracker: self.indexing_tracker.stop()
+
+    def wait_idle(self):
+        """等待流水线中所有任务处理完毕"""
+        self.pipeline.join()
+
+    def submit_file(self, file_path):
+        """将文件提交到流水线（下游繁忙时阻塞，形成背压）；同一文件处理完之前不重复提交"""
+        if not self._accept_file(file_path): return
+        with self._in_flight_lock:
+            if file_path in self._in_flight:
+                log_info(f"跳过处理中的文件: {os.path.basename(file_path)}")
                 return
-
-            meta = self._get_metadata(file_path)
-            if ext in self.ocr_extensions: self._handle_ocr_file(file_path, meta)
-            elif ext in ['.md', '.txt']: self._handle_markdown_file(file_path, meta)
-            else: self._handle_regular_file(file_path, meta)
+            self._in_flight[file_path] = 1
+        try:
+            self.pipeline.submit({'path': file_path, 'source': file_path})
+        except Exception:
+            self._release(file_path, 1)
+            raise
+
+    def _release(self, source, done, spawned=0):
+        """源文件的任务完成 done 个、新增 spawned 个，全部完成后允许再次提交"""
+        with self._in_flight_lock:
+            remaining = self._in_flight.get(source, 0) - done + spawned
+            if remaining > 0:
+                self._in_flight[source] = remaining
+            else:
+                self._in_flight.pop(source, None)
+
+    def _tracked(self, stage):
+        """包装阶段处理函数：后续任务继承源文件，按任务数跟踪源文件是否处理完毕"""
+        def handler(job):
+            source = job.get('source')
+            if source is None:
+                return stage(job)
+            try:
+                jobs = list(stage(job) or ())
+            except Exception:
+                self._release(source, 1)
+                raise
+            for item in jobs:
+                item['source'] = source
+            self._release(source, 1, len(jobs))
+            return jobs
+        return handler
+
+    def process_file(self, file_path):
+        """同步处理单个文件（不经过流水线线程，依次执行各阶段）"""
+        try:
+            if not self._accept_file(file_path): return
+            stages = {'hash': self._stage_hash, 'split': self._stage_split,
+                      'ocr': self._stage_ocr, 'upload': self._stage_upload}
+            jobs = [{'path': file_path, 'stage': 'hash'}]
+            while jobs:
+                job = jobs.pop(0)
+                jobs.extend(stages[job['stage']](job) or [])
         except Exception as e:
             log_error(f"处理出错: {e}")
 
-    def _handle_ocr_file(self, file_path, meta):
-        size = self._get_file_size_mb(file_path)
-        log_info(f"处理文件: {os.path.basename(file_path)} ({self._format_size(size)})")
-        
-        if not self.paddle_enabled:
-            return self._handle_regular_file(file_path, meta)
+    def _accept_file(self, file_path):
+        if not os.path.exists(file_path) or os.path.isdir(file_path): return False
+        if self._is_internal_chunk(os.path.basename(file_path)): return False
+        return os.path.splitext(file_path)[1].lower() in self.supported_extensions
+
+    def _stage_hash(self, job):
+        """阶段 1：去重检查（哈希）与元数据匹配，决定后续路径"""
+        file_path = job['path']
+        if not os.path.exists(file_path): return []
+        if self.skip_uploaded and self.upload_logger and self.upload_logger.is_uploaded(file_path):
+            log_info(f"跳过已上传: {os.path.basename(file_path)}")
+            return []
 
-        is_pdf = file_path.lower().endswith('.pdf')
-        ocr_input = file_path
-        
-        pdf_chunks = []
-        if is_pdf and self.pdf_split_enabled:
-            pdf_chunks = self._split_pdf_file(file_path, self.pdf_chunk_size_mb)
-        
-        if pdf_chunks:
-            log_success(f"PDF 已切分为 {len(pdf_chunks)} 个部分")
-            for idx, chunk in enumerate(pdf_chunks, 1):
+        meta = self._get_metadata(file_path)
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in self.ocr_extensions:
+            size = self._get_file_size_mb(file_path)
+            log_info(f"处理文件: {os.path.basename(file_path)} ({self._format_size(size)})")
+            if not self.paddle_enabled:
+                return [{'stage': 'upload', 'path': file_path, 'meta': meta, 'markdown': False}]
+            if ext == '.pdf' and self.pdf_split_enabled:
+                return [{'stage': 'split', 'path': file_path, 'meta': meta}]
+            return [{'stage': 'ocr', 'path': file_path, 'meta': meta}]
+        return [{'stage': 'upload', 'path': file_path, 'meta': meta, 'markdown': ext in ('.md', '.txt')}]
+
+    def _stage_split(self, job):
+        """阶段 2：超大 PDF 切分（已完成的分段直接复用，支持断点续传）"""
+        file_path, meta = job['path'], job.get('meta')
+        plan = self._plan_pdf_split(file_path, self.pdf_chunk_size_mb)
+        if not plan:
+            return [{'stage': 'ocr', 'path': file_path, 'meta': meta}]
+
+        reader, ranges = plan
+        total = len(ranges)
+        parent_hash = self.upload_logger.get_file_hash(file_path) if self.upload_logger else None
+        progress = self._load_chunk_progress(parent_hash, file_path, ranges)
+        base = os.path.splitext(file_path)[0]
+        name = self._resolve_document_name(file_path, meta)
+
+        jobs = []
+        reused = ocr_reused = 0
+        print(f"📦 切分 PDF (共 {ranges[-1][1]} 页)...")
+        with tqdm(total=ranges[-1][1], unit="页", desc="✂️ 切分进度", ncols=90) as pbar:
+            for idx, (start, end) in enumerate(ranges, 1):
+                pbar.update(end - start)
                 chunk_meta = meta.copy() if meta else {}
-                chunk_meta.update({'chunk_index': idx, 'chunk_total': len(pdf_chunks)})
-                display = f"{self._resolve_document_name(file_path, meta)} (分段 {idx}/{len(pdf_chunks)})"
-                
-                res_path = self.process_via_paddleocr(chunk)
-                if res_path: self._handle_markdown_file(res_path, chunk_meta, display)
-                try: os.remove(chunk) 
+                chunk_meta.update({'chunk_index': idx, 'chunk_total': total})
+                job_base = {'meta': chunk_meta, 'display': f"{name} (分段 {idx}/{total})"}
+                if parent_hash:
+                    job_base['chunk'] = {'hash': parent_hash, 'path': file_path, 'index': idx, 'meta': meta}
+
+                row = progress.get(idx)
+                if row and row['status'] == 'uploaded':
+                    reused += 1
+                    continue
+                if row and self._is_ocr_output_valid(row):
+                    ocr_reused += 1
+                    jobs.append(dict(job_base, stage='upload', path=row['ocr_path'], markdown=True))
+                    continue
+                chunk = self._write_pdf_chunk(reader, base, idx, start, end)
+                jobs.append(dict(job_base, stage='ocr', path=chunk, cleanup=True))
+
+        if reused or ocr_reused:
+            log_info(f"断点续传：{total} 个分段中 {reused} 个已上传，{ocr_reused} 个复用 OCR 结果")
+        log_success(f"PDF 已切分为 {total} 个部分")
+        if not jobs and parent_hash:
+            self._complete_chunked_file({'hash': parent_hash, 'path': file_path, 'meta': meta})
+        return jobs
+
+    def _load_chunk_progress(self, parent_hash, file_path, ranges):
+        """读取已有分段记录；分段方案变化（如调整了分段大小）时重新登记"""
+        if not parent_hash: return {}
+        rows = self.upload_logger.get_chunks(parent_hash)
+        if [(r['page_start'], r['page_end']) for r in rows] == list(ranges):
+            return {r['chunk_index']: r for r in rows}
+        self.upload_logger.reset_chunk_plan(parent_hash, file_path, ranges)
+        return {}
+
+    def _is_ocr_output_valid(self, row):
+        path, expected = row.get('ocr_path'), row.get('ocr_hash')
+        if not path or not expected or not os.path.exists(path): return False
+        return self.upload_logger.calculate_file_hash(path) == expected
+
+    def _stage_ocr(self, job):
+        """阶段 3：OCR 识别为 Markdown"""
+        try:
+            res_path = self.process_via_paddleocr(job['path'])
+        finally:
+            if job.get('cleanup'):
+                try: os.remove(job['path'])
                 except: pass
+        chunk = job.get('chunk')
+        if chunk:
+            if res_path:
+                self.upload_logger.update_chunk(chunk['hash'], chunk['index'], status='ocr_done', ocr_path=res_path,
+                                                ocr_hash=self.upload_logger.calculate_file_hash(res_path))
+            else:
+                self.upload_logger.update_chunk(chunk['hash'], chunk['index'], status='failed')
+        if not res_path: return []
+        return [{'stage': 'upload', 'path': res_path, 'meta': job.get('meta'),
+                 'display': job.get('display'), 'markdown': True, 'chunk': chunk}]
+
+    def _stage_upload(self, job):
+        """阶段 4：上传 Dify 并记录日志"""
+        if job.get('markdown'):
+            doc_id = self._handle_markdown_file(job['path'], job.get('meta'), job.get('display'))
         else:
-            res_path = self.process_via_paddleocr(ocr_input)
-            if res_path: self._handle_markdown_file(res_path, meta)
+            doc_id = self._handle_regular_file(job['path'], job.get('meta'), job.get('display'))
+        chunk = job.get('chunk')
+        if chunk:
+            if not doc_id:
+                self.upload_logger.update_chunk(chunk['hash'], chunk['index'], status='failed')
+                return []
+            # 只有完成最后一个分段的线程记录源文件
+            parent_doc_id = self.upload_logger.mark_chunk_uploaded(chunk['hash'], chunk['index'], doc_id)
+            if parent_doc_id:
+                self._complete_chunked_file(chunk, parent_doc_id)
+        return []
+
+    def _complete_chunked_file(self, chunk, doc_id=None):
+        """全部分段上传完成后记录源文件（文档 ID 取最后一个分段），下次扫描直接跳过"""
+        meta = dict(chunk.get('meta') or {})
+        meta['chunk_total'] = len(self.upload_logger.get_chunks(chunk['hash']))
+        doc_id = doc_id or self.upload_logger.get_last_chunk_doc_id(chunk['hash'])
+        self.upload_logger.log_upload(chunk['path'], doc_id, 'success', meta)
+        log_success(f"全部分段已上传: {os.path.basename(chunk['path'])}")
 
     def _handle_markdown_file(self, file_path, meta, display=None):
         if self._get_file_size_mb(file_path) > self.markdown_chunk_size_mb:
-            self._upload_with_chunking(file_path, meta, display)
-        else:
-            self._handle_regular_file(file_path, meta, display)
+            return self._upload_with_chunking(file_path, meta, display) or None
+        return self._handle_regular_file(file_path, meta, display)
 
     def _handle_regular_file(self, file_path, meta, display=None):
         doc_id, err = self.upload_to_dify(file_path, meta, display)
@@ -332,36 +529,36 @@ class EnhancedFileHandler(FileSystemEventHandler):
         else:
             log_error(f"上传失败: {err}")
             self._record_upload_failure(file_path, err, meta)
+        return doc_id
+
+    def _plan_pdf_split(self, file_path, target_mb):
+        """
+        计算 PDF 分段方案（不写文件）
 
-    def _split_pdf_file(self, file_path, target_mb):
-        if not ensure_pdf_split_available(): return []
+        Returns:
+            (reader, [(起始页, 结束页), ...])，无需切分时返回 None
+        """
+        if not ensure_pdf_split_available(): return None
         try:
             reader = PdfReader(file_path)
             total = len(reader.pages)
-            if total == 0: return []
-            
+            if total == 0: return None
+
             size = max(0.01, self._get_file_size_mb(file_path))
-            if size <= target_mb: return []
+            if size <= target_mb: return None
 
             step = max(1, math.ceil(total * target_mb / size))
-            chunks = []
-            base = os.path.splitext(file_path)[0]
-            
-            print(f"📦 切分 PDF (共 {total} 页)...")
-            with tqdm(total=total, unit="页", desc="✂️ 切分进度", ncols=90) as pbar:
-                for i in range(0, total, step):
-                    writer = PdfWriter()
-                    end = min(i + step, total)
-                    for p in range(i, end): writer.add_page(reader.pages[p])
-                    
-                    out = f"{base}_pdfchunk{(i//step)+1:03d}.pdf"
-                    with open(out, 'wb') as f: writer.write(f)
-                    chunks.append(out)
-                    pbar.update(end - i)
-            return chunks
+            return reader, [(i, min(i + step, total)) for i in range(0, total, step)]
         except Exception as e:
             log_error(f"PDF 切分失败: {e}")
-            return []
+            return None
+
+    def _write_pdf_chunk(self, reader, base, idx, start, end):
+        writer = PdfWriter()
+        for p in range(start, end): writer.add_page(reader.pages[p])
+        out = f"{base}_pdfchunk{idx:03d}.pdf"
+        with open(out, 'wb') as f: writer.write(f)
+        return out
 
     def _upload_with_chunking(self, file_path, meta, display):
         return False
@@ -377,26 +574,57 @@ class EnhancedFileHandler(FileSystemEventHandler):
     def upload_to_dify(self, file_path, meta, display_name):
         try:
             tech, rule = self._build_process_rule()
-            headers = {'Authorization': f'Bearer {self.api_key}'}
             name = display_name or self._resolve_document_name(file_path, meta)
             
             data = {"name": name, "source": "upload_file", "doc_type": "text", 
                     "doc_language": "ch", "indexing_technique": tech, "process_rule": rule}
             if meta: data["metadata"] = {k:v for k,v in meta.items() if v}
 
-            files = [('file', (os.path.basename(file_path), open(file_path, 'rb'), 'text/markdown')),
-                     ('data', (None, json.dumps(data), 'application/json'))]
-            
-            resp = requests.post(self.document_create_url, headers=headers, files=files, timeout=300)
-            if resp.status_code in (200, 201): return resp.json().get('document', {}).get('id'), None
+            # Dify 索引积压时先等待
+            if self.indexing_tracker: self.indexing_tracker.wait_for_capacity()
+            if self.upload_limiter:
+                resp = self.upload_limiter.call(self.dify.create_document_by_file,
+                                                file_path, os.path.basename(file_path), data)
+            else:
+                resp = self.dify.create_document_by_file(file_path, os.path.basename(file_path), data)
+            if resp.status_code in (200, 201):
+                body = resp.json()
+                doc_id = body.get('document', {}).get('id')
+                if doc_id and body.get('batch') and self.indexing_tracker:
+                    self.indexing_tracker.track(doc_id, body['batch'], file_path)
+                return doc_id, None
             return None, resp.json().get('code', f"http_{resp.status_code}")
         except Exception as e:
             return None, str(e)
 
 
+def scan_existing_files(handler, path):
+    """将监控目录中的存量文件送入流水线并等待处理完毕，返回 (文件数, 耗时秒)"""
+    log_info(f"流水线并发：哈希 {handler.cpu_workers} / 切分 {handler.cpu_workers} / "
+             f"OCR {handler.ocr_workers} / 上传 {handler.upload_workers}，队列容量 {handler.queue_size}")
+    start = time.time()
+    count = 0
+    for root, _, names in os.walk(path):
+        for f in names:
+            if f.lower().endswith(handler.supported_extensions):
+                handler.submit_file(os.path.join(root, f))
+                count += 1
+    handler.wait_idle()
+    return count, time.time() - start
+
+
+def log_upload_concurrency(limiter):
+    """输出自适应上传并发的当前上限与成功率"""
+    st = limiter.stats()
+    log_info(f"上传并发：当前上限 {st['limit']}（{limiter.min_limit}~{limiter.max_limit}），"
+             f"请求 {st['requests']} 次，成功率 {st['success_rate']}%，过载 {st['overloads']} 次，"
+             f"降并发 {st['decreases']} 次，Retry-After 暂停 {st['retry_after_pauses']} 次，平均 {st['avg_ms']} ms")
+
+
 def start_monitoring(config, mgr, logger):
     path = config['document']['watch_folder']
     handler = EnhancedFileHandler(config, mgr, logger)
+    handler.start_pipeline()
     obs = Observer()
     obs.schedule(handler, path, recursive=True)
     obs.start()
@@ -404,25 +632,43 @@ def start_monitoring(config, mgr, logger):
     log_info(f"监控启动: {path}")
     monitor = None
     if config.get('monitor', {}).get('enabled', True):
-        monitor = DifyMonitor(config, logger, mgr, 60)
+        check_interval = config.get('monitor', {}).get('check_interval', 60)
+        monitor = DifyMonitor(config, logger, mgr, check_interval, dify_client=handler.dify)
+        # 本地上传成功后让监控尽快检查
+        handler.on_upload = monitor.notify_activity
         monitor.start()
     
     try:
         log_info("扫描现有文件...")
-        # 确保这里使用全局导入的 os
-        for root, _, files in os.walk(path):
-            for f in files:
-                if f.lower().endswith(handler.supported_extensions):
-                    print("-" * 40)
-                    handler.process_file(os.path.join(root, f))
-        
-        log_success("扫描完成，等待新文件...")
+        count, elapsed = scan_existing_files(handler, path)
+        rate = count / (elapsed / 60) if elapsed > 0 else 0.0
+        log_success(f"扫描完成：{count} 个文件，耗时 {elapsed:.1f} 秒，吞吐 {rate:.1f} 文件/分钟，等待新文件...")
+        for name, st in handler.pipeline.stats().items():
+            log_info(f"  [{name}] 完成 {st['processed']}，失败 {st['failed']}，累计耗时 {st['busy_seconds']} 秒")
+        if handler.upload_limiter:
+            log_upload_concurrency(handler.upload_limiter)
         while True: obs.join(1)
     except KeyboardInterrupt:
         print("\n")
         log_warning("🛑 强制停止...")
+        ev = handler.coalescer.stats()
+        log_info(f"文件事件：收到 {ev['received']}，合并 {ev['coalesced']}，重复 {ev['duplicates']}，派发 {ev['dispatched']}")
+        api = handler.dify.stats()
+        log_info(f"Dify 请求：{api['requests']} 次，失败 {api['errors']}，重试 {api['retries']}，"
+                 f"平均 {api['avg_ms']} ms，最长 {api['max_ms']} ms")
+        if handler.upload_limiter:
+            log_upload_concurrency(handler.upload_limiter)
+        if handler.indexing_tracker:
+            idx = handler.indexing_tracker.stats()
+            log_info(f"Dify 索引：完成 {idx['completed']}，失败 {idx['failed']}，超时 {idx['timed_out']}，"
+                     f"未完成 {idx['backlog']}；排队→完成平均 {idx['avg_latency']} 秒，最长 {idx['max_latency']} 秒；"
+                     f"积压暂停上传 {idx['throttle_waits']} 次，共 {idx['throttled_seconds']} 秒")
         if monitor: monitor.stop()
         obs.stop()
+        # 先等流水线中正在写日志/元数据的任务结束，再关闭日志与元数据
+        handler.stop_pipeline(timeout=PIPELINE_STOP_TIMEOUT)
+        if logger: logger.close()
+        if mgr: mgr.close()
         # 确保这里使用全局导入的 os
         os._exit(0)
     except Exception as e:
@@ -432,13 +678,38 @@ def main():
     print_header("Dify 上传工具 (PaddleOCR-VL 拦截版)")
     try:
         config = load_config("config.yaml")
-        if config.get('metadata', {}).get('enabled', True):
-            mgr = MetadataManager(config['metadata']['csv_path'], True, {}, config)
+        meta_config = config.get('metadata', {})
+        if meta_config.get('enabled', True):
+            mgr = MetadataManager(config['metadata']['csv_path'], True, {}, config,
+                                  store_path=meta_config.get('store_path') or None,
+                                  export_interval=meta_config.get('csv_export_interval', 60),
+                                  reload_interval=meta_config.get('reload_interval', 5))
         else: mgr = None
         
         logger = None
-        if config.get('database', {}).get('enabled', True):
-            logger = UploadLogger(config['database']['sqlite_path'])
+        db_config = config.get('database', {})
+        if db_config.get('enabled', True):
+            perf_config = config.get('performance') or {}
+            logger = UploadLogger(
+                db_config['sqlite_path'],
+                use_hash_cache=db_config.get('hash_cache', True),
+                hash_algorithm=db_config.get('hash_algorithm', 'md5'),
+                hash_buffer_size=int(db_config.get('hash_buffer_mb', 4) * 1024 * 1024),
+                hash_use_mmap=db_config.get('hash_use_mmap', False),
+                hash_workers=perf_config.get('cpu_workers', os.cpu_count() or 1),
+                use_prefilter=db_config.get('quick_prefilter', True),
+                write_behind=db_config.get('write_behind', False),
+                flush_interval_ms=db_config.get('write_behind_interval_ms', 500),
+                flush_batch_size=db_config.get('write_behind_batch', 100),
+            )
+            if db_config.get('hash_migrate_on_start', False):
+                migrated, missing = logger.migrate_hash_algorithm()
+                if migrated or missing:
+                    log_info(f"哈希算法迁移：更新 {migrated} 条，源文件缺失 {missing} 条")
+            verify_sample = db_config.get('hash_cache_verify_sample', 0)
+            if verify_sample:
+                result = logger.verify_hash_cache(verify_sample)
+                log_info(f"哈希缓存抽检：{result['checked']} 条，不一致 {result['mismatched']}，文件缺失 {result['missing']}")
             
         start_monitoring(config, mgr, logger)
     except Exception as e:
@@ -0,0 +1,172 @@
+"""
+自适应并发模块
+上传并发不固定：请求正常时逐步加一（加性增），遇到 429/503 或超时时按比例减半（乘性减），
+服务端返回 Retry-After 时所有上传暂停到指定时间；统计当前并发上限与成功率
+"""
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from utils.logger import log_info, log_warning
+
+# 表示 Dify 过载的状态码（请求未被处理，可以安全重试）
+OVERLOAD_STATUS = (429, 503)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒数或 HTTP 日期），返回需要等待的秒数；无法解析返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 并发上限：调用方线程数为最大并发，实际同时在途的请求数不超过当前上限"""
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, increase=1.0, decrease=0.5,
+                 latency_target=0, max_retries=3, retry_delay=5):
+        """
+        Args:
+            max_limit: 并发上限的最大值（上传线程数）
+            min_limit: 并发上限的最小值
+            initial_limit: 初始并发上限，默认为 max_limit 的一半
+            increase: 每轮（约 limit 个成功请求）增加的并发数
+            decrease: 过载时并发上限乘以该系数
+            latency_target: 请求耗时超过该值（秒）时不再增加并发；0 表示不按耗时判断
+            max_retries: 429/503 时的最大重试次数
+            retry_delay: 没有 Retry-After 时的重试等待（秒），每次翻倍
+        """
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = min(self.max_limit, max(1, int(min_limit)))
+        initial = initial_limit if initial_limit else self.max_limit / 2
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.increase = float(increase)
+        self.decrease = min(0.95, max(0.1, float(decrease)))
+        self.latency_target = float(latency_target or 0)
+        self.max_retries = max(0, int(max_retries))
+        self.retry_delay = float(retry_delay)
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        # 统计信息
+        self.requests = 0
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.decreases = 0
+        self.retry_after_pauses = 0
+        self.total_seconds = 0.0
+
+    def acquire(self):
+        """
+        等待可用的并发名额（Retry-After 暂停期间也在此等待）
+
+        Returns:
+            开始时间（用于 release）
+        """
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._in_flight < int(self.limit):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self._in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, outcome, retry_after=None):
+        """
+        归还名额并按结果调整并发上限
+
+        Args:
+            started: acquire 返回的开始时间
+            outcome: 'success' / 'overload' / 'error'（其他错误，不调整并发）
+            retry_after: 服务端要求的等待秒数
+        """
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            self.requests += 1
+            self.total_seconds += elapsed
+            old = int(self.limit)
+            if outcome == 'success':
+                self.successes += 1
+                # 只在名额用满时增加（并发未用满说明上限不是瓶颈，增加也验证不了 Dify 能否承受）
+                saturated = self._in_flight + 1 >= int(self.limit)
+                if saturated and (not self.latency_target or elapsed <= self.latency_target):
+                    self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            elif outcome == 'overload':
+                self.overloads += 1
+                # 同一轮在途请求的多次过载只减一次：只有在上次减小之后发出的请求才触发
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+                if retry_after:
+                    self.retry_after_pauses += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            else:
+                self.errors += 1
+            new = int(self.limit)
+            self._cond.notify_all()
+        if new < old:
+            log_warning(f"[并发] Dify 过载，上传并发降至 {new}" + (f"，暂停 {retry_after:g} 秒" if retry_after else ""))
+        elif new > old:
+            log_info(f"[并发] 上传并发升至 {new}")
+
+    def call(self, func, *args, **kwargs):
+        """
+        在并发名额内执行一次请求（func 返回 requests.Response）
+
+        429/503 表示请求未被处理：降低并发，按 Retry-After（或指数退避）等待后重试；
+        读超时时请求可能已被接受，只降低并发、不重试，异常直接抛出
+
+        Returns:
+            最后一次请求的 Response
+        """
+        for attempt in range(self.max_retries + 1):
+            started = self.acquire()
+            try:
+                response = func(*args, **kwargs)
+            except requests.Timeout:
+                self.release(started, 'overload')
+                raise
+            except BaseException:
+                self.release(started, 'error')
+                raise
+            if response.status_code not in OVERLOAD_STATUS:
+                self.release(started, 'success' if response.status_code < 400 else 'error')
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.release(started, 'overload', retry_after)
+            if attempt == self.max_retries:
+                return response
+            if retry_after is None:
+                # 没有 Retry-After：本请求单独退避（带抖动），其他上传不暂停
+                time.sleep(self.retry_delay * (2 ** attempt) * random.uniform(0.8, 1.2))
+        return response
+
+    def stats(self):
+        """统计：当前并发上限、在途请求、成功率、过载次数、平均耗时"""
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self._in_flight,
+                'requests': self.requests,
+                'success_rate': round(self.successes / self.requests * 100, 1) if self.requests else 100.0,
+                'overloads': self.overloads,
+                'errors': self.errors,
+                'decreases': self.decreases,
+                'retry_after_pauses': self.retry_after_pauses,
+                'avg_ms': round(self.total_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+            }
@@ -0,0 +1,254 @@
+"""
+Dify API 客户端
+上传、监控与同步工具共用一个带连接池的 Session：连接复用（keep-alive），
+统一的超时与重试退避策略，并统计请求次数与耗时
+"""
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 可重试的 HTTP 状态码（限流、网关错误）
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def _epoch(doc):
+    """文档的更新时间（旧版接口只有 created_at）"""
+    value = doc.get('updated_at') or doc.get('created_at') or 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class DifyAPIError(Exception):
+    """Dify 接口返回非成功状态"""
+
+    def __init__(self, status_code, text=''):
+        super().__init__(f"HTTP {status_code}: {text[:200]}")
+        self.status_code = status_code
+        self.text = text
+
+
+class DifyClient:
+    def __init__(self, base_url, dataset_id, api_key, pool_size=10, timeout=30,
+                 upload_timeout=300, max_retries=3, backoff_factor=1.0, list_workers=4):
+        """
+        Args:
+            base_url: Dify 地址
+            dataset_id: 知识库 ID
+            api_key: API 密钥
+            pool_size: 连接池大小（不小于上传并发数）
+            timeout: 普通请求超时（秒）
+            upload_timeout: 上传文件请求超时（秒）
+            max_retries: 连接失败、限流或网关错误时的最大重试次数
+            backoff_factor: 重试退避系数，第 n 次重试前等待 backoff_factor * 2^(n-1) 秒
+                            （服务端返回 Retry-After 时以其为准）
+            list_workers: 获取文档列表时同时在途的页数（1 表示逐页顺序获取）
+        """
+        self.base_url = base_url.rstrip('/')
+        self.dataset_id = dataset_id
+        self.dataset_url = f"{self.base_url}/v1/datasets/{dataset_id}"
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.list_workers = max(1, int(list_workers))
+
+        # 上传接口不幂等：POST 只重试连接失败（请求未发出），不按状态码/读超时重试
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, self.list_workers), max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {api_key}'
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._retries = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config, pool_size=None):
+        """
+        根据配置创建客户端
+
+        Args:
+            config: 完整配置（读取 dify 与 performance.timeout）
+            pool_size: 连接池大小，默认读取 dify.pool_size
+        """
+        dify_config = config['dify']
+        perf_config = config.get('performance') or {}
+        return cls(
+            dify_config['base_url'],
+            dify_config['dataset_id'],
+            dify_config['api_key'],
+            pool_size=pool_size or int(dify_config.get('pool_size', 10)),
+            timeout=dify_config.get('timeout', 30),
+            upload_timeout=perf_config.get('timeout', 300),
+            max_retries=int(dify_config.get('max_retries', 3)),
+            backoff_factor=float(dify_config.get('retry_backoff', 1.0)),
+            list_workers=int(dify_config.get('list_workers', 4)),
+        )
+
+    def request(self, method, path, **kwargs):
+        """
+        发送请求（path 相对于知识库地址，如 /documents）
+
+        Returns:
+            requests.Response；重试耗尽后的异常直接抛出
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, f"{self.dataset_url}{path}", **kwargs)
+            return response
+        finally:
+            self._record(time.perf_counter() - start, response)
+
+    def _record(self, elapsed, response):
+        retries = 0
+        if response is not None:
+            history = getattr(getattr(response.raw, 'retries', None), 'history', None)
+            retries = len(history) if history else 0
+        with self._stats_lock:
+            self._requests += 1
+            self._retries += retries
+            if response is None or response.status_code >= 400:
+                self._errors += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+
+    def list_documents(self, page, limit=100):
+        """
+        获取一页文档
+
+        Returns:
+            接口返回的 JSON（data / has_more / total 等）
+        """
+        response = self.request('GET', '/documents', params={'page': page, 'limit': limit})
+        if response.status_code != 200:
+            raise DifyAPIError(response.status_code, response.text)
+        return response.json()
+
+    def iter_documents(self, limit=100, workers=None, on_page=None, dedupe=True):
+        """
+        逐个产出全部文档 {'id': ..., 'name': ..., 'updated_at': epoch 秒}
+
+        首页返回 total 时，其余页并发获取（最多 workers 页同时在途），仍按页序产出；
+        没有 total 时逐页顺序获取。获取期间文档增减导致的跨页重复按 ID 去重
+
+        Args:
+            limit: 每页条数
+            workers: 同时在途的页数，默认 list_workers
+            on_page: 每页产出后的回调 on_page(页码, 本页文档数)
+            dedupe: 是否按 ID 去重（需在内存中保留全部 ID；调用方自行去重时可关闭）
+        """
+        workers = max(1, self.list_workers if workers is None else workers)
+        seen = set() if dedupe else None
+        first = self.list_documents(1, limit)
+        count = yield from self._emit_page(1, first, seen, on_page)
+        if count < limit:
+            return
+
+        page = 2
+        total = first.get('total')
+        if isinstance(total, int) and workers > 1:
+            last_page = -(-total // limit)
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dify-list') as pool:
+                try:
+                    while pending or page <= last_page:
+                        while page <= last_page and len(pending) < workers:
+                            pending.append((page, pool.submit(self.list_documents, page, limit)))
+                            page += 1
+                        current, future = pending.popleft()
+                        count = yield from self._emit_page(current, future.result(), seen, on_page)
+                finally:
+                    for _, future in pending:
+                        future.cancel()
+            if count < limit:
+                return
+
+        # 没有 total，或并发获取期间文档数增加：继续逐页获取到不满一页为止
+        while True:
+            count = yield from self._emit_page(page, self.list_documents(page, limit), seen, on_page)
+            if count < limit:
+                return
+            page += 1
+
+    @staticmethod
+    def _emit_page(page, data, seen, on_page):
+        documents = data.get('data') or []
+        for doc in documents:
+            doc_id = doc.get('id')
+            if doc_id and (seen is None or doc_id not in seen):
+                if seen is not None:
+                    seen.add(doc_id)
+                yield {'id': doc_id, 'name': doc.get('name', ''), 'updated_at': _epoch(doc)}
+        if on_page:
+            on_page(page, len(documents))
+        return len(documents)
+
+    def list_all_documents(self, limit=100, on_page=None):
+        """
+        获取全部文档
+
+        Returns:
+            [{'id': ..., 'name': ..., 'updated_at': ...}, ...]
+        """
+        return list(self.iter_documents(limit, on_page=on_page))
+
+    def get_indexing_status(self, batch):
+        """
+        查询一个上传批次的索引进度
+
+        Returns:
+            [{'id', 'indexing_status', 'processing_started_at', 'completed_at', 'error', ...}, ...]
+        """
+        response = self.request('GET', f'/documents/{batch}/indexing-status')
+        if response.status_code != 200:
+            raise DifyAPIError(response.status_code, response.text)
+        return response.json().get('data') or []
+
+    def create_document_by_file(self, file_path, file_name, data, mime_type='text/markdown'):
+        """
+        上传文件创建文档
+
+        Returns:
+            requests.Response
+        """
+        with open(file_path, 'rb') as fh:
+            files = [('file', (file_name, fh, mime_type)),
+                     ('data', (None, json.dumps(data), 'application/json'))]
+            return self.request('POST', '/document/create-by-file', files=files, timeout=self.upload_timeout)
+
+    def stats(self):
+        """请求统计：次数、失败、重试、平均/最大耗时（毫秒）"""
+        with self._stats_lock:
+            count = self._requests
+            return {
+                'requests': count,
+                'errors': self._errors,
+                'retries': self._retries,
+                'avg_ms': round(self._total_seconds / count * 1000, 1) if count else 0.0,
+                'max_ms': round(self._max_seconds * 1000, 1),
+            }
+
+    def close(self):
+        self.session.close()
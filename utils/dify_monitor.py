@@ -3,15 +3,18 @@ Dify 知识库实时监控模块
 定期检查 Dify 知识库变化，自动同步删除本地元数据
 """
 import threading
-import time
+from datetime import datetime
 import requests
+from utils.dify_client import DifyClient, DifyAPIError
+from utils.poll_scheduler import AdaptivePollScheduler
+from utils.monitor_snapshot import MonitorSnapshot, ADDED, REMOVED, RENAMED
 from utils.logger import log_info, log_success, log_warning, log_error
 
 
 class DifyMonitor(threading.Thread):
     """Dify 知识库监控线程"""
     
-    def __init__(self, config, upload_logger, metadata_manager, check_interval=60):
+    def __init__(self, config, upload_logger, metadata_manager, check_interval=60, dify_client=None):
         """
         初始化 Dify 监控器
         
@@ -19,7 +22,9 @@ class DifyMonitor(threading.Thread):
             config: 配置字典
             upload_logger: 上传日志管理器
             metadata_manager: 元数据管理器
-            check_interval: 检查间隔（秒），默认 60 秒
+            check_interval: 基准检查间隔（秒），默认 60 秒；实际间隔由自适应调度器在
+                            monitor.min_interval ~ monitor.max_interval 之间调整
+            dify_client: 共用的 DifyClient（默认按配置新建）
         """
         super().__init__()
         self.daemon = True  # 设为守护线程，主程序退出时自动结束
@@ -29,90 +34,54 @@ class DifyMonitor(threading.Thread):
         self.check_interval = check_interval
         self.running = False
         
-        # Dify API 配置
-        self.base_url = config['dify']['base_url']
-        self.dataset_id = config['dify']['dataset_id']
-        self.api_key = config['dify']['api_key']
-        self.headers = {'Authorization': f'Bearer {self.api_key}'}
-        self.url = f"{self.base_url}/v1/datasets/{self.dataset_id}/documents"
+        # Dify API（连接复用、重试退避由客户端统一处理）
+        self.dify = dify_client or DifyClient.from_config(config)
         
-        # 缓存当前文档列表（用于检测变化）
-        self.current_doc_ids = set()
-        self.current_doc_names = set()
-        self.current_docs_map = {}  # {doc_id: doc_name} 映射，用于调试
-        self.last_documents = []    # 最近一次成功获取的完整文档列表
+        # 自适应轮询：无变化时逐步拉长间隔，有变化或本地上传后恢复最小间隔
+        monitor_config = config.get('monitor') or {}
+        self.scheduler = AdaptivePollScheduler(
+            min_interval=monitor_config.get('min_interval', check_interval),
+            max_interval=monitor_config.get('max_interval', check_interval * 30),
+            backoff=monitor_config.get('backoff', 2.0),
+            jitter=monitor_config.get('jitter', 0.2),
+            baseline_interval=check_interval,
+        )
+        self._pages_fetched = 0
+        
+        # 上次看到的文档列表持久化到 SQLite（默认与上传日志同库），重启后与之比较
+        snapshot_path = (monitor_config.get('snapshot_path')
+                         or config.get('database', {}).get('sqlite_path')
+                         or './upload_log.db')
+        self.snapshot = MonitorSnapshot(snapshot_path)
         
         # 统计信息
         self.check_count = 0
         self.total_deleted = 0
     
-    def get_dify_documents(self):
-        """从 Dify 获取所有文档信息"""
+    def stage_dify_documents(self):
+        """
+        从 Dify 获取所有文档（分页并发获取），边获取边写入快照暂存表（按主键去重），
+        不在内存中保留文档列表
+        
+        Returns:
+            文档数；获取失败返回 None（丢弃暂存，本轮不比较，保持上次状态）
+        """
+        def count_page(page, count):
+            self._pages_fetched += 1
+        
         try:
-            all_documents = []
-            page = 1
-            
-            while True:
-                response = None
-                for attempt in range(1, 4):
-                    try:
-                        response = requests.get(
-                            self.url,
-                            headers=self.headers,
-                            params={'page': page, 'limit': 100},
-                            timeout=30
-                        )
-                        if response.status_code == 200:
-                            break
-                        log_warning(
-                            f"[监控] 获取 Dify 文档列表失败: HTTP {response.status_code} (尝试 {attempt}/3)"
-                        )
-                        log_warning(f"[监控] 响应: {response.text[:200]}")
-                    except requests.RequestException as req_err:
-                        log_warning(
-                            f"[监控] 请求异常 (尝试 {attempt}/3): {str(req_err)[:200]}"
-                        )
-                    time.sleep(min(5 * attempt, self.check_interval))
-                else:
-                    if self.last_documents:
-                        log_warning("[监控] 多次尝试获取 Dify 文档列表仍失败，使用上一次成功的结果")
-                        # 增加冷却时间，避免频繁请求
-                        time.sleep(30)
-                        return list(self.last_documents)
-                    log_error("[监控] 多次尝试获取 Dify 文档列表仍失败，放弃本轮同步")
-                    # 增加冷却时间
-                    time.sleep(30)
-                    return None
-                
-                if response is None:
-                    return None
-
-                data = response.json()
-                documents = data.get('data', [])
-                
-                if not documents:
-                    break
-                
-                for doc in documents:
-                    if doc.get('id'):
-                        all_documents.append({
-                            'id': doc.get('id'),
-                            'name': doc.get('name', '')
-                        })
-                
-                if len(documents) < 100:
-                    break
-                
-                page += 1
-            
-            self.last_documents = list(all_documents)
-            return all_documents
-            
+            return self.snapshot.stage(
+                (doc['id'], self.process_document_name(doc['name']), doc['updated_at'])
+                for doc in self.dify.iter_documents(on_page=count_page, dedupe=False)
+            )
+        except (DifyAPIError, requests.RequestException) as e:
+            # 客户端已按退避策略重试
+            log_warning(f"[监控] 获取 Dify 文档列表失败: {str(e)[:200]}")
+            # 放弃本轮，由调度器拉长下次检查的间隔
+            log_error("[监控] 多次尝试获取 Dify 文档列表仍失败，放弃本轮同步")
+            return None
         except Exception as e:
             log_warning(f"[监控] 获取文档列表出错: {e}")
-            if self.last_documents:
-                log_warning("[监控] 使用缓存的文档列表继续")
-                return list(self.last_documents)
             return None
     
     def process_document_name(self, name):
@@ -138,33 +107,20 @@ class DifyMonitor(threading.Thread):
         # 1. 同步数据库（通过文档 ID 精确删除）
         db_deleted = 0
         if self.upload_logger and deleted_doc_ids:
-            for doc_id in deleted_doc_ids:
-                if self.upload_logger.delete_by_dify_doc_id(doc_id):
-                    db_deleted += 1
+            db_deleted = self.upload_logger.delete_by_dify_doc_ids(deleted_doc_ids)
             log_info(f"[监控] 数据库删除：{db_deleted}/{len(deleted_doc_ids)} 条")
         
         # 2. 同步元数据表（通过文件名匹配删除）
         csv_deleted = 0
         if self.metadata_manager and deleted_doc_names:
-            local_titles = self.metadata_manager.get_all_titles()
             to_delete = []
             
             for deleted_name in deleted_doc_names:
-                # 标准化删除的文档名
-                normalized_deleted = deleted_name.replace('《', '').replace('》', '').replace('（', '').replace('）', '').strip()
-                
-                # 在本地元数据中查找匹配的记录
-                for title in local_titles:
-                    normalized_title = title.replace('《', '').replace('》', '').replace('（', '').replace('）', '').strip()
-                    
-                    # 匹配规则：完全匹配或包含关系
-                    if (normalized_title == normalized_deleted or 
-                        normalized_deleted in normalized_title or 
-                        normalized_title in normalized_deleted):
-                        if title not in to_delete:
-                            to_delete.append(title)
-                            log_info(f"[监控] 匹配元数据：'{deleted_name}' → '{title}'")
-                        break
+                # 在本地元数据索引中查找：完全匹配优先，其次包含关系
+                matches = self.metadata_manager.match_titles(deleted_name)
+                if matches and matches[0] not in to_delete:
+                    to_delete.append(matches[0])
+                    log_info(f"[监控] 匹配元数据：'{deleted_name}' → '{matches[0]}'")
             
             if to_delete:
                 csv_deleted = self.metadata_manager.delete_by_titles(to_delete)
@@ -174,48 +130,125 @@ class DifyMonitor(threading.Thread):
         
         return db_deleted, csv_deleted
     
+    def _carry_renamed_metadata(self, renamed):
+        """
+        文档在 Dify 中改名：把旧名称的元数据复制到新名称（旧记录随后按删除流程清理）
+        
+        Returns:
+            没有可复制元数据的新名称（按新增文档处理）
+        """
+        if not self.metadata_manager:
+            return [new_name for _, new_name in renamed]
+        without_metadata = []
+        carried = 0
+        # 同一批写入只发布一次元数据快照
+        with self.metadata_manager.batch():
+            for old_name, new_name in renamed:
+                if self.metadata_manager.get_by_title(new_name):
+                    continue
+                old_meta = self.metadata_manager.get_by_title(old_name)
+                if old_meta and self.metadata_manager.add_metadata(dict(old_meta, title=new_name, id='')):
+                    carried += 1
+                    log_info(f"[监控]   改名：{old_name} → {new_name}")
+                else:
+                    without_metadata.append(new_name)
+        if carried:
+            log_success(f"[监控] ✅ 改名文档沿用原元数据：{carried} 条")
+        return without_metadata
+    
+    def _create_default_metadata(self, names):
+        """为 Dify 中新增的文档创建默认元数据（只添加到元数据表，没有原始文件不记录数据库）"""
+        if not self.metadata_manager:
+            return
+        default_config = self.config.get('metadata', {}).get('default', {})
+        added_count = 0
+        skipped_count = 0
+        # 同一批写入只发布一次元数据快照
+        with self.metadata_manager.batch():
+            for processed_name in dict.fromkeys(names):
+                # 检查元数据是否已存在
+                if self.metadata_manager.get_by_title(processed_name):
+                    skipped_count += 1
+                    continue
+                default_meta = {
+                    'title': processed_name,
+                    'source': default_config.get('source', '未知来源'),
+                    'keywords': default_config.get('keywords', ''),
+                    'year': datetime.now().year,
+                    'region': default_config.get('region', '全国'),
+                    'type': default_config.get('type', '政策文件'),
+                    'category': '其他',
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+                if self.metadata_manager.add_metadata(default_meta):
+                    added_count += 1
+                    log_info(f"[监控]   创建：{processed_name}")
+        
+        if added_count > 0:
+            log_success(f"[监控] ✅ 自动创建元数据：{added_count} 条")
+        if skipped_count > 0:
+            log_info(f"[监控] 跳过已存在的元数据：{skipped_count} 条")
+    
     def check_for_changes(self):
-        """检查 Dify 知识库变化"""
+        """
+        检查 Dify 知识库变化
+        
+        Returns:
+            是否检测到文档新增、删除、改名或更新
+        """
+        changed = False
         try:
-            # 获取当前文档列表
-            current_docs = self.get_dify_documents()
-            if current_docs is None:
-                return
+            # 从未保存过快照（首次运行）：只记录状态
+            initializing = self.snapshot.saved_at() is None
             
-            # 构建当前文档的 ID、名称集合和映射
-            current_ids = set()
-            current_names = set()
-            current_docs_map = {}
+            # 文档流式写入暂存表
+            doc_count = self.stage_dify_documents()
+            if doc_count is None:
+                return False
             
-            for doc in current_docs:
-                doc_id = doc['id']
-                doc_name = doc['name']
-                processed_name = self.process_document_name(doc_name)
-                
-                current_ids.add(doc_id)
-                current_names.add(processed_name)
-                current_docs_map[doc_id] = processed_name
-            
-            # 首次运行，只记录状态
-            if self.check_count == 0:
-                self.current_doc_ids = current_ids
-                self.current_doc_names = current_names
-                self.current_docs_map = current_docs_map
-                log_info(f"[监控] 初始化完成，当前 {len(current_docs)} 个文档")
+            if initializing:
+                self.snapshot.commit()
+                log_info(f"[监控] 初始化完成，当前 {doc_count} 个文档")
                 self.check_count += 1
-                return
+                return False
+            if self.check_count == 0:
+                log_info(f"[监控] 与上次保存的快照比较停机期间的变化（当前 {doc_count} 个文档）")
+            
+            # 与快照比较：内存中只保留变化的文档
+            deleted_docs = {}   # {doc_id: 文档名}
+            added_names = []
+            renamed = []        # [(旧名称, 新名称)]
+            updated_count = 0
+            for event in self.snapshot.diff():
+                if event.kind == REMOVED:
+                    deleted_docs[event.doc_id] = event.old_name
+                elif event.kind == ADDED:
+                    added_names.append(event.name)
+                elif event.kind == RENAMED:
+                    renamed.append((event.old_name, event.name))
+                else:
+                    updated_count += 1
             
-            # 检测删除的文档
-            deleted_ids = self.current_doc_ids - current_ids
-            deleted_names = self.current_doc_names - current_names
+            if updated_count:
+                changed = True
+                log_info(f"[监控] 检测到文档更新：{updated_count} 个")
+            if renamed:
+                changed = True
+                log_info(f"[监控] 检测到文档改名：{len(renamed)} 个")
+                added_names.extend(self._carry_renamed_metadata(renamed))
+            
+            # 删除或改名后已没有文档使用的旧名称
+            old_names = list(deleted_docs.values()) + [old for old, _ in renamed]
+            deleted_ids = set(deleted_docs)
+            deleted_names = set(old_names) - self.snapshot.staged_names(old_names)
             
             if deleted_ids or deleted_names:
+                changed = True
                 log_warning(f"[监控] 检测到文档删除：{len(deleted_ids)} 个文档")
                 
-                # 显示删除的文档名（从缓存的映射中获取）
+                # 显示删除的文档名（快照中记录的名称）
                 deleted_doc_info = []
-                for doc_id in deleted_ids:
-                    doc_name = self.current_docs_map.get(doc_id, '未知')
+                for doc_id, doc_name in deleted_docs.items():
                     deleted_doc_info.append(f"{doc_name} ({doc_id[:8]}...)")
                 
                 if deleted_doc_info:
@@ -233,81 +266,53 @@ class DifyMonitor(threading.Thread):
                     self.total_deleted += db_deleted + csv_deleted
                 else:
                     log_warning(f"[监控] ⚠️ 未删除任何本地记录（可能已经同步或未找到匹配）")
-                
-                # 更新缓存
-                self.current_doc_ids = current_ids
-                self.current_doc_names = current_names
-                self.current_docs_map = current_docs_map
             
             # 检测新增的文档并创建默认元数据
-            added_ids = current_ids - self.current_doc_ids
-            if added_ids:
-                log_info(f"[监控] 检测到新文档：{len(added_ids)} 个")
-                
-                # 为新增文档创建默认元数据
-                added_count = 0
-                skipped_count = 0
-                for doc in current_docs:
-                    if doc['id'] in added_ids:
-                        doc_name = doc['name']
-                        processed_name = self.process_document_name(doc_name)
-                        
-                        # 检查元数据是否已存在
-                        existing = self.metadata_manager.get_by_title(processed_name)
-                        if not existing:
-                            # 从配置中获取默认值
-                            default_config = self.config.get('metadata', {}).get('default', {})
-                            
-                            # 创建默认元数据
-                            from datetime import datetime
-                            default_meta = {
-                                'title': processed_name,
-                                'source': default_config.get('source', '未知来源'),
-                                'keywords': default_config.get('keywords', ''),
-                                'year': datetime.now().year,
-                                'region': default_config.get('region', '全国'),
-                                'type': default_config.get('type', '政策文件'),
-                                'category': '其他',
-                                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            }
-                            
-                            # 只添加到元数据表（不记录到数据库，因为没有原始文件）
-                            if self.metadata_manager.add_metadata(default_meta):
-                                added_count += 1
-                                log_info(f"[监控]   创建：{processed_name}")
-                        else:
-                            skipped_count += 1
-                
-                if added_count > 0:
-                    log_success(f"[监控] ✅ 自动创建元数据：{added_count} 条")
-                if skipped_count > 0:
-                    log_info(f"[监控] 跳过已存在的元数据：{skipped_count} 条")
-                
-                # 更新缓存
-                self.current_doc_ids = current_ids
-                self.current_doc_names = current_names
-                self.current_docs_map = current_docs_map
+            if added_names:
+                changed = True
+                log_info(f"[监控] 检测到新文档：{len(added_names)} 个")
+                self._create_default_metadata(added_names)
             
+            # 本地同步完成后再替换快照（中途出错时丢弃暂存，下次重新比较）
+            self.snapshot.commit()
             self.check_count += 1
             
         except Exception as e:
             log_error(f"[监控] 检查变化时出错: {e}")
+            self.snapshot.discard()
+        return changed
+    
+    def notify_activity(self):
+        """本地上传了文档：尽快检查（恢复最小间隔）"""
+        self.scheduler.notify_activity()
     
     def run(self):
         """运行监控线程"""
         self.running = True
-        log_info(f"[监控] Dify 知识库监控已启动，间隔 {self.check_interval} 秒")
+        scheduler = self.scheduler
+        log_info(f"[监控] Dify 知识库监控已启动，间隔 {scheduler.min_interval:g}~{scheduler.max_interval:g} 秒（自适应）")
         
         try:
             while self.running:
-                self.check_for_changes()
-                time.sleep(self.check_interval)
+                self._pages_fetched = 0
+                changed = self.check_for_changes()
+                scheduler.record_check(changed, max(1, self._pages_fetched))
+                if not scheduler.wait():
+                    break
         except Exception as e:
             log_error(f"[监控] 监控线程异常: {e}")
         finally:
-            log_info(f"[监控] 已停止（检查 {self.check_count} 次，同步删除 {self.total_deleted} 条）")
+            api = self.dify.stats()
+            poll = scheduler.stats()
+            log_info(f"[监控] 已停止（检查 {self.check_count} 次，同步删除 {self.total_deleted} 条；"
+                     f"Dify 请求 {api['requests']} 次，平均 {api['avg_ms']} ms）")
+            log_info(f"[监控] 自适应轮询：无变化 {poll['idle_checks']} 次，当前间隔 {poll['interval']} 秒，"
+                     f"相对固定 {self.check_interval} 秒间隔节省请求 {poll['api_calls_saved']} 次"
+                     f"（{poll['saved_per_hour']} 次/小时）")
+            self.snapshot.close()
     
     def stop(self):
         """停止监控"""
         self.running = False
+        self.scheduler.cancel()
         log_info("[监控] 正在停止 Dify 监控...")
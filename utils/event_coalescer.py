@@ -0,0 +1,172 @@
+"""
+文件事件合并模块
+将同一路径的连续 created/modified 事件合并，待文件大小与修改时间
+在静默期内保持不变（写入完成）后只派发一次
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from utils.logger import log_warning, log_error
+
+
+class EventCoalescer:
+    """写入稳定后派发的事件合并器"""
+
+    def __init__(self, dispatch, quiet_period=5.0, poll_interval=1.0,
+                 max_pending=10000, max_history=10000, history_ttl=3600):
+        """
+        Args:
+            dispatch: 派发回调 dispatch(path)
+            quiet_period: 静默期（秒），大小与 mtime 在此期间不变才视为写入完成
+            poll_interval: 检查间隔（秒）
+            max_pending: 最多同时跟踪的待定路径数（超出时最早的路径立即派发）
+            max_history: 最多保留的已派发记录数（用于过滤重复事件）
+            history_ttl: 已派发记录的保留时间（秒）
+        """
+        self.dispatch = dispatch
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self.max_pending = max(1, int(max_pending))
+        self.max_history = max(1, int(max_history))
+        self.history_ttl = history_ttl
+
+        self._pending = OrderedDict()   # path -> [signature, last_change]
+        self._history = OrderedDict()   # path -> (signature, dispatched_at)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # 统计信息
+        self.received = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self.duplicates = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def notify(self, path):
+        """
+        记录一次文件事件（通常不做 IO，可在 watchdog 线程中直接调用）
+
+        待定路径超过 max_pending 时，最早的路径不再等待静默期，立即在当前线程派发
+        （派发回调阻塞时事件源也随之等待，形成背压），不会丢失
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.received += 1
+            entry = self._pending.get(path)
+            if entry is not None:
+                entry[1] = now
+                self._pending.move_to_end(path)
+                self.coalesced += 1
+                return
+            evicted = None
+            if len(self._pending) >= self.max_pending:
+                evicted, _ = self._pending.popitem(last=False)
+                self.evicted += 1
+            self._pending[path] = [None, now]
+        if evicted is not None:
+            log_warning(f"待定事件过多，提前派发最早的路径: {os.path.basename(evicted)}")
+            self._dispatch_now(evicted, now)
+
+    def _dispatch_now(self, path, now):
+        """不等静默期直接派发（文件已不存在时跳过）"""
+        current = self._signature(path)
+        if current is None:
+            return
+        with self._lock:
+            self._history[path] = (current, now)
+            self._history.move_to_end(path)
+            self.dispatched += 1
+        try:
+            self.dispatch(path)
+        except Exception as e:
+            log_error(f"派发文件事件失败: {e}")
+
+    def poll(self, now=None):
+        """检查所有待定路径，派发已写入完成的文件，返回派发数"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            items = list(self._pending.items())
+
+        ready = []
+        for path, _ in items:
+            current = self._signature(path)
+            with self._lock:
+                entry = self._pending.get(path)
+                if entry is None:
+                    continue
+                if current is None:
+                    # 文件已被删除或移走
+                    del self._pending[path]
+                    continue
+                if current != entry[0]:
+                    entry[0] = current
+                    entry[1] = max(entry[1], now)
+                    continue
+                if now - entry[1] < self.quiet_period:
+                    continue
+                del self._pending[path]
+                previous = self._history.get(path)
+                if previous and previous[0] == current:
+                    self.duplicates += 1
+                    continue
+                self._history[path] = (current, now)
+                self._history.move_to_end(path)
+                self.dispatched += 1
+                ready.append(path)
+        self._trim_history(now)
+
+        for path in ready:
+            try:
+                self.dispatch(path)
+            except Exception as e:
+                log_error(f"派发文件事件失败: {e}")
+        return len(ready)
+
+    def _trim_history(self, now):
+        with self._lock:
+            while len(self._history) > self.max_history:
+                self._history.popitem(last=False)
+            while self._history:
+                path, (_, dispatched_at) = next(iter(self._history.items()))
+                if now - dispatched_at <= self.history_ttl:
+                    break
+                del self._history[path]
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.poll()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="event-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'dispatched': self.dispatched,
+                'duplicates': self.duplicates,
+                'evicted': self.evicted,
+                'pending': len(self._pending),
+                'history': len(self._history),
+            }
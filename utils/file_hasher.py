@@ -0,0 +1,113 @@
+"""
+文件哈希计算模块
+大块读取（或 mmap）减少 Python 层调用次数，支持多种算法，
+并可用线程池并行计算多个文件（hashlib 在计算时会释放 GIL）
+"""
+import os
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+DEFAULT_ALGORITHM = 'md5'
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+QUICK_EDGE_SIZE = 64 * 1024
+SUPPORTED_ALGORITHMS = ('md5', 'sha1', 'sha256', 'blake2b', 'xxh64', 'xxh3_128')
+
+
+def new_hasher(algorithm):
+    """创建哈希对象"""
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    if algorithm in ('xxh64', 'xxh3_128'):
+        if not XXHASH_AVAILABLE:
+            raise ValueError(f"哈希算法 {algorithm} 需要安装 xxhash: pip install xxhash")
+        return getattr(xxhash, algorithm)()
+    if algorithm in ('md5', 'sha1', 'sha256'):
+        return hashlib.new(algorithm)
+    raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+
+def quick_fingerprint(file_path, edge_size=QUICK_EDGE_SIZE):
+    """
+    计算文件的快速指纹：文件大小 + 首尾各 edge_size 字节的哈希
+
+    只读取少量数据，用于在完整哈希之前快速排除新文件；
+    指纹相同不代表内容相同，仍需完整哈希确认
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        hasher = hashlib.blake2b(digest_size=16)
+        if size <= edge_size * 2:
+            hasher.update(f.read())
+        else:
+            hasher.update(f.read(edge_size))
+            f.seek(size - edge_size)
+            hasher.update(f.read(edge_size))
+    return f"{size}:{hasher.hexdigest()}"
+
+
+class FileHasher:
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, buffer_size=DEFAULT_BUFFER_SIZE,
+                 use_mmap=False, max_workers=4):
+        """
+        Args:
+            algorithm: 哈希算法，见 SUPPORTED_ALGORITHMS；xxhash 未安装时回退到 blake2b
+            buffer_size: 每次读取的字节数
+            use_mmap: 是否使用 mmap 读取
+            max_workers: 批量计算时的线程数
+        """
+        if algorithm.startswith('xxh') and not XXHASH_AVAILABLE:
+            print(f"⚠️ 未安装 xxhash，哈希算法 {algorithm} 回退为 blake2b")
+            algorithm = 'blake2b'
+        new_hasher(algorithm)  # 提前校验算法名
+        self.algorithm = algorithm
+        self.buffer_size = max(64 * 1024, int(buffer_size))
+        self.use_mmap = use_mmap
+        self.max_workers = max(1, int(max_workers))
+
+    def hash_file(self, file_path):
+        """计算单个文件的哈希（十六进制字符串），失败时抛出 OSError"""
+        hasher = new_hasher(self.algorithm)
+        with open(file_path, 'rb') as f:
+            if self.use_mmap and os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        for offset in range(0, len(mm), self.buffer_size):
+                            hasher.update(view[offset:offset + self.buffer_size])
+                    finally:
+                        view.release()
+            else:
+                buf = bytearray(self.buffer_size)
+                view = memoryview(buf)
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    hasher.update(view[:n])
+        return hasher.hexdigest()
+
+    def hash_many(self, file_paths):
+        """
+        并行计算多个文件的哈希
+
+        Returns:
+            {file_path: hash}，计算失败的文件值为 None
+        """
+        def _safe_hash(path):
+            try:
+                return self.hash_file(path)
+            except OSError:
+                return None
+
+        file_paths = list(file_paths)
+        if len(file_paths) <= 1 or self.max_workers == 1:
+            return {p: _safe_hash(p) for p in file_paths}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hash") as pool:
+            return dict(zip(file_paths, pool.map(_safe_hash, file_paths)))
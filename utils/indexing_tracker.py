@@ -0,0 +1,244 @@
+"""
+索引进度跟踪模块
+上传接口返回后文档还在 Dify 的索引队列中：记录返回的批次号，后台线程一轮查询所有未完成的批次，
+把最终状态与排队→完成的耗时写入上传日志；排队中的文档过多时让新的上传等待
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from utils.dify_client import DifyAPIError
+from utils.logger import log_info, log_success, log_warning, log_error
+
+# 索引结束的状态（其余为 waiting / parsing / cleaning / splitting / indexing / paused）
+FINAL_STATUSES = ('completed', 'error')
+
+
+class IndexingTracker(threading.Thread):
+    """索引进度跟踪线程"""
+
+    def __init__(self, dify_client, upload_logger=None, poll_interval=5, max_backlog=50,
+                 timeout=3600, workers=4):
+        """
+        Args:
+            dify_client: 共用的 DifyClient
+            upload_logger: 上传日志管理器（为 None 时只在内存中跟踪）
+            poll_interval: 查询间隔（秒）
+            max_backlog: 未完成索引的文档数达到该值时新的上传等待，降到 80% 以下后继续；0 表示不限制
+            timeout: 超过该时间（秒）仍未完成的文档记为 timeout，不再跟踪
+            workers: 同时查询的批次数
+        """
+        super().__init__(name='indexing-tracker')
+        self.daemon = True
+        self.dify = dify_client
+        self.upload_logger = upload_logger
+        self.poll_interval = max(0.1, float(poll_interval))
+        self.max_backlog = max(0, int(max_backlog))
+        self.resume_backlog = int(self.max_backlog * 0.8)
+        self.timeout = float(timeout)
+        self.workers = max(1, int(workers))
+        self.running = False
+
+        self._pending = {}  # {batch: {doc_id: (上传返回时间, 文件路径)}}
+        self._backlog = 0
+        self._cond = threading.Condition()
+
+        # 统计信息
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.throttle_waits = 0
+        self.throttled_seconds = 0.0
+
+    @property
+    def backlog(self):
+        """未完成索引的文档数"""
+        return self._backlog
+
+    def track(self, doc_id, batch, file_path=None, queued_at=None):
+        """上传成功后登记文档"""
+        queued_at = queued_at or time.time()
+        if self.upload_logger:
+            try:
+                self.upload_logger.track_indexing(doc_id, batch, file_path, queued_at)
+            except Exception as e:
+                log_warning(f"[索引] 记录索引任务失败: {e}")
+        self._add(doc_id, batch, file_path, queued_at)
+
+    def _add(self, doc_id, batch, file_path, queued_at):
+        with self._cond:
+            docs = self._pending.setdefault(batch, {})
+            if doc_id not in docs:
+                self._backlog += 1
+            docs[doc_id] = (queued_at, file_path)
+            self._cond.notify_all()
+
+    def wait_for_capacity(self):
+        """
+        排队索引的文档过多时阻塞，直到降到 max_backlog 的 80% 以下（跟踪线程未运行时不等待）
+
+        Returns:
+            等待的秒数
+        """
+        with self._cond:
+            if not self.max_backlog or self._backlog < self.max_backlog or not self.running:
+                return 0.0
+            self.throttle_waits += 1
+            log_warning(f"[索引] Dify 索引积压 {self._backlog} 个文档，暂停上传...")
+            start = time.monotonic()
+            while self.running and self._backlog >= max(1, self.resume_backlog):
+                self._cond.wait(self.poll_interval)
+            waited = time.monotonic() - start
+            self.throttled_seconds += waited
+        log_info(f"[索引] 积压降至 {self._backlog} 个，继续上传（等待 {waited:.1f} 秒）")
+        return waited
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def _resume(self):
+        """继续跟踪上次运行时未完成的文档"""
+        if not self.upload_logger:
+            return
+        try:
+            pending = self.upload_logger.get_pending_indexing()
+        except Exception as e:
+            log_warning(f"[索引] 读取未完成的索引任务失败: {e}")
+            return
+        for doc_id, batch, file_path, queued_at in pending:
+            self._add(doc_id, batch, file_path, queued_at)
+        if pending:
+            log_info(f"[索引] 继续跟踪上次未完成索引的文档：{len(pending)} 个")
+
+    def _fetch(self, batch):
+        try:
+            return self.dify.get_indexing_status(batch)
+        except DifyAPIError as e:
+            # 批次不存在（文档已在 Dify 中删除）
+            if e.status_code == 404:
+                return None
+            return e
+        except requests.RequestException as e:
+            return e
+
+    def poll_once(self, executor=None):
+        """
+        查询所有未完成批次的进度，写入结束的文档
+
+        Returns:
+            本轮结束（完成、出错或超时）的文档数
+        """
+        with self._cond:
+            batches = {batch: dict(docs) for batch, docs in self._pending.items()}
+        if not batches:
+            return 0
+
+        if executor:
+            responses = list(executor.map(self._fetch, batches))
+        else:
+            responses = [self._fetch(batch) for batch in batches]
+
+        now = time.time()
+        results = []
+        finished = []
+        errors = 0
+        for (batch, docs), data in zip(batches.items(), responses):
+            if data is None:
+                for doc_id in docs:
+                    results.append((doc_id, 'missing', now, None, None, None))
+                    finished.append((batch, doc_id))
+                continue
+            if isinstance(data, Exception):
+                errors += 1
+                data = []
+            statuses = {item.get('id'): item for item in data}
+            for doc_id, (queued_at, file_path) in docs.items():
+                item = statuses.get(doc_id)
+                status = item.get('indexing_status') if item else None
+                if status in FINAL_STATUSES:
+                    completed_at = item.get('completed_at') or now
+                    latency = max(0.0, completed_at - queued_at)
+                    started = item.get('processing_started_at')
+                    processing = max(0.0, completed_at - started) if started else None
+                    results.append((doc_id, status, completed_at, round(latency, 2),
+                                    round(processing, 2) if processing is not None else None, item.get('error')))
+                    finished.append((batch, doc_id))
+                    if status == 'completed':
+                        self.completed += 1
+                        self.total_latency += latency
+                        self.max_latency = max(self.max_latency, latency)
+                    else:
+                        self.failed += 1
+                        log_error(f"[索引] 索引失败: {file_path or doc_id} - {item.get('error')}")
+                elif now - queued_at > self.timeout:
+                    results.append((doc_id, 'timeout', now, round(now - queued_at, 2), None, status))
+                    finished.append((batch, doc_id))
+                    self.timed_out += 1
+                    log_warning(f"[索引] 超过 {self.timeout:g} 秒仍未完成索引（{status}）: {file_path or doc_id}")
+        if errors:
+            log_warning(f"[索引] {errors}/{len(batches)} 个批次查询失败，下一轮重试")
+
+        if results and self.upload_logger:
+            try:
+                self.upload_logger.update_indexing_status(results)
+            except Exception as e:
+                log_warning(f"[索引] 写入索引结果失败: {e}")
+
+        with self._cond:
+            for batch, doc_id in finished:
+                docs = self._pending.get(batch)
+                if docs and docs.pop(doc_id, None) is not None:
+                    self._backlog -= 1
+                    if not docs:
+                        del self._pending[batch]
+            self._cond.notify_all()
+        return len(finished)
+
+    def run(self):
+        """运行跟踪线程"""
+        self._resume()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='indexing-poll') as executor:
+                while self.running:
+                    with self._cond:
+                        # 没有待跟踪的文档时等待新的登记，之后每隔 poll_interval 查询一轮
+                        while self.running and not self._pending:
+                            self._cond.wait()
+                        deadline = time.monotonic() + self.poll_interval
+                        while self.running and time.monotonic() < deadline:
+                            self._cond.wait(deadline - time.monotonic())
+                    if not self.running:
+                        break
+                    try:
+                        if self.poll_once(executor):
+                            log_success(f"[索引] 已完成 {self.completed} 个，失败 {self.failed} 个，"
+                                        f"排队 {self._backlog} 个")
+                    except Exception as e:
+                        log_error(f"[索引] 查询索引进度出错: {e}")
+        finally:
+            with self._cond:
+                self.running = False
+                self._cond.notify_all()
+
+    def stop(self):
+        """停止跟踪（未完成的文档已在上传日志中，下次启动继续跟踪）"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def stats(self):
+        """统计：完成/失败/超时数、排队数、平均与最长排队→完成耗时、因积压暂停上传的次数与时长"""
+        with self._cond:
+            return {
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'backlog': self._backlog,
+                'avg_latency': round(self.total_latency / self.completed, 1) if self.completed else 0.0,
+                'max_latency': round(self.max_latency, 1),
+                'throttle_waits': self.throttle_waits,
+                'throttled_seconds': round(self.throttled_seconds, 1),
+            }
@@ -0,0 +1,96 @@
+"""
+分层映射模块
+元数据快照的写时复制：发布后的基础字典不再修改，之后的增删改记在覆盖层中，
+写者每次只复制覆盖层；覆盖层超过 √N 条时合并出新的基础字典（均摊到每次写入约 O(√N)）
+"""
+from collections.abc import MutableMapping
+
+_MISSING = object()
+_DELETED = object()  # 覆盖层中表示基础字典里的键已删除
+
+
+def overlay_limit(size):
+    """覆盖层合并阈值：复制覆盖层与均摊的合并开销之和在 √N 附近最小"""
+    return max(256, int(size ** 0.5))
+
+
+class LayeredMap(MutableMapping):
+    """
+    基础字典 + 覆盖层
+
+    读者只读取已发布的实例；写者在 copy() 得到的副本上修改，完成后用 compacted() 的结果整体发布
+    """
+
+    __slots__ = ('_base', '_overlay', '_len')
+
+    def __init__(self, base=None, overlay=None, length=None):
+        self._base = base if base is not None else {}
+        self._overlay = overlay if overlay is not None else {}
+        self._len = len(self._base) if length is None else length
+
+    def __getitem__(self, key):
+        value = self._overlay.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base[key]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._overlay.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base.get(key, default)
+        return default if value is _DELETED else value
+
+    def __contains__(self, key):
+        value = self._overlay.get(key, _MISSING)
+        if value is _MISSING:
+            return key in self._base
+        return value is not _DELETED
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # 与合并后的字典顺序一致：原有的键保持位置，新增的键在后
+        base, overlay = self._base, self._overlay
+        for key in base:
+            if overlay.get(key, _MISSING) is not _DELETED:
+                yield key
+        for key, value in overlay.items():
+            if value is not _DELETED and key not in base:
+                yield key
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._overlay[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._len -= 1
+        if key in self._base:
+            self._overlay[key] = _DELETED
+        else:
+            del self._overlay[key]
+
+    def copy(self):
+        """写者的副本：共用基础字典，只复制覆盖层"""
+        return LayeredMap(self._base, dict(self._overlay), self._len)
+
+    @property
+    def overlay_size(self):
+        return len(self._overlay)
+
+    def compacted(self):
+        """覆盖层超过阈值时合并为新的基础字典，否则返回自身"""
+        if len(self._overlay) <= overlay_limit(self._len):
+            return self
+        merged = dict(self._base)
+        for key, value in self._overlay.items():
+            if value is _DELETED:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        return LayeredMap(merged)
@@ -5,73 +5,388 @@
 import os
 import csv
 import re
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from uuid import uuid4
+from utils.metadata_store import MetadataStore, FIELDNAMES
+from utils.metadata_record import MetadataRecord
+from utils.title_index import (
+    TitleIndex, LayeredTitleIndex, normalize_title, canonicalize_title, canonicalize_titles, title_keys
+)
+from utils.layered_map import LayeredMap
+
+# Dify 自动生成的占位文档名（如 doc_1234567），不作为元数据标题
+_PLACEHOLDER_TITLE_RE = re.compile(r'^doc_\d{6,}$', re.IGNORECASE)
 
 
 class MetadataManager:
-    def __init__(self, csv_path, auto_create=True, default_meta=None, config=None):
+    def __init__(self, csv_path, auto_create=True, default_meta=None, config=None,
+                 store_path=None, export_interval=60, reload_interval=0):
+        """
+        Args:
+            csv_path: 元数据 CSV 路径
+            auto_create: 找不到元数据时自动创建
+            default_meta: 自动创建时的默认字段
+            config: 完整配置
+            store_path: SQLite 存储路径；设置后增删改只写一行，CSV 按 export_interval 定期导出，
+                        未设置时每次修改整体重写 CSV（旧版行为）
+            export_interval: CSV 导出的最小间隔（秒），0 表示每次修改后立即导出
+            reload_interval: 后台检查 CSV 是否被外部修改的间隔（秒），0 表示不启动后台线程
+                             （每次修改元数据前仍会检查）
+        """
         self.csv_path = csv_path
         self.auto_create = auto_create
         self.default_meta = default_meta or {}
         self.config = config  # 保存完整配置，用于监控功能
-        self.metadata_map = {}
-        self._lookup_map = {}
+        
+        # 读者只访问 _snapshot（元数据映射, 查找映射, 标题索引），写者持锁在副本上修改后整体替换，
+        # 读取无需加锁，也不会看到修改到一半的状态
+        # 元数据映射：标题 -> MetadataRecord
+        # 查找映射：查找键 -> 标题，多个标题共用一个键时为 (标题, ...)（按录入顺序，首个优先）
+        # 三者都是"基础 + 覆盖层"结构，副本只复制覆盖层，单次写入不随元数据总数增长
+        self._snapshot = (LayeredMap(), LayeredMap(), LayeredTitleIndex())
+        self._map = {}
+        self._lookup = {}
+        self._lock = threading.RLock()
+        self._write_depth = 0
+        self._title_index = TitleIndex()
         self._existing_ids = set()
         
-        # 确保目录存在
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        # 确保目录存在（存储与 CSV 可以在不同目录）
+        for path in (csv_path, store_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        self.store = MetadataStore(store_path) if store_path else None
+        self.export_interval = export_interval
+        self._csv_dirty = False
+        self._last_export = time.monotonic()
+        # 外部修改检测：CSV 签名（仅 CSV 模式；存储模式记录在 store_state）与上次读取时的内容摘要
+        self._seen_signature = None
+        self._csv_digest = None
+        # 上次读取 CSV 之后本进程新增/修改/删除过的记录 ID，重新加载时保留本地版本
+        self._local_ids = set()
+        self.reload_interval = reload_interval
+        self._stop_watch = threading.Event()
+        self._watcher = None
         
         # 如果文件不存在则创建
         if not os.path.exists(csv_path):
             self._create_empty_csv()
         
         self.load()
+        if reload_interval > 0:
+            self._watcher = threading.Thread(target=self._watch_loop, name="metadata-watcher", daemon=True)
+            self._watcher.start()
+    
+    @property
+    def metadata_map(self):
+        """当前快照中的元数据映射：标题 -> MetadataRecord（只读）"""
+        return self._snapshot[0]
+    
+    @contextmanager
+    def _writing(self, check_csv=True):
+        """
+        写操作：持有写锁，在副本上修改，结束后发布新快照（可嵌套）
+        
+        最外层进入时先应用 CSV 的外部修改，避免本地写入覆盖人工编辑
+        """
+        with self._lock:
+            if self._write_depth == 0:
+                metadata_map, lookup_map, title_index = self._snapshot
+                self._map = metadata_map.copy()
+                self._lookup = lookup_map.copy()
+                self._title_index = title_index.copy()
+                if check_csv:
+                    self._write_depth += 1
+                    try:
+                        self._reload_if_changed()
+                    finally:
+                        self._write_depth -= 1
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._publish()
+
+    def _publish(self):
+        """发布新快照（重新加载得到的普通字典/索引作为新的基础层，覆盖层过大时合并）"""
+        metadata_map, lookup_map, title_index = self._map, self._lookup, self._title_index
+        if not isinstance(metadata_map, LayeredMap):
+            metadata_map = LayeredMap(metadata_map)
+        if not isinstance(lookup_map, LayeredMap):
+            lookup_map = LayeredMap(lookup_map)
+        if not isinstance(title_index, LayeredTitleIndex):
+            title_index = LayeredTitleIndex(title_index)
+        self._map, self._lookup, self._title_index = (
+            metadata_map.compacted(), lookup_map.compacted(), title_index.compacted()
+        )
+        self._snapshot = (self._map, self._lookup, self._title_index)
+
+    @contextmanager
+    def batch(self):
+        """
+        批量写入：块内的多次增删改在同一个副本上完成，结束时只发布一次快照
+        （块内其他线程读到的仍是进入前的快照）
+        """
+        with self._writing():
+            yield self
     
     def _create_empty_csv(self):
         """创建空的 CSV 文件"""
         with open(self.csv_path, 'w', encoding='utf-8', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(['id', 'title', 'source', 'keywords', 'year', 'region', 'type', 'category', 'created_at'])
+            writer.writerow(FIELDNAMES)
+    
+    def _csv_signature(self):
+        try:
+            st = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    
+    def _known_signature(self):
+        """本进程最近一次读写 CSV 后记录的签名"""
+        if self.store:
+            return self.store.get_state('csv_signature')
+        return self._seen_signature
+    
+    def _csv_file_digest(self):
+        digest = hashlib.md5()
+        with open(self.csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _csv_written(self, rewritten=False):
+        """
+        本进程写入 CSV 后调用：记录新签名并更新内容摘要
+        
+        Args:
+            rewritten: 整体重写（重新计算摘要）；追加写入时摘要直接失效
+        """
+        self._csv_digest = self._csv_file_digest() if rewritten else None
+        if not self.store:
+            self._seen_signature = self._csv_signature()
     
     def load(self):
-        """加载元数据表格"""
-        self.metadata_map = {}
-        self._lookup_map = {}
+        """
+        加载元数据表格
+        
+        使用 SQLite 存储时，CSV 自上次导入/导出后未被修改则直接读取存储；
+        CSV 被人工编辑过则重新导入（以 CSV 为准）
+        """
+        with self._writing(check_csv=False):
+            self._load()
+    
+    def _load(self):
+        self._map = {}
+        self._lookup = {}
+        self._title_index = TitleIndex()
         self._existing_ids = set()
+        self._local_ids = set()
+        
+        if self.store and self.store.get_state('csv_signature') == self._csv_signature():
+            for values in self.store.load_values():
+                record = MetadataRecord.from_row(FIELDNAMES, values)
+                self._map[record.title] = record
+                self._existing_ids.add(record.id)
+            self._register_all(list(self._map))
+            self._csv_dirty = self.store.get_state('csv_dirty') == '1'
+            if self._csv_dirty:
+                # 上次退出前有未导出的修改
+                self.export_csv()
+            return
+        
         dirty = False
         try:
-            with open(self.csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    title = (row.get('title') or '').strip()
-                    if not title:
-                        continue
+            digest = self._csv_file_digest()
+            entries, dirty = self._read_csv_records()
+            for title, record in entries:
+                self._existing_ids.add(record.id)
+                self._map[title] = record
+            self._csv_digest = digest
+        except Exception as e:
+            print(f"⚠️ 加载元数据失败: {e}")
+        self._register_all(list(self._map))
 
-                    if self._should_ignore_title(title):
-                        dirty = True
-                        continue
+        if self.store:
+            self.store.replace_all(self._map.values())
+            if dirty:
+                self._write_csv()
+            else:
+                self._mark_csv_synced()
+        elif dirty:
+            self._save_all()
+        else:
+            self._seen_signature = self._csv_signature()
+    
+    def _read_csv_records(self):
+        """
+        读取 CSV：跳过空标题与占位标题，去掉标题后缀，补齐缺失/重复的 ID
+        
+        Returns:
+            ([(标题, 记录), ...], 是否需要把规范化结果写回 CSV)
+        """
+        # 逐行直接构造紧凑记录，不先把整表读成字典
+        with open(self.csv_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or FIELDNAMES
+            records = [MetadataRecord.from_row(header, row) for row in reader]
+        titles = [record.title.strip() for record in records]
+        
+        entries = []
+        seen_ids = set()
+        dirty = False
+        # 整表批量计算规范标题，不经过 LRU 缓存
+        for record, title, canonical_title in zip(records, titles, canonicalize_titles(titles)):
+            if not title:
+                continue
 
-                    meta_id = (row.get('id') or '').strip()
-                    if not meta_id or meta_id in self._existing_ids:
-                        row['id'] = self._generate_unique_id()
-                        dirty = True
-                    self._existing_ids.add(row['id'])
+            if self._should_ignore_title(title):
+                dirty = True
+                continue
 
-                    canonical_title = self._canonicalize_title(title)
-                    if canonical_title and canonical_title != title:
-                        row['title'] = canonical_title
-                        title = canonical_title
-                        dirty = True
+            changes = {}
+            if canonical_title and canonical_title != title:
+                changes['title'] = canonical_title
+                title = canonical_title
 
-                    normalized_title = self._normalize_title(title)
-                    self.metadata_map[title] = row
-                    self._register_lookup_keys(title, normalized_title)
-        except Exception as e:
-            print(f"⚠️ 加载元数据失败: {e}")
+            meta_id = record.id.strip()
+            if not meta_id or meta_id in seen_ids:
+                # 人工新增的行未填 ID：同名记录已存在时沿用其 ID
+                existing = self._map.get(title)
+                if existing is not None and existing.id not in seen_ids:
+                    changes['id'] = existing.id
+                else:
+                    changes['id'] = self._generate_unique_id()
 
-        if dirty:
-            self._save_all()
+            if changes:
+                record = record.replace(**changes)
+                dirty = True
+            seen_ids.add(record.id)
+            entries.append((title, record))
+        return entries, dirty
+    
+    def reload_if_changed(self):
+        """
+        CSV 被外部修改（如在 Excel 中编辑）时，按 ID 比较并只应用变化的行
+        
+        Returns:
+            (新增, 更新, 删除) 条数；CSV 未修改时返回 None
+        """
+        if self._csv_signature() == self._known_signature():
+            # 未修改时不复制快照
+            return None
+        with self._writing(check_csv=False):
+            return self._reload_if_changed()
+    
+    def _reload_if_changed(self):
+        signature = self._csv_signature()
+        if signature is None or signature == self._known_signature():
+            return None
+        try:
+            digest = self._csv_file_digest()
+            if digest == self._csv_digest:
+                # 仅修改时间变化（保存了但内容未改）
+                self._remember_signature()
+                return None
+            entries, dirty = self._read_csv_records()
+        except Exception as e:
+            print(f"⚠️ 读取元数据 CSV 失败: {e}")
+            return None
+        
+        added, updated, removed, conflict = self._apply_csv_records(entries)
+        if dirty or conflict:
+            # 写回规范化结果，以及人工编辑期间本进程新增/修改的记录
+            if self.store:
+                self._write_csv()
+            else:
+                self._save_all()
+        else:
+            self._remember_signature()
+            self._csv_digest = digest
+        if added or updated or removed:
+            print(f"🔄 元数据 CSV 已被外部修改: 新增 {added} 条，更新 {updated} 条，删除 {removed} 条")
+        return added, updated, removed
+    
+    def _remember_signature(self):
+        if self.store:
+            if self._csv_dirty:
+                self.store.set_state('csv_signature', self._csv_signature())
+            else:
+                self._mark_csv_synced()
+        else:
+            self._seen_signature = self._csv_signature()
+    
+    def _apply_csv_records(self, entries):
+        """
+        按 ID 把 CSV 内容增量应用到内存（及存储）
+        
+        上次读取 CSV 之后本进程改动过的记录保留本地版本
+        
+        Returns:
+            (新增, 更新, 删除, 本地版本与 CSV 是否不一致)
+        """
+        by_id = {record.id: title for title, record in self._map.items()}
+        csv_ids = set()
+        dropped, saved = [], []
+        added = updated = 0
+        conflict = False
+        for title, record in entries:
+            csv_ids.add(record.id)
+            old_title = by_id.get(record.id)
+            if old_title is not None:
+                current = self._map.get(old_title)
+                if current is None or current.id != record.id:
+                    # 本轮已被同名的其他行替换
+                    old_title = None
+            if record.id in self._local_ids:
+                if old_title != title or self._map[title].to_dict() != record.to_dict():
+                    conflict = True
+                continue
+            if old_title == title and self._map[title].to_dict() == record.to_dict():
+                continue
+            if old_title is None:
+                added += 1
+            else:
+                updated += 1
+                dropped.append(old_title)
+                self._drop_record(old_title)
+            if title in self._map:
+                # 与另一条记录重名，以 CSV 为准
+                dropped.append(title)
+                self._drop_record(title)
+            self._map[title] = record
+            self._existing_ids.add(record.id)
+            self._register_lookup_keys(title)
+            saved.append((title, record))
+        
+        removed = 0
+        for meta_id, title in by_id.items():
+            if meta_id in csv_ids:
+                continue
+            if meta_id in self._local_ids:
+                conflict = True
+                continue
+            current = self._map.get(title)
+            if current is not None and current.id == meta_id:
+                self._drop_record(title)
+                dropped.append(title)
+                removed += 1
+        
+        if self.store:
+            if dropped:
+                self.store.delete_titles(dropped)
+            for title, record in saved:
+                self.store.save(title, record)
+        self._local_ids = set()
+        return added, updated, removed, conflict
     
     def get_metadata(self, file_path):
         """
@@ -83,12 +398,15 @@ class MetadataManager:
         
         candidates = self._generate_title_candidates(base_name)
 
+        metadata_map, lookup_map, _ = self._snapshot
         for candidate in candidates:
-            if candidate in self.metadata_map:
-                return self.metadata_map[candidate]
-            mapped = self._lookup_map.get(candidate)
-            if mapped and mapped in self.metadata_map:
-                return self.metadata_map[mapped]
+            record = metadata_map.get(candidate)
+            if record is None:
+                mapped = lookup_map.get(candidate)
+                if mapped:
+                    record = metadata_map[mapped if isinstance(mapped, str) else mapped[0]]
+            if record is not None:
+                return record.to_dict()
         
         # 如果启用自动创建，生成默认元数据
         if self.auto_create:
@@ -97,56 +415,78 @@ class MetadataManager:
         
         return None
     
-    def _normalize_title(self, title):
-        """标准化标题用于匹配"""
-        # 移除常见的特殊字符
-        chars_to_remove = ['《', '》', '（', '）', '(', ')', '[', ']', '-', '_', ' ']
-        normalized = title
-        for char in chars_to_remove:
-            normalized = normalized.replace(char, '')
-        normalized = re.sub(r'(pdfchunk|chunk|ocr|sub|part)\d+', '', normalized, flags=re.IGNORECASE)
-        return normalized.lower()
-
-    def _canonicalize_title(self, title):
-        if not title:
-            return ''
-        pattern = re.compile(r'(?:_ocr(?:_chunk\d+)?|_chunk\d+|_pdfchunk\d+|_sub\d+|_part\d+|_split\d+)+$', re.IGNORECASE)
-        canonical = title
-        while True:
-            new_value = pattern.sub('', canonical)
-            if new_value == canonical:
-                break
-            canonical = new_value
-        return canonical.strip('_- ')
-
     def _generate_title_candidates(self, base_name):
         if not base_name:
             return []
         candidates = [base_name]
-        canonical = self._canonicalize_title(base_name)
+        canonical = canonicalize_title(base_name)
         if canonical and canonical not in candidates:
             candidates.append(canonical)
-        normalized = self._normalize_title(base_name)
+        normalized = normalize_title(base_name)
         if normalized and normalized not in candidates:
             candidates.append(normalized)
         return candidates
 
-    def _register_lookup_keys(self, title, normalized_title=None):
-        if title:
-            self._lookup_map[title] = title
-            canonical = self._canonicalize_title(title)
-            if canonical:
-                self._lookup_map.setdefault(canonical, title)
-        if normalized_title:
-            self._lookup_map.setdefault(normalized_title, title)
+    def _lookup_keys(self, title, normalized_title=None, canonical=None):
+        """
+        标题的查找键（规范标题、标准化标题）
+
+        标题本身不作为查找键：get_metadata 先查元数据映射，与标题相同的候选直接命中
+        """
+        if not title:
+            return []
+        if canonical is None:
+            canonical = canonicalize_title(title)
+        if normalized_title is None:
+            normalized_title = normalize_title(title)
+        keys = []
+        for key in (canonical, normalized_title):
+            if key and key != title and key not in keys:
+                keys.append(key)
+        return keys
+
+    def _register_lookup_keys(self, title, normalized_title=None, canonical=None):
+        self._title_index.add(title, normalized_title)
+        for key in self._lookup_keys(title, normalized_title, canonical):
+            titles = self._lookup.get(key)
+            if titles is None:
+                # 绝大多数键只对应一个标题，直接保存标题字符串
+                self._lookup[key] = title
+            elif isinstance(titles, str):
+                if titles != title:
+                    self._lookup[key] = (titles, title)
+            elif title not in titles:
+                self._lookup[key] = titles + (title,)
+
+    def _unregister_lookup_keys(self, title):
+        """删除单条记录的查找键（增量维护，无需重建整个映射）"""
+        self._title_index.remove(title)
+        for key in self._lookup_keys(title):
+            titles = self._lookup.get(key)
+            if titles == title:
+                del self._lookup[key]
+            elif isinstance(titles, tuple) and title in titles:
+                titles = tuple(t for t in titles if t != title)
+                self._lookup[key] = titles[0] if len(titles) == 1 else titles
+
+    def _register_all(self, titles):
+        """批量登记查找键（标准化结果整批计算）"""
+        for title, (canonical, normalized) in zip(titles, title_keys(titles)):
+            self._register_lookup_keys(title, normalized, canonical)
 
     def _rebuild_lookup(self):
-        self._lookup_map = {}
-        for title in self.metadata_map.keys():
-            self._register_lookup_keys(title, self._normalize_title(title))
+        self._lookup = {}
+        self._title_index = TitleIndex()
+        self._register_all(list(self._map))
+
+    def _drop_record(self, title):
+        record = self._map.pop(title)
+        self._unregister_lookup_keys(title)
+        self._existing_ids.discard(record.id)
+        return record
 
     def _should_ignore_title(self, title):
-        return bool(re.match(r'^doc_\d{6,}$', title or '', re.IGNORECASE))
+        return bool(_PLACEHOLDER_TITLE_RE.match(title or ''))
 
     def _generate_unique_id(self):
         base = f"AUTO-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
@@ -165,30 +505,36 @@ class MetadataManager:
         year_match = re.search(r'(20\d{2})', title)
         year = year_match.group(1) if year_match else str(datetime.now().year)
         
-        canonical_title = self._canonicalize_title(title) or title
+        canonical_title = canonicalize_title(title) or title
         if self._should_ignore_title(canonical_title):
             print(f"⚠️ 检测到占位标题 {title}，跳过自动创建元数据")
             return None
 
-        # 生成唯一 ID
-        doc_id = self._generate_unique_id()
-        
-        meta = {
-            'id': doc_id,
-            'title': canonical_title,
-            'source': self.default_meta.get('source', '未知来源'),
-            'keywords': self.default_meta.get('keywords', ''),
-            'year': year,
-            'region': self.default_meta.get('region', '全国'),
-            'type': self.default_meta.get('type', '文档'),
-            'category': self._guess_category(title),
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        # 添加到映射并保存
-        self.metadata_map[canonical_title] = meta
-        self._register_lookup_keys(canonical_title, self._normalize_title(canonical_title))
-        self._append_to_csv(meta)
+        with self._writing():
+            # 其他线程可能已为同一标题创建了元数据
+            if canonical_title in self._map:
+                return self._map[canonical_title].to_dict()
+            
+            # 生成唯一 ID
+            doc_id = self._generate_unique_id()
+            
+            meta = {
+                'id': doc_id,
+                'title': canonical_title,
+                'source': self.default_meta.get('source', '未知来源'),
+                'keywords': self.default_meta.get('keywords', ''),
+                'year': year,
+                'region': self.default_meta.get('region', '全国'),
+                'type': self.default_meta.get('type', '文档'),
+                'category': self._guess_category(title),
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            
+            # 添加到映射并保存
+            record = MetadataRecord.from_dict(meta)
+            self._map[canonical_title] = record
+            self._register_lookup_keys(canonical_title, normalize_title(canonical_title))
+            self._insert_row(record)
         
         print(f"✨ 自动创建元数据: {canonical_title}")
         return meta
@@ -213,9 +559,113 @@ class MetadataManager:
         
         return '其他'
     
+    def _insert_row(self, meta):
+        """保存新增记录：写入存储并追加到 CSV（均为单行操作）"""
+        self._local_ids.add(meta['id'])
+        if not self.store:
+            self._append_to_csv(meta)
+            return
+        self.store.save(meta['title'], meta)
+        # CSV 未被外部修改时，追加后的签名仍视为与存储同步
+        in_sync = self._csv_signature() == self.store.get_state('csv_signature')
+        self._append_to_csv(meta)
+        if in_sync:
+            self.store.set_state('csv_signature', self._csv_signature())
+    
+    def _save_row(self, title):
+        """保存单条修改：有存储时只更新一行，CSV 延后导出；否则整体重写 CSV"""
+        self._local_ids.add(self._map[title].id)
+        if not self.store:
+            self._save_all()
+            return
+        self.store.save(title, self._map[title])
+        self._mark_csv_dirty()
+    
+    def _delete_rows(self, titles):
+        for title in titles:
+            self._local_ids.add(self._drop_record(title).id)
+        if not self.store:
+            self._save_all()
+            return
+        self.store.delete_titles(titles)
+        self._mark_csv_dirty()
+    
+    def _mark_csv_synced(self):
+        """记录 CSV 当前签名，下次启动时据此判断 CSV 是否被人工修改"""
+        self.store.set_state('csv_signature', self._csv_signature())
+        self.store.set_state('csv_dirty', '0')
+        self._csv_dirty = False
+    
+    def _mark_csv_dirty(self):
+        if not self._csv_dirty:
+            self._csv_dirty = True
+            self.store.set_state('csv_dirty', '1')
+        self._export_if_due()
+    
+    def _export_if_due(self):
+        if self._csv_dirty and time.monotonic() - self._last_export >= self.export_interval:
+            self.export_csv()
+    
+    def export_csv(self):
+        """
+        将存储导出为 CSV
+        
+        导出前先按 ID 合并 CSV 中的人工修改；CSV 无法读取时放弃本次导出，避免覆盖人工编辑
+        """
+        with self._writing():
+            if not self.store:
+                self._save_all()
+                return
+            signature = self._csv_signature()
+            if signature and signature != self.store.get_state('csv_signature'):
+                print("⚠️ 元数据 CSV 已被外部修改且无法读取，暂不导出")
+                return
+            self._write_csv()
+    
+    def _write_csv(self):
+        try:
+            self.store.export_csv(self.csv_path)
+            self._csv_written(rewritten=True)
+            self._mark_csv_synced()
+        except Exception as e:
+            print(f"⚠️ 导出元数据 CSV 失败: {e}")
+        self._last_export = time.monotonic()
+    
+    def _watch_loop(self):
+        """后台线程：定期应用 CSV 的外部修改，并导出到期的存储修改"""
+        while not self._stop_watch.wait(self.reload_interval):
+            try:
+                self.reload_if_changed()
+                with self._lock:
+                    if self.store:
+                        self._export_if_due()
+            except Exception as e:
+                print(f"⚠️ 检查元数据 CSV 失败: {e}")
+    
+    def flush(self):
+        """导出尚未写入 CSV 的修改"""
+        with self._lock:
+            if self.store and self._csv_dirty:
+                self.export_csv()
+    
+    def close(self):
+        if self._watcher:
+            self._stop_watch.set()
+            self._watcher.join()
+            self._watcher = None
+        with self._lock:
+            self.flush()
+            if self.store:
+                self.store.close()
+    
     def _append_to_csv(self, meta):
-        """追加新元数据到 CSV"""
+        """追加新元数据到 CSV（文件末尾缺少换行时先补上，避免与最后一行拼在一起）"""
         try:
+            with open(self.csv_path, 'a+b') as raw:
+                if raw.seek(0, os.SEEK_END) > 0:
+                    raw.seek(-1, os.SEEK_END)
+                    if raw.read(1) not in (b'\n', b'\r'):
+                        raw.write(b'\r\n')
             with open(self.csv_path, 'a', encoding='utf-8', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow([
@@ -229,16 +679,19 @@ class MetadataManager:
                     meta.get('category', ''),
                     meta.get('created_at', '')
                 ])
+            self._csv_written()
         except Exception as e:
             print(f"⚠️ 保存元数据失败: {e}")
     
     def update_metadata(self, title, **kwargs):
         """更新指定文档的元数据"""
-        if title in self.metadata_map:
-            self.metadata_map[title].update(kwargs)
-            self._save_all()
-            return True
-        return False
+        with self._writing():
+            if title in self._map:
+                # 替换为新记录，读者手中的旧记录保持不变
+                self._map[title] = self._map[title].replace(**kwargs)
+                self._save_row(title)
+                return True
+            return False
     
     def add_metadata(self, meta):
         """
@@ -254,71 +707,79 @@ class MetadataManager:
         if not title:
             return False
         
-        # 如果已存在，则更新
-        if title in self.metadata_map:
-            self.metadata_map[title].update(meta)
-            self._save_all()
-            return True
-        
-        # 生成 ID（如果没有）
-        if 'id' not in meta or not meta['id']:
-            meta['id'] = self._generate_unique_id()
-        
-        # 生成创建时间（如果没有）
-        if 'created_at' not in meta or not meta['created_at']:
-            meta['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 添加到映射
-        self.metadata_map[title] = meta
-        self._register_lookup_keys(title, self._normalize_title(title))
-        
-        # 追加到 CSV
-        self._append_to_csv(meta)
+        with self._writing():
+            # 如果已存在，则更新
+            if title in self._map:
+                self._map[title] = self._map[title].replace(**meta)
+                self._save_row(title)
+                return True
+            
+            # 生成 ID（如果没有）
+            if 'id' not in meta or not meta['id']:
+                meta['id'] = self._generate_unique_id()
+            
+            # 生成创建时间（如果没有）
+            if 'created_at' not in meta or not meta['created_at']:
+                meta['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            
+            # 添加到映射
+            record = MetadataRecord.from_dict(meta)
+            self._map[title] = record
+            self._register_lookup_keys(title, normalize_title(title))
+            
+            # 追加到 CSV
+            self._insert_row(record)
         
         return True
     
     def get_by_title(self, title):
         """根据标题获取元数据"""
-        return self.metadata_map.get(title)
+        record = self._snapshot[0].get(title)
+        return record.to_dict() if record is not None else None
     
     def _save_all(self):
         """保存所有元数据到 CSV"""
         try:
             with open(self.csv_path, 'w', encoding='utf-8', newline='') as f:
-                fieldnames = ['id', 'title', 'source', 'keywords', 'year', 'region', 'type', 'category', 'created_at']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 writer.writeheader()
-                for meta in self.metadata_map.values():
-                    writer.writerow(meta)
+                for record in self._map.values():
+                    writer.writerow(record.to_dict())
+            self._csv_written(rewritten=True)
             self._rebuild_lookup()
         except Exception as e:
             print(f"⚠️ 保存元数据失败: {e}")
     
     def delete_by_title(self, title):
         """根据标题删除元数据"""
-        if title in self.metadata_map:
-            del self.metadata_map[title]
-            self._save_all()
-            return True
-        return False
+        with self._writing():
+            if title in self._map:
+                self._delete_rows([title])
+                return True
+            return False
     
     def delete_by_titles(self, titles):
         """批量删除元数据"""
-        deleted_count = 0
-        for title in titles:
-            if title in self.metadata_map:
-                del self.metadata_map[title]
-                deleted_count += 1
+        with self._writing():
+            to_delete = list(dict.fromkeys(t for t in titles if t in self._map))
+            if to_delete:
+                self._delete_rows(to_delete)
         
-        if deleted_count > 0:
-            self._save_all()
+        return len(to_delete)
+    
+    def match_titles(self, name):
+        """
+        模糊匹配标题：标准化后与 name 相同、包含 name 或被 name 包含的标题
         
-        return deleted_count
+        Returns:
+            标题列表，完全相同的排在前面，其余按录入顺序
+        """
+        return self._snapshot[2].match(name)
     
     def get_all_titles(self):
         """获取所有元数据标题"""
-        return list(self.metadata_map.keys())
+        return list(self._snapshot[0])
     
     def count(self):
         """获取元数据总数"""
-        return len(self.metadata_map)
+        return len(self._snapshot[0])
@@ -0,0 +1,85 @@
+"""
+元数据记录模块
+内存中每条元数据用带 __slots__ 的紧凑对象保存，取值重复度高的字段（来源、地区、类型等）
+使用驻留字符串，数十万条记录时内存占用远低于逐行保存 dict
+"""
+import sys
+from utils.metadata_store import FIELDNAMES
+
+# 取值集中在少数几种的字段，驻留后所有记录共享同一个字符串对象
+INTERNED_FIELDS = frozenset({'source', 'keywords', 'year', 'region', 'type', 'category'})
+
+
+def _clean(name, value):
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        return value
+    return sys.intern(value) if name in INTERNED_FIELDS else value
+
+
+class MetadataRecord:
+    """
+    单条元数据（不可变：修改时通过 replace 生成新记录，读者手中的旧记录保持不变）
+
+    对外通过 to_dict() 提供与 CSV 行相同的字典；FIELDNAMES 之外的字段保存在 extra 中
+    """
+
+    __slots__ = tuple(FIELDNAMES) + ('extra',)
+
+    def __init__(self, values=None, extra=None):
+        """
+        Args:
+            values: {字段名: 值}，缺失的字段为空字符串
+            extra: FIELDNAMES 之外的字段
+        """
+        values = values or {}
+        for name in FIELDNAMES:
+            object.__setattr__(self, name, _clean(name, values.get(name)))
+        object.__setattr__(self, 'extra', extra or None)
+
+    @classmethod
+    def from_dict(cls, meta):
+        extra = {k: v for k, v in meta.items() if k not in FIELDNAMES}
+        return cls(meta, extra)
+
+    @classmethod
+    def from_row(cls, header, row):
+        """
+        由 csv.reader 的一行构造（不经过 DictReader，避免整表先生成一遍字典）
+
+        Args:
+            header: 表头
+            row: 字段值列表；比表头短时缺失字段为空，比表头长时多余的值丢弃
+        """
+        return cls(dict(zip(header, row)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MetadataRecord 不可修改，请使用 replace()")
+
+    def get(self, name, default=None):
+        if name in FIELDNAMES:
+            return getattr(self, name)
+        if self.extra:
+            return self.extra.get(name, default)
+        return default
+
+    def __getitem__(self, name):
+        if name in FIELDNAMES:
+            return getattr(self, name)
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新记录"""
+        return MetadataRecord.from_dict({**self.to_dict(), **changes})
+
+    def to_dict(self):
+        meta = {name: getattr(self, name) for name in FIELDNAMES}
+        if self.extra:
+            meta.update(self.extra)
+        return meta
+
+    def __repr__(self):
+        return f"MetadataRecord(id={self.id!r}, title={self.title!r})"
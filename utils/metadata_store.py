@@ -0,0 +1,89 @@
+"""
+元数据存储模块
+元数据保存在 SQLite 表中，单条增删改只涉及一行；
+CSV 仅作为人工编辑时的导入/导出格式
+"""
+import csv
+import os
+from utils.sqlite_pool import SQLiteConnectionPool
+
+FIELDNAMES = ['id', 'title', 'source', 'keywords', 'year', 'region', 'type', 'category', 'created_at']
+
+
+class MetadataStore:
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+        """
+        self.db_path = db_path
+        self._db = SQLiteConnectionPool(db_path)
+        columns = ", ".join(f"{name} TEXT" for name in FIELDNAMES if name != 'title')
+        with self._db.transaction() as conn:
+            # title 为主键；普通 rowid 表在 UPSERT 时保留 rowid，导出顺序与录入顺序一致
+            conn.execute(f"CREATE TABLE IF NOT EXISTS metadata (title TEXT PRIMARY KEY, {columns})")
+            conn.execute("CREATE TABLE IF NOT EXISTS store_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    @staticmethod
+    def _values(meta):
+        return tuple(meta.get(name) or '' for name in FIELDNAMES)
+
+    def load_values(self):
+        """按录入顺序读取全部记录的字段值元组（字段顺序同 FIELDNAMES）"""
+        with self._db.connect() as conn:
+            return conn.execute(f"SELECT {', '.join(FIELDNAMES)} FROM metadata ORDER BY rowid").fetchall()
+
+    def load_rows(self):
+        """按录入顺序读取全部记录"""
+        return [dict(zip(FIELDNAMES, row)) for row in self.load_values()]
+
+    def save(self, key, meta):
+        """
+        保存一条记录：标题为 key 的记录存在时更新（允许改名），否则插入
+        """
+        assignments = ", ".join(f"{name}=?" for name in FIELDNAMES)
+        with self._db.transaction() as conn:
+            cur = conn.execute(f"UPDATE metadata SET {assignments} WHERE title=?", self._values(meta) + (key,))
+            if cur.rowcount == 0:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO metadata ({', '.join(FIELDNAMES)}) "
+                    f"VALUES ({', '.join('?' * len(FIELDNAMES))})",
+                    self._values(meta)
+                )
+
+    def delete_titles(self, titles):
+        """批量删除，返回删除条数"""
+        with self._db.transaction() as conn:
+            cur = conn.executemany("DELETE FROM metadata WHERE title=?", ((t,) for t in titles))
+        return cur.rowcount
+
+    def replace_all(self, rows):
+        """用给定记录整体替换（导入 CSV 时使用）"""
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM metadata")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO metadata ({', '.join(FIELDNAMES)}) "
+                f"VALUES ({', '.join('?' * len(FIELDNAMES))})",
+                (self._values(row) for row in rows)
+            )
+
+    def export_csv(self, csv_path):
+        """导出为 CSV（先写临时文件再替换，避免导出中途被读到半个文件）"""
+        tmp_path = f"{csv_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(self.load_rows())
+        os.replace(tmp_path, csv_path)
+
+    def get_state(self, key, default=None):
+        with self._db.connect() as conn:
+            row = conn.execute("SELECT value FROM store_state WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._db.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO store_state (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self._db.close_all()
@@ -0,0 +1,174 @@
+"""
+监控快照模块
+持久化 Dify 监控最近一次看到的文档列表（ID、名称、更新时间），
+重启后与之比较，停机期间的删除/新增不会丢失
+
+每轮检查时文档按页流式写入暂存表，再与按 ID 排序的快照表在 SQLite 内比较，
+内存占用只与变化的文档数有关，与知识库大小无关
+"""
+import time
+from collections import namedtuple
+from utils.sqlite_pool import SQLiteConnectionPool
+
+# 变化类型
+ADDED = 'added'
+REMOVED = 'removed'
+RENAMED = 'renamed'
+UPDATED = 'updated'  # 名称不变，更新时间变化
+
+# 一条变化：新增时 old_name 为 None，删除时 name 为 None
+DiffEvent = namedtuple('DiffEvent', 'kind doc_id name old_name updated_at')
+
+_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        doc_id BLOB PRIMARY KEY,
+        name TEXT NOT NULL,
+        updated_at INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+"""
+
+def encode_doc_id(doc_id):
+    """文档 ID 编码为紧凑的键：UUID 存 16 字节 BLOB，其他 ID 原样存 TEXT"""
+    if len(doc_id) == 36 and doc_id.count('-') == 4:
+        try:
+            blob = bytes.fromhex(doc_id.replace('-', ''))
+        except ValueError:
+            blob = None
+        # 只有能原样还原的（小写、标准分段）才压缩
+        if blob is not None and decode_doc_id(blob) == doc_id:
+            return blob
+    return doc_id
+
+
+def decode_doc_id(value):
+    if isinstance(value, str):
+        return value
+    h = value.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class MonitorSnapshot:
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径（默认与上传日志同库）
+        """
+        self.db_path = db_path
+        self._db = SQLiteConnectionPool(db_path)
+        with self._db.transaction() as conn:
+            # 按 ID 排序存储（WITHOUT ROWID），比较时按主键查找，可按 ID 顺序流式读取
+            conn.execute(_TABLE_SQL.format(table='monitor_snapshot'))
+            conn.execute("CREATE TABLE IF NOT EXISTS monitor_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    def saved_at(self):
+        """上次保存快照的时间（epoch 秒）；从未保存返回 None"""
+        with self._db.connect() as conn:
+            row = conn.execute("SELECT value FROM monitor_state WHERE key='saved_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def load(self):
+        """
+        读取快照
+
+        Returns:
+            {doc_id: (名称, 更新时间)}；从未保存过返回 None
+        """
+        if self.saved_at() is None:
+            return None
+        with self._db.connect() as conn:
+            rows = conn.execute("SELECT doc_id, name, updated_at FROM monitor_snapshot").fetchall()
+        return {decode_doc_id(blob): (name, updated_at) for blob, name, updated_at in rows}
+
+    def stage(self, documents, batch_size=1000):
+        """
+        把本轮获取的文档流式写入暂存表（每批单独提交，不长时间占用写锁）
+
+        Args:
+            documents: 可迭代的 (doc_id, 名称, 更新时间)，可以是边获取边产出的生成器
+            batch_size: 每批写入条数
+
+        Returns:
+            暂存的文档数（重复 ID 只计一次）；documents 抛出异常时丢弃暂存表并重新抛出
+        """
+        with self._db.transaction() as conn:
+            conn.execute("DROP TABLE IF EXISTS monitor_incoming")
+            conn.execute(_TABLE_SQL.format(table='monitor_incoming'))
+        batch = []
+        try:
+            for doc_id, name, updated_at in documents:
+                batch.append((encode_doc_id(doc_id), name, updated_at))
+                if len(batch) >= batch_size:
+                    self._insert_staged(batch)
+                    batch = []
+            if batch:
+                self._insert_staged(batch)
+        except BaseException:
+            self.discard()
+            raise
+        with self._db.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM monitor_incoming").fetchone()[0]
+
+    def _insert_staged(self, batch):
+        with self._db.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO monitor_incoming (doc_id, name, updated_at) VALUES (?, ?, ?)", batch
+            )
+
+    def diff(self):
+        """
+        逐条产出暂存表相对快照的变化（DiffEvent），按 ID 顺序；游标逐行读取，不整体载入内存
+        """
+        with self._db.connect() as conn:
+            cursor = conn.execute("""
+                SELECT s.doc_id, s.name FROM monitor_snapshot s
+                WHERE NOT EXISTS (SELECT 1 FROM monitor_incoming i WHERE i.doc_id = s.doc_id)
+                ORDER BY s.doc_id
+            """)
+            for blob, old_name in cursor:
+                yield DiffEvent(REMOVED, decode_doc_id(blob), None, old_name, None)
+            cursor = conn.execute("""
+                SELECT i.doc_id, i.name, i.updated_at, s.name, s.updated_at
+                FROM monitor_incoming i LEFT JOIN monitor_snapshot s ON s.doc_id = i.doc_id
+                WHERE s.doc_id IS NULL OR s.name != i.name OR s.updated_at != i.updated_at
+                ORDER BY i.doc_id
+            """)
+            for blob, name, updated_at, old_name, old_updated_at in cursor:
+                if old_name is None:
+                    kind = ADDED
+                elif old_name != name:
+                    kind = RENAMED
+                else:
+                    kind = UPDATED
+                yield DiffEvent(kind, decode_doc_id(blob), name, old_name, updated_at)
+
+    def staged_names(self, names):
+        """names 中仍有文档使用的名称（用于判断删除/改名后旧名称是否还存在）"""
+        names = list(dict.fromkeys(names))
+        present = set()
+        with self._db.connect() as conn:
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                present.update(row[0] for row in conn.execute(
+                    f"SELECT DISTINCT name FROM monitor_incoming WHERE name IN ({placeholders})", chunk
+                ))
+        return present
+
+    def commit(self):
+        """暂存表替换为新的快照（改表名，不逐行复制）"""
+        with self._db.transaction() as conn:
+            conn.execute("DROP TABLE monitor_snapshot")
+            conn.execute("ALTER TABLE monitor_incoming RENAME TO monitor_snapshot")
+            self._touch(conn)
+
+    def discard(self):
+        """丢弃暂存表（本轮获取失败或同步出错，下次重新比较）"""
+        with self._db.transaction() as conn:
+            conn.execute("DROP TABLE IF EXISTS monitor_incoming")
+
+    @staticmethod
+    def _touch(conn):
+        conn.execute("INSERT OR REPLACE INTO monitor_state (key, value) VALUES ('saved_at', ?)", (str(time.time()),))
+
+    def close(self):
+        self._db.close_all()
@@ -0,0 +1,146 @@
+"""
+分阶段处理流水线模块
+各阶段通过有界队列串联，每个阶段拥有独立的并发数，
+下游处理不过来时上游 put 会阻塞（背压），内存占用保持平稳
+"""
+import queue
+import threading
+import time
+from utils.logger import log_error
+
+_STOP = object()
+
+
+class PipelineStage:
+    """流水线中的单个阶段"""
+
+    def __init__(self, name, handler, workers=1, queue_size=8):
+        """
+        Args:
+            name: 阶段名称
+            handler: 处理函数 handler(job)，返回交给后续阶段的任务列表（可为 None）
+            workers: 工作线程数
+            queue_size: 输入队列容量
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.pipeline = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i + 1}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, job):
+        """放入任务，队列已满时阻塞"""
+        self.queue.put(job)
+
+    def stop(self, timeout=None):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is _STOP:
+                self.queue.task_done()
+                break
+            started = time.time()
+            ok = True
+            try:
+                for item in self.handler(job) or ():
+                    self.pipeline.route(item, self)
+            except Exception as e:
+                ok = False
+                log_error(f"[{self.name}] 任务处理失败: {e}")
+            finally:
+                with self._lock:
+                    self.busy_seconds += time.time() - started
+                    if ok:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                self.queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queue.qsize(),
+                'processed': self.processed,
+                'failed': self.failed,
+                'busy_seconds': round(self.busy_seconds, 2),
+            }
+
+
+class Pipeline:
+    """
+    由多个阶段组成的流水线
+
+    任务为字典，可通过 job['stage'] 指定目标阶段（只能流向当前阶段之后的阶段），
+    未指定时进入下一个阶段；最后一个阶段产出的任务被丢弃
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._by_name = {}
+        for stage in self.stages:
+            stage.pipeline = self
+            self._by_name[stage.name] = stage
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        for stage in self.stages:
+            stage.start()
+        self.started = True
+
+    def submit(self, job):
+        """提交任务到指定阶段（默认第一个阶段），下游繁忙时阻塞"""
+        self._resolve(job, None).put(job)
+
+    def route(self, job, source):
+        target = self._resolve(job, source)
+        if target is not None:
+            target.put(job)
+
+    def _resolve(self, job, source):
+        start = 0 if source is None else self.stages.index(source) + 1
+        name = job.get('stage') if isinstance(job, dict) else None
+        if name is None:
+            return self.stages[start] if start < len(self.stages) else None
+        stage = self._by_name.get(name)
+        if stage is None:
+            raise ValueError(f"未知的流水线阶段: {name}")
+        if self.stages.index(stage) < start:
+            raise ValueError(f"任务不能回流到上游阶段: {name}")
+        return stage
+
+    def join(self):
+        """等待所有已提交的任务处理完毕"""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def stop(self, timeout=None):
+        if not self.started:
+            return
+        for stage in self.stages:
+            stage.stop(timeout)
+        self.started = False
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,114 @@
+"""
+自适应轮询调度模块
+连续检查无变化时按倍数拉长间隔（带随机抖动，避免多个实例同时请求），
+检测到变化或本地有上传时恢复到最小间隔；统计相对固定间隔节省的 API 请求数
+"""
+import random
+import threading
+import time
+
+
+class AdaptivePollScheduler:
+    """轮询间隔调度器"""
+
+    def __init__(self, min_interval=30, max_interval=1800, backoff=2.0, jitter=0.2,
+                 baseline_interval=60):
+        """
+        Args:
+            min_interval: 最小间隔（秒），有变化时使用
+            max_interval: 最大间隔（秒）
+            backoff: 每次无变化后间隔的放大倍数
+            jitter: 随机抖动比例（0.2 表示 ±20%）
+            baseline_interval: 对比用的固定间隔（秒），用于计算节省的请求数
+        """
+        self.min_interval = max(1.0, float(min_interval))
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.backoff = max(1.0, float(backoff))
+        self.jitter = min(0.5, max(0.0, float(jitter)))
+        self.baseline_interval = max(1.0, float(baseline_interval))
+
+        self.interval = self.min_interval
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._cancelled = False
+        self._started = time.monotonic()
+
+        # 统计信息
+        self.checks = 0
+        self.idle_checks = 0
+        self.activity_wakeups = 0
+        self.api_calls = 0
+
+    def _jittered(self, interval):
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def record_check(self, changed, api_calls=1):
+        """
+        记录一次检查结果并调整间隔
+
+        Args:
+            changed: 本次是否检测到变化
+            api_calls: 本次检查发出的请求数
+        """
+        with self._cond:
+            self.checks += 1
+            self.api_calls += api_calls
+            if changed:
+                self.interval = self.min_interval
+            else:
+                self.idle_checks += 1
+                self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def notify_activity(self):
+        """本地有上传等活动：恢复最小间隔，已排定的下次检查不晚于最小间隔之后"""
+        with self._cond:
+            self.interval = self.min_interval
+            if self._deadline is not None:
+                deadline = time.monotonic() + self._jittered(self.min_interval)
+                if deadline < self._deadline:
+                    self._deadline = deadline
+                    self.activity_wakeups += 1
+                    self._cond.notify_all()
+
+    def wait(self):
+        """
+        等待到下次检查
+
+        Returns:
+            False 表示已调用 cancel()，应停止轮询
+        """
+        with self._cond:
+            self._deadline = time.monotonic() + self._jittered(self.interval)
+            while not self._cancelled:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._deadline = None
+            return not self._cancelled
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        统计：检查次数、当前间隔，以及相对 baseline_interval 固定轮询节省的请求数
+        """
+        with self._cond:
+            elapsed = max(time.monotonic() - self._started, 1e-6)
+            baseline_checks = elapsed / self.baseline_interval
+            per_check = self.api_calls / self.checks if self.checks else 1
+            saved = max(0.0, (baseline_checks - self.checks) * per_check)
+            return {
+                'checks': self.checks,
+                'idle_checks': self.idle_checks,
+                'activity_wakeups': self.activity_wakeups,
+                'interval': round(self.interval, 1),
+                'api_calls': self.api_calls,
+                'api_calls_saved': int(saved),
+                'saved_per_hour': round(saved / elapsed * 3600, 1),
+            }
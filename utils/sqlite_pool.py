@@ -0,0 +1,122 @@
+"""
+SQLite 连接管理模块
+每个线程复用一个长连接（WAL 模式 + 调优的 PRAGMA），
+写操作通过进程内写锁串行化，避免 "database is locked"
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteConnectionPool:
+    def __init__(self, db_path, persistent=True, wal=True, synchronous='NORMAL',
+                 cache_size_kb=16384, busy_timeout_ms=30000, cached_statements=256):
+        """
+        Args:
+            db_path: 数据库文件路径
+            persistent: 是否复用长连接（False 时每次调用新建连接，行为同旧版）
+            wal: 是否启用 WAL 日志模式（读写互不阻塞）
+            synchronous: PRAGMA synchronous（WAL 下 NORMAL 即可保证一致性）
+            cache_size_kb: 每个连接的页缓存大小（KB）
+            busy_timeout_ms: 锁等待超时（毫秒）
+            cached_statements: 每个连接缓存的预编译语句数
+        """
+        self.db_path = db_path
+        self.persistent = persistent
+        self.wal = wal
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # 自动提交，事务由 transaction() 显式控制
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        if self.wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _get(self):
+        if not self.persistent:
+            return self._open()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connect(self):
+        """获取当前线程的连接（用于读操作）"""
+        conn = self._get()
+        try:
+            yield conn
+        finally:
+            if not self.persistent:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """写事务：进程内串行，BEGIN IMMEDIATE 提前拿到写锁；可嵌套（内层并入外层）"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield self._local.tx_conn
+            finally:
+                self._local.depth = depth
+            return
+
+        with self._write_lock:
+            with self.connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._local.depth = 1
+                self._local.tx_conn = conn
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                else:
+                    conn.execute("COMMIT")
+                finally:
+                    self._local.depth = 0
+                    self._local.tx_conn = None
+
+    @contextmanager
+    def exclusive(self):
+        """
+        持有写锁但不开启事务的连接（用于 ATTACH / VACUUM 等不能在事务内执行的语句）
+
+        期间其他线程的写操作会等待；调用方自行 BEGIN/COMMIT
+        """
+        with self._write_lock:
+            with self.connect() as conn:
+                yield conn
+
+    def close_all(self):
+        """关闭所有线程的长连接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,312 @@
+"""
+标题匹配模块
+统一的标题标准化规则，以及支持"包含/被包含"查询的 n-gram 索引，
+用于 Dify 文档名与本地元数据标题的模糊匹配
+"""
+import re
+from array import array
+from functools import lru_cache
+from utils.layered_map import overlay_limit
+
+# 标准化结果的缓存条数（监控与入库反复查询同一批标题）
+TITLE_CACHE_SIZE = 65536
+
+# 标准化时删除的字符（书名号、括号、连接符、空白）
+_STRIP_TABLE = str.maketrans('', '', '《》（）()[]【】-_ \t　')
+# 分段上传时追加的名称后缀
+_SPLIT_LABEL_RE = re.compile(r'PDF分段\s*\d+/\d+')
+# 文件名末尾的分段/OCR 标记（只去掉末尾的，标题中间的 part2020、sub3 等保留）
+_CHUNK_SUFFIX_RE = re.compile(r'(?:_?(?:pdfchunk|chunk|ocr|sub|part)\d+)+$')
+# 文件名末尾的 OCR/分段后缀（可连续出现，一次匹配全部去掉）
+_CANONICAL_SUFFIX_RE = re.compile(
+    r'(?:_ocr(?:_chunk\d+)?|_chunk\d+|_pdfchunk\d+|_sub\d+|_part\d+|_split\d+)+$', re.IGNORECASE
+)
+
+
+def _normalize(title):
+    normalized = _SPLIT_LABEL_RE.sub('', title)
+    normalized = normalized.translate(_STRIP_TABLE).lower()
+    return _CHUNK_SUFFIX_RE.sub('', normalized)
+
+
+def _canonicalize(title):
+    return _CANONICAL_SUFFIX_RE.sub('', title).strip('_- ')
+
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def normalize_title(title):
+    """
+    标准化标题用于比较：去掉括号/连接符/空白、分段后缀，并转为小写
+    """
+    if not title:
+        return ''
+    return _normalize(title)
+
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def canonicalize_title(title):
+    """去掉文件名末尾的 OCR/分段后缀（如 _ocr、_chunk001、_pdfchunk002）"""
+    if not title:
+        return ''
+    return _canonicalize(title)
+
+
+def canonicalize_titles(titles):
+    """批量计算规范标题（不经过缓存）"""
+    canonicalize = _canonicalize
+    return [canonicalize(t) if t else '' for t in titles]
+
+
+def title_keys(titles):
+    """
+    批量计算 [(规范标题, 标准化标题), ...]
+
+    加载整表时标题各不相同，直接计算不经过缓存，避免挤掉缓存中的热点标题
+    """
+    canonicalize, normalize = _canonicalize, _normalize
+    return [(canonicalize(t), normalize(t)) if t else ('', '') for t in titles]
+
+
+class TitleIndex:
+    """
+    标题索引
+
+    标准化结果只计算一次；"包含查询串"的标题取查询串中最稀有 gram 的倒排表逐个校验得到，
+    "被查询串包含"的标题通过枚举查询串中与已有标题等长的子串得到，
+    两者都与索引中的标题总数无关
+
+    倒排表是标准化结果编号的紧凑数组（每项 4 字节），删除时只把编号置空，
+    失效编号过半时整体重建
+    """
+
+    def __init__(self, titles=(), ngram=2):
+        """
+        Args:
+            titles: 初始标题
+            ngram: 倒排索引的 gram 长度（中文标题取 2 即可）
+        """
+        self.ngram = max(1, int(ngram))
+        self._seq = {}        # 标题 -> 录入序号
+        self._norm = {}       # 标题 -> 标准化结果
+        self._by_norm = {}    # 标准化结果 -> [标题, ...]
+        self._norm_ids = {}   # 标准化结果 -> 编号
+        self._norms = []      # 编号 -> 标准化结果（已删除为 None）
+        self._grams = {}      # gram -> array(编号)
+        self._lengths = {}    # 标准化结果长度 -> 数量
+        self._counter = 0
+        titles = list(titles)
+        for title, (_, normalized) in zip(titles, title_keys(titles)):
+            self.add(title, normalized)
+
+    def __len__(self):
+        return len(self._norm)
+
+    def __contains__(self, title):
+        return title in self._norm
+
+    def _iter_grams(self, text):
+        n = self.ngram
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, title, normalized=None):
+        """添加标题；normalized 为已算好的标准化结果（可选）"""
+        if not title or title in self._norm:
+            return
+        if normalized is None:
+            normalized = normalize_title(title)
+        self._counter += 1
+        self._seq[title] = self._counter
+        self._norm[title] = normalized
+        if not normalized:
+            return
+        titles = self._by_norm.get(normalized)
+        if titles is None:
+            self._by_norm[normalized] = [title]
+            self._lengths[len(normalized)] = self._lengths.get(len(normalized), 0) + 1
+            self._index_norm(normalized)
+        else:
+            titles.append(title)
+
+    def _index_norm(self, normalized):
+        norm_id = len(self._norms)
+        self._norms.append(normalized)
+        self._norm_ids[normalized] = norm_id
+        for gram in self._iter_grams(normalized):
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array('I')
+            postings.append(norm_id)
+
+    def copy(self):
+        """独立的副本（倒排数组逐个复制，用于合并分层索引）"""
+        other = TitleIndex.__new__(TitleIndex)
+        other.ngram = self.ngram
+        other._seq = dict(self._seq)
+        other._norm = dict(self._norm)
+        other._by_norm = {normalized: list(titles) for normalized, titles in self._by_norm.items()}
+        other._norm_ids = dict(self._norm_ids)
+        other._norms = list(self._norms)
+        other._grams = {gram: postings[:] for gram, postings in self._grams.items()}
+        other._lengths = dict(self._lengths)
+        other._counter = self._counter
+        return other
+
+    def _compact(self):
+        """丢弃失效编号，重建倒排表"""
+        live = [n for n in self._norms if n is not None]
+        self._norms = []
+        self._norm_ids = {}
+        self._grams = {}
+        for normalized in live:
+            self._index_norm(normalized)
+
+    def remove(self, title):
+        normalized = self._norm.pop(title, None)
+        if normalized is None:
+            return
+        del self._seq[title]
+        titles = self._by_norm.get(normalized)
+        if not titles:
+            return
+        titles.remove(title)
+        if titles:
+            return
+        del self._by_norm[normalized]
+        length = len(normalized)
+        self._lengths[length] -= 1
+        if not self._lengths[length]:
+            del self._lengths[length]
+        self._norms[self._norm_ids.pop(normalized)] = None
+        if len(self._norms) > 1024 and len(self._norm_ids) * 2 < len(self._norms):
+            self._compact()
+
+    def _containing(self, normalized):
+        """包含 normalized 的标准化结果"""
+        if len(normalized) < self.ngram:
+            return {n for n in self._by_norm if normalized in n}
+        smallest = None
+        for gram in self._iter_grams(normalized):
+            postings = self._grams.get(gram)
+            if not postings:
+                return set()
+            if smallest is None or len(postings) < len(smallest):
+                smallest = postings
+        norms = self._norms
+        return {n for n in map(norms.__getitem__, smallest) if n is not None and normalized in n}
+
+    def _contained_in(self, normalized):
+        """是 normalized 子串的标准化结果"""
+        found = set()
+        size = len(normalized)
+        for length in self._lengths:
+            if length > size:
+                continue
+            for i in range(size - length + 1):
+                part = normalized[i:i + length]
+                if part in self._by_norm:
+                    found.add(part)
+        return found
+
+    def containing(self, query):
+        """标准化后包含查询串的标题"""
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+        return self._collect(self._containing(normalized), normalized)
+
+    def contained_in(self, query):
+        """标准化后是查询串子串的标题"""
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+        return self._collect(self._contained_in(normalized), normalized)
+
+    def match(self, query):
+        """
+        与查询串相同、包含查询串或被查询串包含的标题
+
+        Returns:
+            标题列表，完全相同的排在前面，其余按录入顺序
+        """
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+        return self._collect(self._containing(normalized) | self._contained_in(normalized), normalized)
+
+    def first_match(self, query):
+        matches = self.match(query)
+        return matches[0] if matches else None
+
+    def _collect(self, normalized_set, exact):
+        titles = [t for n in normalized_set for t in self._by_norm[n]]
+        titles.sort(key=lambda t: (self._norm[t] != exact, self._seq[t]))
+        return titles
+
+
+class LayeredTitleIndex:
+    """
+    可作为只读快照发布的标题索引
+
+    基础 TitleIndex 发布后不再修改，之后增删的标题记在覆盖层中（查询时逐个比较），
+    覆盖层超过阈值时复制基础索引并合并；写者在 copy() 的副本上修改，读者无需加锁
+    """
+
+    def __init__(self, base=None, added=None, removed=None, counter=None):
+        """
+        Args:
+            base: 基础索引
+            added: 覆盖层新增的标题 {标题: (标准化结果, 录入序号)}
+            removed: 已删除的基础索引标题
+            counter: 覆盖层的录入序号
+        """
+        self.base = base if base is not None else TitleIndex()
+        self._added = added if added is not None else {}
+        self._removed = removed if removed is not None else set()
+        self._counter = self.base._counter if counter is None else counter
+
+    def __len__(self):
+        return len(self.base) - len(self._removed) + len(self._added)
+
+    def __contains__(self, title):
+        return title in self._added or (title in self.base and title not in self._removed)
+
+    def add(self, title, normalized=None):
+        if not title or title in self:
+            return
+        if normalized is None:
+            normalized = normalize_title(title)
+        self._counter += 1
+        self._added[title] = (normalized, self._counter)
+
+    def remove(self, title):
+        if self._added.pop(title, None) is None and title in self.base:
+            self._removed.add(title)
+
+    def match(self, query):
+        """同 TitleIndex.match"""
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+        base, removed = self.base, self._removed
+        found = [(title, base._norm[title], base._seq[title])
+                 for n in base._containing(normalized) | base._contained_in(normalized)
+                 for title in base._by_norm[n] if title not in removed]
+        found.extend((title, n, seq) for title, (n, seq) in self._added.items()
+                     if n and (normalized in n or n in normalized))
+        found.sort(key=lambda item: (item[1] != normalized, item[2]))
+        return [title for title, _, _ in found]
+
+    def copy(self):
+        """写者的副本：共用基础索引，只复制覆盖层"""
+        return LayeredTitleIndex(self.base, dict(self._added), set(self._removed), self._counter)
+
+    def compacted(self):
+        """覆盖层超过阈值时合并出新的基础索引，否则返回自身"""
+        if len(self._added) + len(self._removed) <= overlay_limit(len(self.base)):
+            return self
+        base = self.base.copy()
+        for title in self._removed:
+            base.remove(title)
+        for title, (normalized, _) in sorted(self._added.items(), key=lambda item: item[1][1]):
+            base.add(title, normalized)
+        return LayeredTitleIndex(base)
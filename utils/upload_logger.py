@@ -3,21 +3,111 @@ SQLite 日志管理模块
 记录文件上传历史，避免重复处理
 """
 import os
+import ast
+import json
+import random
 import sqlite3
-import hashlib
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from utils.file_hasher import FileHasher, quick_fingerprint, DEFAULT_ALGORITHM, DEFAULT_BUFFER_SIZE
+from utils.sqlite_pool import SQLiteConnectionPool
+
+
+# 元数据中可索引的字段：列名 -> (JSON 路径, 类型)
+METADATA_COLUMNS = {
+    'meta_source': ('$.source', 'TEXT'),
+    'meta_year': ('$.year', 'TEXT'),
+    'meta_category': ('$.category', 'TEXT'),
+    'meta_chunk_index': ('$.chunk_index', 'INTEGER'),
+}
+
+# 统计分组维度 -> SQL 表达式
+STAT_GROUPS = {
+    'day': "substr(upload_time, 1, 10)",
+    'month': "substr(upload_time, 1, 7)",
+    'status': "status",
+    'source': "meta_source",
+    'year': "meta_year",
+    'category': "meta_category",
+}
+
+
+def _metadata_to_json(metadata):
+    """元数据序列化为 JSON 文本"""
+    if not metadata:
+        return None
+    return json.dumps(metadata, ensure_ascii=False, default=str)
+
+
+def _legacy_metadata_to_json(text):
+    """旧版以 Python repr 保存的元数据转换为 JSON；无法解析时原样保存在 raw 字段"""
+    try:
+        json.loads(text)
+        return text
+    except ValueError:
+        pass
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        value = {'raw': text}
+    if not isinstance(value, dict):
+        value = {'raw': value}
+    return _metadata_to_json(value)
 
 
 class UploadLogger:
-    def __init__(self, db_path):
+    SCHEMA_VERSION = 1
+    
+    # 上传尝试历史表结构（主库与归档库共用）
+    ATTEMPT_COLUMNS = "file_hash, file_name, file_path, file_size, upload_time, dify_doc_id, status, metadata"
+    ATTEMPT_SCHEMA = """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT NOT NULL,
+        file_name TEXT NOT NULL,
+        file_path TEXT,
+        file_size INTEGER,
+        upload_time TEXT NOT NULL,
+        dify_doc_id TEXT,
+        status TEXT NOT NULL,
+        metadata TEXT
+    """
+    
+    def __init__(self, db_path, use_hash_cache=True, hash_algorithm=DEFAULT_ALGORITHM,
+                 hash_buffer_size=DEFAULT_BUFFER_SIZE, hash_use_mmap=False, hash_workers=4,
+                 use_prefilter=True, pooled=True, write_behind=False,
+                 flush_interval_ms=500, flush_batch_size=100):
         self.db_path = db_path
+        # pooled=False 时每次调用新建连接、使用默认回滚日志（旧版行为，用于对比测试）
+        self._db = SQLiteConnectionPool(db_path, persistent=pooled, wal=pooled)
+        self.use_hash_cache = use_hash_cache
+        self.use_prefilter = use_prefilter
+        self.hasher = FileHasher(hash_algorithm, hash_buffer_size, hash_use_mmap, hash_workers)
+        self.hash_algorithm = self.hasher.algorithm
         self._init_db()
+        self._legacy_hashers = self._load_legacy_hashers()
+        
+        # 延迟写入：记录先进入内存队列，由后台线程按时间/条数批量提交
+        self.write_behind = write_behind
+        self.flush_interval = max(10, flush_interval_ms) / 1000
+        self.flush_batch_size = max(1, flush_batch_size)
+        self._pending = []          # 待写入记录（按提交顺序）
+        self._pending_paths = {}    # file_path -> 最新一条待写入记录
+        self._pending_fps = {}      # quick_fp -> 待写入条数
+        self._pending_lock = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._closed = False
+        if write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name="ledger-flusher", daemon=True)
+            self._flusher.start()
     
     def _init_db(self):
         """初始化数据库表"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
+        with self._db.transaction() as conn:
+            self._create_schema(conn.cursor())
+    
+    def _create_schema(self, cur):
+        """建表、建索引及旧版结构升级"""
         # 创建上传日志表
         cur.execute("""
             CREATE TABLE IF NOT EXISTS upload_log (
@@ -29,7 +119,8 @@ class UploadLogger:
                 upload_time TEXT NOT NULL,
                 dify_doc_id TEXT,
                 status TEXT DEFAULT 'success',
-                metadata TEXT
+                metadata TEXT,
+                hash_algo TEXT DEFAULT 'md5'
             )
         """)
         
@@ -49,112 +140,511 @@ class UploadLogger:
             ON upload_log(dify_doc_id)
         """)
         
-        conn.commit()
-        conn.close()
+        # 文件哈希缓存表：(路径, 大小, mtime, inode) 未变化时直接复用哈希
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS file_hash_cache (
+                file_path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                file_hash TEXT NOT NULL,
+                cached_time TEXT NOT NULL,
+                hash_algo TEXT DEFAULT 'md5'
+            )
+        """)
+        
+        # 旧版数据库迁移：补充哈希算法列，已有记录均为 MD5
+        self._ensure_column(cur, 'upload_log', 'hash_algo', "TEXT DEFAULT 'md5'")
+        self._ensure_column(cur, 'file_hash_cache', 'hash_algo', "TEXT DEFAULT 'md5'")
+        
+        # 快速指纹（大小 + 首尾 64KB 哈希）列，用于完整哈希前的预筛
+        self._ensure_column(cur, 'upload_log', 'quick_fp', "TEXT")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_quick_fp 
+            ON upload_log(quick_fp)
+        """)
+        # 没有快速指纹的旧记录按文件大小预筛
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_legacy_size 
+            ON upload_log(file_size) WHERE quick_fp IS NULL
+        """)
+        
+        # 结构化元数据：旧记录的 Python repr 转为 JSON，再添加可索引的生成列
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            rows = cur.execute("SELECT id, metadata FROM upload_log WHERE metadata IS NOT NULL").fetchall()
+            cur.executemany(
+                "UPDATE upload_log SET metadata=? WHERE id=?",
+                [(_legacy_metadata_to_json(text), row_id) for row_id, text in rows]
+            )
+        for column, (path, sql_type) in METADATA_COLUMNS.items():
+            self._ensure_column(
+                cur, 'upload_log', column,
+                f"{sql_type} GENERATED ALWAYS AS (CASE WHEN json_valid(metadata) "
+                f"THEN CAST(json_extract(metadata, '{path}') AS {sql_type}) END) VIRTUAL"
+            )
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{column} ON upload_log({column})")
+        cur.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+        
+        # 分段上传明细：大 PDF 切分后每段的页码范围、OCR 结果与上传状态，用于断点续传
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS upload_chunks (
+                parent_hash TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                chunk_total INTEGER NOT NULL,
+                page_start INTEGER NOT NULL,
+                page_end INTEGER NOT NULL,
+                source_path TEXT,
+                ocr_path TEXT,
+                ocr_hash TEXT,
+                dify_doc_id TEXT,
+                status TEXT DEFAULT 'pending',
+                updated_time TEXT NOT NULL,
+                PRIMARY KEY (parent_hash, chunk_index)
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chunks_doc_id 
+            ON upload_chunks(dify_doc_id)
+        """)
+        
+        # 上传尝试历史：upload_log 每个文件只保留最新状态，每次尝试在此追加一条，
+        # 过期记录由 archive_old_records 移入归档库
+        cur.execute(f"CREATE TABLE IF NOT EXISTS upload_attempts ({self.ATTEMPT_SCHEMA})")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_attempts_time 
+            ON upload_attempts(upload_time)
+        """)
+        
+        # 索引进度：上传返回后文档在 Dify 排队索引，记录最终状态与排队→完成的耗时
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS indexing_status (
+                dify_doc_id TEXT PRIMARY KEY,
+                batch TEXT NOT NULL,
+                file_path TEXT,
+                status TEXT NOT NULL DEFAULT 'waiting',
+                queued_time TEXT NOT NULL,
+                completed_time TEXT,
+                latency_seconds REAL,
+                processing_seconds REAL,
+                error TEXT
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_indexing_pending 
+            ON indexing_status(batch) WHERE completed_time IS NULL
+        """)
+    
+    @staticmethod
+    def _ensure_column(cur, table, column, decl):
+        """列不存在时添加（用于旧版数据库结构升级）"""
+        columns = {row[1] for row in cur.execute(f"PRAGMA table_xinfo({table})")}
+        if column not in columns:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    
+    def _load_legacy_hashers(self):
+        """查找使用其他哈希算法记录的成功上传，用于兼容旧数据"""
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT hash_algo FROM upload_log WHERE status='success' AND hash_algo != ?",
+                (self.hash_algorithm,)
+            ).fetchall()
+        legacy = {}
+        for (algo,) in rows:
+            try:
+                legacy[algo] = FileHasher(algo, self.hasher.buffer_size, self.hasher.use_mmap)
+            except ValueError:
+                print(f"⚠️ 无法识别的历史哈希算法: {algo}")
+        return legacy
     
     def calculate_file_hash(self, file_path):
-        """计算文件的 MD5 哈希"""
+        """计算文件哈希（算法由 hash_algorithm 决定，默认 MD5）"""
         try:
-            hasher = hashlib.md5()
-            with open(file_path, 'rb') as f:
-                # 分块读取，避免大文件内存溢出
-                while chunk := f.read(8192):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            return self.hasher.hash_file(file_path)
         except Exception as e:
             print(f"⚠️ 计算文件哈希失败: {e}")
             return None
     
+    def get_file_hash(self, file_path):
+        """
+        获取文件哈希，优先使用缓存
+        
+        (路径, 大小, mtime_ns, inode) 与缓存一致时只需一次 stat，
+        否则重新计算并写回缓存
+        """
+        if not self.use_hash_cache:
+            return self.calculate_file_hash(file_path)
+        
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        key = (file_path, st.st_size, st.st_mtime_ns, st.st_ino)
+        
+        try:
+            with self._db.connect() as conn:
+                file_hash = self._lookup_cached_hash(conn, key)
+            if file_hash:
+                return file_hash
+            
+            file_hash = self.calculate_file_hash(file_path)
+            if file_hash:
+                with self._db.transaction() as conn:
+                    conn.execute("""
+                        INSERT OR REPLACE INTO file_hash_cache
+                        (file_path, file_size, mtime_ns, inode, file_hash, cached_time, hash_algo)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, key + (file_hash, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.hash_algorithm))
+            return file_hash
+        except sqlite3.Error as e:
+            print(f"⚠️ 读取哈希缓存失败: {e}")
+            return self.calculate_file_hash(file_path)
+    
+    def _lookup_cached_hash(self, conn, key):
+        row = conn.execute(
+            "SELECT file_hash FROM file_hash_cache "
+            "WHERE file_path=? AND file_size=? AND mtime_ns=? AND inode=? AND hash_algo=?",
+            key + (self.hash_algorithm,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def get_quick_fingerprint(self, file_path):
+        """计算快速指纹，失败返回 None"""
+        try:
+            return quick_fingerprint(file_path)
+        except OSError as e:
+            print(f"⚠️ 计算快速指纹失败: {e}")
+            return None
+    
+    def _may_be_uploaded(self, file_path):
+        """
+        预筛：快速指纹（或旧记录的文件大小）与任一成功记录冲突时才需要完整哈希
+        
+        Returns:
+            (是否可能已上传, 快速指纹)
+        """
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False, None
+        
+        with self._db.connect() as conn:
+            # 哈希缓存命中时直接走精确匹配，无需读取文件
+            if self.use_hash_cache and self._lookup_cached_hash(
+                    conn, (file_path, st.st_size, st.st_mtime_ns, st.st_ino)):
+                return True, None
+            
+            fp = self.get_quick_fingerprint(file_path)
+            if not fp:
+                return True, None
+            if conn.execute(
+                "SELECT 1 FROM upload_log WHERE quick_fp=? AND status='success' LIMIT 1", (fp,)
+            ).fetchone():
+                return True, fp
+            if conn.execute(
+                "SELECT 1 FROM upload_log WHERE quick_fp IS NULL AND file_size=? AND status='success' LIMIT 1",
+                (st.st_size,)
+            ).fetchone():
+                return True, fp
+            return False, fp
+    
+    def backfill_quick_fingerprints(self):
+        """
+        为缺少快速指纹的旧记录补算指纹（仅限源文件仍存在且大小未变的记录）
+        
+        Returns:
+            补算成功的记录数
+        """
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT id, file_path, file_size FROM upload_log WHERE quick_fp IS NULL"
+            ).fetchall()
+        updates = []
+        for row_id, file_path, file_size in rows:
+            try:
+                if not file_path or os.path.getsize(file_path) != file_size:
+                    continue
+            except OSError:
+                continue
+            fp = self.get_quick_fingerprint(file_path)
+            if fp:
+                updates.append((fp, row_id))
+        with self._db.transaction() as conn:
+            conn.executemany("UPDATE upload_log SET quick_fp=? WHERE id=?", updates)
+        return len(updates)
+    
+    def verify_hash_cache(self, sample_size=20):
+        """
+        抽样校验哈希缓存：随机选取若干条缓存重新计算哈希
+        
+        不一致或文件已不存在的条目会被删除（下次访问时重新计算）
+        
+        Returns:
+            {'checked': 抽样数, 'mismatched': 哈希不一致数, 'missing': 文件缺失数}
+        """
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT file_path, file_hash FROM file_hash_cache WHERE hash_algo=?",
+                (self.hash_algorithm,)
+            ).fetchall()
+        sample = random.sample(rows, min(sample_size, len(rows)))
+        current = self.hasher.hash_many(p for p, _ in sample)
+        
+        stale = []
+        mismatched = missing = 0
+        for file_path, cached_hash in sample:
+            if current.get(file_path) is None:
+                missing += 1
+                stale.append((file_path,))
+            elif current[file_path] != cached_hash:
+                mismatched += 1
+                stale.append((file_path,))
+        
+        if stale:
+            with self._db.transaction() as conn:
+                conn.executemany("DELETE FROM file_hash_cache WHERE file_path=?", stale)
+        return {'checked': len(sample), 'mismatched': mismatched, 'missing': missing}
+    
     def is_uploaded(self, file_path):
-        """检查文件是否已上传"""
-        file_hash = self.calculate_file_hash(file_path)
+        """
+        检查文件是否已上传
+        
+        先用快速指纹预筛，只有与已上传记录冲突时才计算完整哈希
+        """
+        if self.write_behind:
+            pending = self._check_pending(file_path)
+            if pending is not None:
+                return pending
+        
+        fp = None
+        if self.use_prefilter:
+            maybe, fp = self._may_be_uploaded(file_path)
+            if not maybe:
+                return False
+        
+        file_hash = self.get_file_hash(file_path)
         if not file_hash:
             return False
         
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
+        with self._db.connect() as conn:
+            result = conn.execute(
+                "SELECT quick_fp FROM upload_log WHERE file_hash = ? AND status = 'success'",
+                (file_hash,)
+            ).fetchone()
+        if result and fp and result[0] is None:
+            # 顺带为旧记录补上快速指纹
+            with self._db.transaction() as conn:
+                conn.execute("UPDATE upload_log SET quick_fp=? WHERE file_hash=? AND quick_fp IS NULL", (fp, file_hash))
         
-        cur.execute(
-            "SELECT 1 FROM upload_log WHERE file_hash = ? AND status = 'success'",
-            (file_hash,)
-        )
-        result = cur.fetchone()
-        conn.close()
+        if not result and self._legacy_hashers:
+            return self._match_legacy_hash(file_path, file_hash)
         
         return bool(result)
     
-    def log_upload(self, file_path, dify_doc_id=None, status='success', metadata=None):
-        """记录上传日志"""
-        file_hash = self.calculate_file_hash(file_path)
-        if not file_hash:
-            return False
+    def _match_legacy_hash(self, file_path, file_hash):
+        """用历史算法重新计算哈希匹配旧记录，命中后就地升级为当前算法"""
+        for algo, hasher in self._legacy_hashers.items():
+            try:
+                legacy_hash = hasher.hash_file(file_path)
+            except OSError:
+                return False
+            with self._db.connect() as conn:
+                row = conn.execute(
+                    "SELECT id FROM upload_log WHERE file_hash=? AND hash_algo=? AND status='success'",
+                    (legacy_hash, algo)
+                ).fetchone()
+            if row:
+                with self._db.transaction() as conn:
+                    conn.execute(
+                        "UPDATE OR IGNORE upload_log SET file_hash=?, hash_algo=? WHERE id=?",
+                        (file_hash, self.hash_algorithm, row[0])
+                    )
+                return True
+        return False
+    
+    def migrate_hash_algorithm(self):
+        """
+        将使用其他算法记录的哈希批量重算为当前算法（文件仍存在时）
         
-        try:
-            file_size = os.path.getsize(file_path)
-        except:
-            file_size = 0
+        Returns:
+            (迁移成功数, 文件缺失数)
+        """
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT id, file_path FROM upload_log WHERE hash_algo != ?",
+                (self.hash_algorithm,)
+            ).fetchall()
+        hashes = self.hasher.hash_many({p for _, p in rows if p})
+        
+        updates = [(hashes[p], self.hash_algorithm, row_id)
+                   for row_id, p in rows if p and hashes.get(p)]
+        with self._db.transaction() as conn:
+            conn.executemany("UPDATE OR IGNORE upload_log SET file_hash=?, hash_algo=? WHERE id=?", updates)
         
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
+        self._legacy_hashers = self._load_legacy_hashers()
+        return len(updates), len(rows) - len(updates)
+    
+    def log_upload(self, file_path, dify_doc_id=None, status='success', metadata=None):
+        """
+        记录上传日志（延迟写入模式下只入队，由后台线程批量提交）
+        
+        哈希与文件大小在调用时计算，之后文件被删除或替换也不影响入队的记录
+        """
+        upload_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        quick_fp = self.get_quick_fingerprint(file_path)
+        row = self._build_row(file_path, dify_doc_id, status, metadata, upload_time, quick_fp)
+        if not row:
+            print(f"⚠️ 无法计算文件哈希，未记录上传日志: {file_path}")
+            return False
+        if self.write_behind and not self._closed:
+            return self._enqueue({
+                'file_path': file_path,
+                'status': status,
+                'quick_fp': quick_fp,
+                'row': row,
+            })
         
         try:
-            cur.execute("""
-                INSERT OR REPLACE INTO upload_log 
-                (file_hash, file_name, file_path, file_size, upload_time, dify_doc_id, status, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                file_hash,
-                os.path.basename(file_path),
-                file_path,
-                file_size,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                dify_doc_id,
-                status,
-                str(metadata) if metadata else None
-            ))
-            conn.commit()
+            self._write_rows([row])
             return True
         except Exception as e:
             print(f"⚠️ 记录上传日志失败: {e}")
             return False
-        finally:
-            conn.close()
     
-    def get_upload_history(self, limit=100):
-        """获取上传历史"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT file_name, file_path, upload_time, status, dify_doc_id
-            FROM upload_log
-            ORDER BY upload_time DESC
-            LIMIT ?
-        """, (limit,))
+    def _build_row(self, file_path, dify_doc_id, status, metadata, upload_time, quick_fp):
+        file_hash = self.get_file_hash(file_path)
+        if not file_hash:
+            return None
         
-        results = cur.fetchall()
-        conn.close()
+        try:
+            file_size = os.path.getsize(file_path)
+        except:
+            file_size = 0
         
-        return results
+        return (
+            file_hash,
+            os.path.basename(file_path),
+            file_path,
+            file_size,
+            upload_time,
+            dify_doc_id,
+            status,
+            _metadata_to_json(metadata),
+            self.hash_algorithm,
+            quick_fp
+        )
     
-    def get_statistics(self):
-        """获取统计信息"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        # 总上传数
-        cur.execute("SELECT COUNT(*) FROM upload_log WHERE status='success'")
-        total_success = cur.fetchone()[0]
-        
-        # 失败数
-        cur.execute("SELECT COUNT(*) FROM upload_log WHERE status!='success'")
-        total_failed = cur.fetchone()[0]
+    def _write_rows(self, rows):
+        with self._db.transaction() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO upload_log 
+                (file_hash, file_name, file_path, file_size, upload_time, dify_doc_id, status, metadata, hash_algo, quick_fp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.executemany(
+                f"INSERT INTO upload_attempts ({self.ATTEMPT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [row[:8] for row in rows]
+            )
+    
+    # --- 延迟写入 ---
+    def _enqueue(self, record):
+        with self._pending_lock:
+            self._pending.append(record)
+            self._pending_paths[record['file_path']] = record
+            if record['quick_fp']:
+                self._pending_fps[record['quick_fp']] = self._pending_fps.get(record['quick_fp'], 0) + 1
+            if len(self._pending) >= self.flush_batch_size:
+                self._pending_lock.notify()
+        return True
+    
+    def _check_pending(self, file_path):
+        """
+        读己之写：文件本身或相同内容的文件尚在队列中时给出结论
         
-        # 总文件大小
-        cur.execute("SELECT SUM(file_size) FROM upload_log WHERE status='success'")
-        total_size = cur.fetchone()[0] or 0
+        Returns:
+            True/False 表示已由待写入记录确定结果；None 表示需查询数据库
+        """
+        with self._pending_lock:
+            if not self._pending:
+                return None
+            record = self._pending_paths.get(file_path)
+            if record is not None:
+                return record['status'] == 'success'
+            pending_fps = set(self._pending_fps)
+        if self.get_quick_fingerprint(file_path) in pending_fps:
+            # 相同指纹的记录尚未落库，先同步写入再走正常查询
+            self.flush()
+        return None
+    
+    def _flush_loop(self):
+        while True:
+            with self._pending_lock:
+                if not self._closed and len(self._pending) < self.flush_batch_size:
+                    self._pending_lock.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                break
+    
+    def flush(self):
+        """
+        立即把队列中的记录批量写入数据库
         
-        conn.close()
+        Returns:
+            写入的记录数
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+            
+            rows = [record['row'] for record in batch]
+            try:
+                self._write_rows(rows)
+            except Exception as e:
+                print(f"⚠️ 批量写入上传日志失败: {e}")
+                return 0
+            
+            with self._pending_lock:
+                del self._pending[:len(batch)]
+                for record in batch:
+                    path = record['file_path']
+                    if self._pending_paths.get(path) is record:
+                        del self._pending_paths[path]
+                    fp = record['quick_fp']
+                    if fp and fp in self._pending_fps:
+                        self._pending_fps[fp] -= 1
+                        if self._pending_fps[fp] <= 0:
+                            del self._pending_fps[fp]
+            return len(rows)
+    
+    def _sync_reads(self):
+        """批量查询/删除前先落库，保证读到自己的写入"""
+        if self.write_behind:
+            self.flush()
+    
+    def get_upload_history(self, limit=100):
+        """获取上传历史"""
+        self._sync_reads()
+        with self._db.connect() as conn:
+            return conn.execute("""
+                SELECT file_name, file_path, upload_time, status, dify_doc_id
+                FROM upload_log
+                ORDER BY upload_time DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+    
+    def get_statistics(self):
+        """获取统计信息（单次扫描）"""
+        self._sync_reads()
+        with self._db.connect() as conn:
+            total_success, total_failed, total_size = conn.execute("""
+                SELECT COALESCE(SUM(status = 'success'), 0),
+                       COALESCE(SUM(status != 'success'), 0),
+                       COALESCE(SUM(CASE WHEN status = 'success' THEN file_size END), 0)
+                FROM upload_log
+            """).fetchone()
         
         return {
             'total_success': total_success,
@@ -162,82 +652,494 @@ class UploadLogger:
             'total_size_mb': round(total_size / 1024 / 1024, 2)
         }
     
+    def get_grouped_statistics(self, group_by=('day', 'status'), since=None):
+        """
+        分组统计（单条聚合查询）
+        
+        Args:
+            group_by: 分组维度，可选 day / month / status / source / year / category
+            since: 只统计该时间（'YYYY-MM-DD'）之后的记录
+        
+        Returns:
+            [{维度...: 值, 'count': 数量, 'total_size_mb': 总大小}, ...]
+        """
+        unknown = [g for g in group_by if g not in STAT_GROUPS]
+        if unknown:
+            raise ValueError(f"不支持的分组维度: {unknown}")
+        
+        self._sync_reads()
+        select = ", ".join(f"{STAT_GROUPS[g]} AS {g}" for g in group_by)
+        sql = f"SELECT {select}, COUNT(*), COALESCE(SUM(file_size), 0) FROM upload_log"
+        params = ()
+        if since:
+            sql += " WHERE upload_time >= ?"
+            params = (since,)
+        sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+        
+        with self._db.connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        n = len(group_by)
+        return [dict(zip(group_by, row[:n]), count=row[n], total_size_mb=round(row[n + 1] / 1024 / 1024, 2))
+                for row in rows]
+    
+    def find_uploads(self, source=None, year=None, category=None, status=None, limit=100):
+        """按元数据字段筛选上传记录（走生成列索引）"""
+        self._sync_reads()
+        conditions, params = [], []
+        for column, value in (('meta_source', source), ('meta_year', year),
+                              ('meta_category', category), ('status', status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        sql = "SELECT file_name, file_path, upload_time, status, dify_doc_id, metadata FROM upload_log"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY upload_time DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._db.connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [
+            {'file_name': r[0], 'file_path': r[1], 'upload_time': r[2], 'status': r[3],
+             'dify_doc_id': r[4], 'metadata': json.loads(r[5]) if r[5] else None}
+            for r in rows
+        ]
+    
     def delete_by_dify_doc_id(self, doc_id):
         """根据 Dify 文档 ID 删除日志记录"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        try:
-            cur.execute("DELETE FROM upload_log WHERE dify_doc_id=?", (doc_id,))
-            conn.commit()
-            return cur.rowcount > 0
-        except Exception as e:
-            print(f"⚠️ 删除日志记录失败: {e}")
-            return False
-        finally:
-            conn.close()
+        return self.delete_by_dify_doc_ids([doc_id]) > 0
     
     def delete_by_file_path(self, file_path):
         """根据文件路径删除日志记录"""
-        file_hash = self.calculate_file_hash(file_path)
+        self._sync_reads()
+        file_hash = self.get_file_hash(file_path)
         if not file_hash:
             return False
         
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
         try:
-            cur.execute("DELETE FROM upload_log WHERE file_hash=?", (file_hash,))
-            conn.commit()
+            with self._db.transaction() as conn:
+                cur = conn.execute("DELETE FROM upload_log WHERE file_hash=?", (file_hash,))
             return cur.rowcount > 0
         except Exception as e:
             print(f"⚠️ 删除日志记录失败: {e}")
             return False
-        finally:
-            conn.close()
     
     def get_all_dify_doc_ids(self):
         """获取所有已记录的 Dify 文档 ID"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
+        self._sync_reads()
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT dify_doc_id FROM upload_log WHERE dify_doc_id IS NOT NULL AND status='success'"
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    # --- 分段上传明细 ---
+    CHUNK_FIELDS = ('ocr_path', 'ocr_hash', 'dify_doc_id', 'status')
+    
+    def get_chunks(self, parent_hash):
+        """获取某个源文件的全部分段记录（按序号排列）"""
+        with self._db.connect() as conn:
+            cur = conn.execute("""
+                SELECT chunk_index, chunk_total, page_start, page_end, source_path,
+                       ocr_path, ocr_hash, dify_doc_id, status
+                FROM upload_chunks WHERE parent_hash=? ORDER BY chunk_index
+            """, (parent_hash,))
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+    
+    def reset_chunk_plan(self, parent_hash, source_path, page_ranges):
+        """
+        记录新的分段计划（清除旧记录）
         
-        cur.execute("SELECT dify_doc_id FROM upload_log WHERE dify_doc_id IS NOT NULL AND status='success'")
-        results = [row[0] for row in cur.fetchall()]
-        conn.close()
+        Args:
+            parent_hash: 源文件哈希
+            source_path: 源文件路径
+            page_ranges: [(起始页, 结束页), ...]，页码从 0 开始，结束页不含
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        total = len(page_ranges)
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM upload_chunks WHERE parent_hash=?", (parent_hash,))
+            conn.executemany("""
+                INSERT INTO upload_chunks
+                (parent_hash, chunk_index, chunk_total, page_start, page_end, source_path, status, updated_time)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)
+            """, [(parent_hash, idx, total, start, end, source_path, now)
+                  for idx, (start, end) in enumerate(page_ranges, 1)])
+    
+    def update_chunk(self, parent_hash, chunk_index, **fields):
+        """更新分段状态，可更新字段见 CHUNK_FIELDS"""
+        fields = {k: v for k, v in fields.items() if k in self.CHUNK_FIELDS}
+        if not fields:
+            return False
+        assignments = ", ".join(f"{k}=?" for k in fields)
+        with self._db.transaction() as conn:
+            cur = conn.execute(
+                f"UPDATE upload_chunks SET {assignments}, updated_time=? WHERE parent_hash=? AND chunk_index=?",
+                tuple(fields.values()) + (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), parent_hash, chunk_index)
+            )
+        return cur.rowcount > 0
+    
+    def mark_chunk_uploaded(self, parent_hash, chunk_index, dify_doc_id):
+        """
+        记录分段上传成功，并判断源文件是否因此全部完成
+        
+        更新与检查在同一个写事务内完成：多个线程同时上传最后几个分段时，
+        只有把最后一个分段从未上传改为已上传的调用返回完成
         
-        return results
+        Returns:
+            全部完成时返回最后一个分段的 Dify 文档 ID（作为源文件记录的文档 ID），否则返回 None
+        """
+        with self._db.transaction() as conn:
+            cur = conn.execute(
+                "UPDATE upload_chunks SET status='uploaded', dify_doc_id=?, updated_time=? "
+                "WHERE parent_hash=? AND chunk_index=? AND status != 'uploaded'",
+                (dify_doc_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), parent_hash, chunk_index)
+            )
+            if cur.rowcount == 0:
+                return None
+            total, pending = conn.execute(
+                "SELECT COUNT(*), SUM(status != 'uploaded') FROM upload_chunks WHERE parent_hash=?",
+                (parent_hash,)
+            ).fetchone()
+            if not total or pending:
+                return None
+            return self._last_chunk_doc_id(conn, parent_hash)
     
-    def sync_with_dify(self, existing_doc_ids):
+    def get_last_chunk_doc_id(self, parent_hash):
+        """最后一个分段的 Dify 文档 ID"""
+        with self._db.connect() as conn:
+            return self._last_chunk_doc_id(conn, parent_hash)
+    
+    @staticmethod
+    def _last_chunk_doc_id(conn, parent_hash):
+        row = conn.execute(
+            "SELECT dify_doc_id FROM upload_chunks WHERE parent_hash=? ORDER BY chunk_index DESC LIMIT 1",
+            (parent_hash,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def is_chunk_upload_complete(self, parent_hash):
+        """所有分段均已上传成功"""
+        with self._db.connect() as conn:
+            total, pending = conn.execute(
+                "SELECT COUNT(*), SUM(status != 'uploaded') FROM upload_chunks WHERE parent_hash=?",
+                (parent_hash,)
+            ).fetchone()
+        return total > 0 and not pending
+    
+    # --- 索引进度 ---
+    def track_indexing(self, doc_id, batch, file_path=None, queued_at=None):
         """
-        与 Dify 同步，删除在日志中但不在 Dify 中的记录
+        记录一个等待 Dify 索引的文档
         
         Args:
-            existing_doc_ids: Dify 中实际存在的文档 ID 列表
+            doc_id: Dify 文档 ID
+            batch: 上传接口返回的批次号
+            file_path: 上传的文件
+            queued_at: 上传返回的时间（epoch 秒），默认当前时间
+        """
+        queued_time = datetime.fromtimestamp(queued_at) if queued_at else datetime.now()
+        with self._db.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO indexing_status (dify_doc_id, batch, file_path, status, queued_time)
+                VALUES (?, ?, ?, 'waiting', ?)
+            """, (doc_id, batch, file_path, queued_time.strftime('%Y-%m-%d %H:%M:%S')))
+    
+    def get_pending_indexing(self):
+        """
+        尚未完成索引的文档（重启后继续跟踪）
         
         Returns:
-            删除的记录数
+            [(doc_id, batch, file_path, queued_at epoch 秒), ...]
+        """
+        with self._db.connect() as conn:
+            rows = conn.execute("""
+                SELECT dify_doc_id, batch, file_path, queued_time FROM indexing_status
+                WHERE completed_time IS NULL
+            """).fetchall()
+        return [(doc_id, batch, path, datetime.strptime(queued, '%Y-%m-%d %H:%M:%S').timestamp())
+                for doc_id, batch, path, queued in rows]
+    
+    def update_indexing_status(self, results):
         """
-        local_doc_ids = self.get_all_dify_doc_ids()
-        to_delete = set(local_doc_ids) - set(existing_doc_ids)
+        批量写入索引结果（单个事务）
         
-        if not to_delete:
+        Args:
+            results: [(doc_id, 状态, 完成时间 epoch 秒, 排队→完成耗时, Dify 处理耗时, 错误信息), ...]
+                     完成时间为 None 表示仍在处理中，只更新状态
+        """
+        rows = [
+            (status,
+             datetime.fromtimestamp(completed_at).strftime('%Y-%m-%d %H:%M:%S') if completed_at else None,
+             latency, processing, error, doc_id)
+            for doc_id, status, completed_at, latency, processing, error in results
+        ]
+        if not rows:
             return 0
+        with self._db.transaction() as conn:
+            conn.executemany("""
+                UPDATE indexing_status
+                SET status=?, completed_time=?, latency_seconds=?, processing_seconds=?, error=?
+                WHERE dify_doc_id=?
+            """, rows)
+        return len(rows)
+    
+    def get_indexing_statistics(self, since=None):
+        """
+        索引结果统计
         
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
+        Args:
+            since: 只统计该时间（'YYYY-mm-dd HH:MM:SS'）之后上传的文档
+        
+        Returns:
+            {'by_status': {状态: 数量}, 'avg_latency': 秒, 'max_latency': 秒, 'avg_processing': 秒}
+        """
+        where, params = ("WHERE queued_time >= ?", (since,)) if since else ("", ())
+        with self._db.connect() as conn:
+            by_status = dict(conn.execute(
+                f"SELECT status, COUNT(*) FROM indexing_status {where} GROUP BY status", params
+            ).fetchall())
+            avg_latency, max_latency, avg_processing = conn.execute(f"""
+                SELECT AVG(latency_seconds), MAX(latency_seconds), AVG(processing_seconds)
+                FROM indexing_status {where} {'AND' if where else 'WHERE'} status='completed'
+            """, params).fetchone()
+        return {
+            'by_status': by_status,
+            'avg_latency': round(avg_latency or 0, 1),
+            'max_latency': round(max_latency or 0, 1),
+            'avg_processing': round(avg_processing or 0, 1),
+        }
+    
+    @staticmethod
+    def _reopen_chunks(conn, where_sql):
+        """
+        Dify 中的分段文档被删除时：分段退回待上传（保留 OCR 结果），
+        并删除源文件的整体成功记录，下次处理时只补传缺失分段
+        """
+        conn.execute(f"""
+            DELETE FROM upload_log WHERE file_hash IN (
+                SELECT parent_hash FROM upload_chunks WHERE dify_doc_id IS NOT NULL AND {where_sql}
+            )
+        """)
+        conn.execute(f"""
+            UPDATE upload_chunks SET status='pending', dify_doc_id=NULL
+            WHERE dify_doc_id IS NOT NULL AND {where_sql}
+        """)
+    
+    def sync_with_dify(self, existing_doc_ids):
+        """
+        与 Dify 同步，删除在日志中但不在 Dify 中的记录（含索引进度记录）
         
-        deleted_count = 0
+        Dify 的文档 ID 批量写入临时表，在同一事务内用反连接一次删除
+        
+        Args:
+            existing_doc_ids: Dify 中实际存在的文档 ID 列表
+        
+        Returns:
+            删除的记录数
+        """
+        self._sync_reads()
         try:
-            for doc_id in to_delete:
-                cur.execute("DELETE FROM upload_log WHERE dify_doc_id=?", (doc_id,))
-                deleted_count += cur.rowcount
-            conn.commit()
+            with self._db.transaction() as conn:
+                self._load_temp_ids(conn, existing_doc_ids)
+                cur = conn.execute("""
+                    DELETE FROM upload_log
+                    WHERE dify_doc_id IS NOT NULL
+                      AND dify_doc_id NOT IN (SELECT doc_id FROM temp.doc_id_batch)
+                """)
+                deleted = cur.rowcount
+                conn.execute("""
+                    DELETE FROM indexing_status
+                    WHERE dify_doc_id NOT IN (SELECT doc_id FROM temp.doc_id_batch)
+                """)
+                self._reopen_chunks(conn, "dify_doc_id NOT IN (SELECT doc_id FROM temp.doc_id_batch)")
+                return deleted
         except Exception as e:
             print(f"⚠️ 同步删除失败: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            return 0
+    
+    def get_stale_dify_doc_ids(self, existing_doc_ids):
+        """返回日志中有、但 Dify 中已不存在的文档 ID（sync_with_dify 的预览）"""
+        self._sync_reads()
+        with self._db.transaction() as conn:
+            self._load_temp_ids(conn, existing_doc_ids)
+            rows = conn.execute("""
+                SELECT DISTINCT dify_doc_id FROM upload_log
+                WHERE dify_doc_id IS NOT NULL AND status='success'
+                  AND dify_doc_id NOT IN (SELECT doc_id FROM temp.doc_id_batch)
+            """).fetchall()
+        return [row[0] for row in rows]
+    
+    def delete_by_dify_doc_ids(self, doc_ids):
+        """
+        根据 Dify 文档 ID 批量删除日志记录（单个事务）
         
-        return deleted_count
+        Returns:
+            删除的记录数
+        """
+        if not doc_ids:
+            return 0
+        self._sync_reads()
+        try:
+            with self._db.transaction() as conn:
+                self._load_temp_ids(conn, doc_ids)
+                cur = conn.execute(
+                    "DELETE FROM upload_log WHERE dify_doc_id IN (SELECT doc_id FROM temp.doc_id_batch)"
+                )
+                deleted = cur.rowcount
+                conn.execute(
+                    "DELETE FROM indexing_status WHERE dify_doc_id IN (SELECT doc_id FROM temp.doc_id_batch)"
+                )
+                self._reopen_chunks(conn, "dify_doc_id IN (SELECT doc_id FROM temp.doc_id_batch)")
+                return deleted
+        except Exception as e:
+            print(f"⚠️ 批量删除日志记录失败: {e}")
+            return 0
+    
+    @staticmethod
+    def _load_temp_ids(conn, doc_ids):
+        """将文档 ID 批量写入当前连接的临时表"""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS doc_id_batch (doc_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.doc_id_batch")
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp.doc_id_batch (doc_id) VALUES (?)",
+            ((doc_id,) for doc_id in doc_ids)
+        )
+    
+    # --- 保留期与归档 ---
+    def default_archive_path(self):
+        """默认归档库路径：与主库同目录的 <名称>_archive.db"""
+        root, ext = os.path.splitext(self.db_path)
+        return f"{root}_archive{ext or '.db'}"
+    
+    def archive_old_records(self, retention_days, archive_path=None):
+        """
+        将超过保留期的上传尝试历史和失败记录移入归档库（ATTACH 的独立 SQLite 文件）
+        
+        成功记录用于去重，始终保留在主表；归档表以 (文件哈希, 时间, 状态) 去重，
+        中途中断后重复执行不会产生重复记录
+        
+        Returns:
+            {'attempts': 归档的尝试记录数, 'failed': 归档的失败记录数, 'archive_path': 归档库路径}
+        """
+        self._sync_reads()
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        archive_path = archive_path or self.default_archive_path()
+        columns = self.ATTEMPT_COLUMNS
+        
+        with self._db.exclusive() as conn:
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(f"""
+                        CREATE TABLE IF NOT EXISTS archive.upload_attempts (
+                            {self.ATTEMPT_SCHEMA},
+                            UNIQUE (file_hash, upload_time, status)
+                        )
+                    """)
+                    conn.execute("""
+                        CREATE INDEX IF NOT EXISTS archive.idx_archive_time 
+                        ON upload_attempts(upload_time)
+                    """)
+                    conn.execute(f"""
+                        INSERT OR IGNORE INTO archive.upload_attempts ({columns})
+                        SELECT {columns} FROM main.upload_attempts WHERE upload_time < ?
+                    """, (cutoff,))
+                    attempts = conn.execute(
+                        "DELETE FROM main.upload_attempts WHERE upload_time < ?", (cutoff,)
+                    ).rowcount
+                    # 失败记录不参与去重，过期后同样移出主表（旧版数据只有这一份记录）
+                    conn.execute(f"""
+                        INSERT OR IGNORE INTO archive.upload_attempts ({columns})
+                        SELECT {columns} FROM main.upload_log WHERE status != 'success' AND upload_time < ?
+                    """, (cutoff,))
+                    failed = conn.execute(
+                        "DELETE FROM main.upload_log WHERE status != 'success' AND upload_time < ?", (cutoff,)
+                    ).rowcount
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE archive")
+        return {'attempts': attempts, 'failed': failed, 'archive_path': archive_path}
+    
+    def prune_hash_cache(self, retention_days):
+        """
+        删除超过保留期且源文件已不存在的哈希缓存
+        
+        Returns:
+            删除的条数
+        """
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT file_path FROM file_hash_cache WHERE cached_time < ?", (cutoff,)
+            ).fetchall()
+        missing = [(p,) for (p,) in rows if not os.path.exists(p)]
+        if missing:
+            with self._db.transaction() as conn:
+                conn.executemany("DELETE FROM file_hash_cache WHERE file_path=?", missing)
+        return len(missing)
+    
+    def run_maintenance(self, retention_days=180, archive_path=None, vacuum_pages=0, full_vacuum=False):
+        """
+        账本维护：归档过期记录、清理失效哈希缓存、为旧记录补算快速指纹、回收空闲页并更新查询规划统计
+        
+        Args:
+            retention_days: 尝试历史与失败记录在主库中的保留天数
+            archive_path: 归档库路径（默认见 default_archive_path）
+            vacuum_pages: 每次增量回收的页数（0=全部空闲页）
+            full_vacuum: 执行完整 VACUUM（重建表和索引，耗时较长、期间阻塞写入）
+        
+        Returns:
+            各步骤结果的字典
+        """
+        result = self.archive_old_records(retention_days, archive_path)
+        result['hash_cache'] = self.prune_hash_cache(retention_days)
+        result['quick_fp'] = self.backfill_quick_fingerprints()
+        
+        with self._db.exclusive() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if full_vacuum or auto_vacuum != 2:
+                # auto_vacuum 模式只能在 VACUUM 时切换，首次维护需完整重建一次
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                result['vacuum'] = 'full'
+            else:
+                # incremental_vacuum 每一步释放一页，需取完全部结果
+                conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+                result['vacuum'] = 'incremental'
+            conn.execute("PRAGMA analysis_limit=1000")
+            conn.execute("ANALYZE")
+            pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        
+        result['size_before_mb'] = round(pages_before * page_size / 1024 / 1024, 2)
+        result['size_after_mb'] = round(pages_after * page_size / 1024 / 1024, 2)
+        return result
     
     def mark_failed(self, file_path, error_msg=None):
         """标记上传失败"""
         return self.log_upload(file_path, status='failed', metadata={'error': error_msg})
+    
+    def close(self):
+        """停止后台写入线程，落盘所有待写记录并关闭数据库连接"""
+        if self._flusher:
+            with self._pending_lock:
+                self._closed = True
+                self._pending_lock.notify()
+            self._flusher.join()
+            self._flusher = None
+        self._closed = True
+        self.flush()
+        try:
+            with self._db.connect() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
+        self._db.close_all()